@@ -20,7 +20,6 @@ from optparse import OptionParser, OptionGroup, Option, OptionValueError
 from ConfigParser import SafeConfigParser, NoSectionError
 from copy import copy
 import os.path
-import tempfile
 
 try:
     from gbp.version import gbp_version
@@ -163,6 +162,10 @@ class GbpOptionParser(OptionParser):
                  'drop': 'False',
                  'commit': 'False',
                  'tmp-dir' : '/var/tmp/gbp/',
+                 'cache-dir': '',
+                 'cache-keep': '0',
+                 'cache-max-age': '0',
+                 'commit-graph': 'True',
              }
     help = {
              'debian-branch':
@@ -318,6 +321,20 @@ class GbpOptionParser(OptionParser):
               'tmp-dir':
                   ("Base directory under which temporary directories are "
                    "created, default is '%(tmp-dir)s'"),
+              'cache-dir':
+                  ("Directory to keep mirrors of remote repositories in that "
+                   "clones borrow objects from, default is '%(cache-dir)s'"),
+              'cache-keep':
+                  ("Number of mirrors to keep when pruning the cache, 0 "
+                   "for no limit, default is '%(cache-keep)s'"),
+              'cache-max-age':
+                  ("Remove mirrors not used for that many days when pruning "
+                   "the cache, 0 for no limit, default is "
+                   "'%(cache-max-age)s'"),
+              'commit-graph':
+                  ("Write a commit-graph with changed-path Bloom filters "
+                   "after bulk imports and large pulls to speed up history "
+                   "walks, default is '%(commit-graph)s'"),
            }
 
     def_config_files = [ '/etc/git-buildpackage/gbp.conf',
@@ -361,51 +378,134 @@ class GbpOptionParser(OptionParser):
             files = [fname for fname in files if fname.startswith('/')]
         return files
 
-    def _read_config_file(self, parser, repo, filename, git_treeish):
-        """Read config file"""
+    # Merged config files, see L{_config_files_key}
+    _parsed_configs = {}
+    # Repositories found by working directory
+    _repos = {}
+
+    @classmethod
+    def _get_repo(klass):
+        """The repository of the current directory, C{None} if there's none"""
+        cwd = os.path.abspath(os.path.curdir)
+        if cwd not in klass._repos:
+            try:
+                klass._repos[cwd] = GitRepository(cwd)
+            except GitRepositoryError:
+                return None
+        return klass._repos[cwd]
+
+    @staticmethod
+    def _expand_config_files(filenames, repo, git_treeish):
+        """
+        Expand the names of the config files
+
+        @return: the config files to read from disk as C{(None, filename)}
+            and the ones to read from I{git_treeish} as
+            C{(path, None)} with the path relative to the top dir
+        @rtype: C{list} of C{tuple}
+        """
         str_fields = {}
         if repo:
             str_fields['git_dir'] = repo.git_dir
             if not repo.bare:
                 str_fields['top_dir'] = repo.path
 
-        # Read per-tree config file
-        if repo and git_treeish and filename.startswith('%(top_dir)s/'):
-            with tempfile.TemporaryFile() as tmp:
-                relpath = filename.replace('%(top_dir)s/', '')
-                try:
-                    config = repo.show('%s:%s' % (git_treeish, relpath))
-                    tmp.writelines(config)
-                except GitRepositoryError:
-                    pass
-                tmp.seek(0)
-                parser.readfp(tmp)
-                return
+        expanded = []
+        for filename in filenames:
+            # Per-tree config file
+            if repo and git_treeish and filename.startswith('%(top_dir)s/'):
+                expanded.append((filename.replace('%(top_dir)s/', ''), None))
+                continue
+            try:
+                expanded.append((None, filename % str_fields))
+            except KeyError:
+                # Skip if filename wasn't expanded, i.e. we're not in git repo
+                pass
+        return expanded
+
+    @staticmethod
+    def _config_files_key(config_files, blobs):
+        """
+        Identify the content of the config files by the modification times
+        of the files on disk and by the blobs of the per-tree files
+        """
+        key = []
+        blobs = iter(blobs)
+        for relpath, filename in config_files:
+            if relpath is not None:
+                blob = next(blobs)
+                key.append((relpath, blob[0] if blob else None))
+                continue
+            try:
+                stat = os.stat(filename)
+                key.append((filename, stat.st_mtime, stat.st_size))
+            except OSError:
+                key.append((filename, None))
+        return tuple(key)
+
+    @classmethod
+    def _read_config_files(klass, filenames, repo, git_treeish):
+        """
+        Read and merge the config files. The per-tree config files are read
+        at once and the result is cached for as long as the files are
+        unchanged.
+
+        @rtype: C{SafeConfigParser}
+        """
+        config_files = klass._expand_config_files(filenames, repo,
+                                                  git_treeish)
+        tree_files = ['%s:%s' % (git_treeish, relpath)
+                      for relpath, dummy in config_files if relpath]
         try:
-            filename = filename % str_fields
-        except KeyError:
-            # Skip if filename wasn't expanded, i.e. we're not in git repo
-            return
-        parser.read(filename)
+            blobs = repo.batch_read_objects(tree_files) if tree_files else []
+        except GitRepositoryError:
+            blobs = [None] * len(tree_files)
+        key = klass._config_files_key(config_files, blobs)
+        if key in klass._parsed_configs:
+            return klass._parsed_configs[key]
+
+        parser = SafeConfigParser()
+        blobs = iter(blobs)
+        for relpath, filename in config_files:
+            if relpath is None:
+                parser.read(filename)
+                continue
+            blob = next(blobs)
+            if blob and blob[1] == 'blob':
+                from StringIO import StringIO
+                parser.readfp(StringIO(blob[2]), relpath)
+        klass._parsed_configs[key] = parser
+        return parser
+
+    @classmethod
+    def preload_config_files(klass, repo):
+        """
+        Parse the config files of I{repo} so parsers created later on, e.g.
+        in processes forked off a long running one, find them parsed already
+        """
+        klass._read_config_files(klass.get_config_files(), repo, None)
 
-    def parse_config_files(self, git_treeish=None):
+    def parse_config_files(self, git_treeish=None, repo=None):
         """
         Parse the possible config files and set appropriate values
         default values
+
+        @param git_treeish: read the per-tree config files from this
+            treeish instead of the working copy
+        @type git_treeish: C{str}
+        @param repo: the repository of the current directory, looked up if
+            not given
+        @type repo: L{GitRepository}
         """
-        parser = SafeConfigParser()
         # Fill in the built in values
         self.config = dict(self.__class__.defaults)
         # Update with the values from the defaults section. This is needed
         # in case the config file doesn't have a [<command>] section at all
         config_files = self.get_config_files()
-        try:
-            repo = GitRepository(".")
-        except GitRepositoryError:
-            repo = None
+        if repo is None:
+            repo = self._get_repo()
         # Read all config files
-        for filename in config_files:
-            self._read_config_file(parser, repo, filename, git_treeish)
+        parser = self._read_config_files(config_files, repo, git_treeish)
         self.config.update(dict(parser.defaults()))
 
         # Make sure we read any legacy sections prior to the real subcommands
@@ -446,7 +546,7 @@ class GbpOptionParser(OptionParser):
             self.config['filter'] = []
 
     def __init__(self, command, prefix='', usage=None, sections=[],
-                 git_treeish=None):
+                 git_treeish=None, repo=None):
         """
         @param command: the command to build the config parser for
         @type command: C{str}
@@ -457,12 +557,17 @@ class GbpOptionParser(OptionParser):
         @param sections: additional (non optional) config file sections
             to parse
         @type sections: C{list} of C{str}
+        @param git_treeish: read the per-tree config files from this treeish
+        @type git_treeish: C{str}
+        @param repo: the repository of the current directory, looked up if
+            not given
+        @type repo: L{GitRepository}
         """
         self.command = command
         self.sections = sections
         self.prefix = prefix
         self.config = {}
-        self.parse_config_files(git_treeish)
+        self.parse_config_files(git_treeish, repo)
         self.valid_options = []
 
         if self.command.startswith('git-') or self.command.startswith('gbp-'):
@@ -46,22 +46,49 @@ class DebianGitRepository(GitRepository):
         @return: sha1 of the commit the tag references to
         @rtype: C{str}
         """
-        tag = self.version_to_tag(format, version)
-        legacy_tag = self._build_legacy_tag(format, version)
-        if self.has_tag(tag): # new tags are injective
-            # dereference to a commit object
-            return self.rev_parse("%s^0" % tag)
-        elif self.has_tag(legacy_tag):
-            out, ret = self._git_getoutput('cat-file', args=['-p', legacy_tag])
-            if ret:
-                return None
-            for line in out:
-                if line.endswith(" %s\n" % version):
-                    # dereference to a commit object
-                    return self.rev_parse("%s^0" % legacy_tag)
-                elif line.startswith('---'): # GPG signature start
-                    return None
-        return None
+        return self.find_versions(format, [version]).get(version)
+
+    @staticmethod
+    def _has_version_in_message(msg, version):
+        """
+        Check if a legacy tag's message mentions I{version}
+
+        >>> DebianGitRepository._has_version_in_message('Debian release 1.0-1\\n', '1.0-1')
+        True
+        >>> DebianGitRepository._has_version_in_message('Debian release 1.0-1\\n', '1.0-10')
+        False
+        """
+        for line in msg.splitlines():
+            if line.endswith(" %s" % version):
+                return True
+            elif line.startswith('---'): # GPG signature start
+                return False
+        return False
+
+    def find_versions(self, format, versions):
+        """
+        Check which of several versions are stored in this repo, like
+        L{find_version} does
+
+        @param format: tag pattern
+        @type format: C{str}
+        @param versions: debian version numbers
+        @type versions: C{list} of C{str}
+        @return: sha1 of the commit the tag references to for each version
+            found
+        @rtype: C{dict}
+        """
+        tags = self.get_tag_index()
+        found = {}
+        for version in versions:
+            tag = self.version_to_tag(format, version)
+            legacy_tag = self._build_legacy_tag(format, version)
+            if tag in tags: # new tags are injective
+                found[version] = self.get_tag_commit(tag)
+            elif (legacy_tag in tags and
+                  self._has_version_in_message(tags[legacy_tag][2], version)):
+                found[version] = self.get_tag_commit(legacy_tag)
+        return found
 
     def debian_version_from_upstream(self, upstream_tag_format, commit='HEAD',
                                      epoch=None):
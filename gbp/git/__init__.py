@@ -18,7 +18,6 @@
 
 import calendar
 import datetime
-import rfc822
 
 from gbp.git.modifier import GitModifier
 from gbp.git.commit import GitCommit
@@ -56,6 +55,7 @@ def rfc822_date_to_git(rfc822_date):
     >>> rfc822_date_to_git('Sat, 5 Apr 2008 17:01:32 +0200')
     '1207407692 +0200'
     """
+    import rfc822
     parsed = rfc822.parsedate_tz(rfc822_date)
     date = datetime.datetime(*parsed[:6], tzinfo=FixedOffset(parsed[-1]))
     seconds = calendar.timegm(date.utctimetuple())
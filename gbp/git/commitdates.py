@@ -0,0 +1,49 @@
+# vim: set fileencoding=utf-8 :
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""Index of commit dates in the history of a git ref"""
+
+from gbp.git.refindex import RefIndex
+from gbp.git.repository import GitRepositoryError
+
+
+class CommitDateIndex(RefIndex):
+    """Committer dates of all the commits reachable from a ref"""
+    name = 'commit-dates'
+
+    def _scan(self, since, until):
+        return self._repo.get_commits_dates(since, until)
+
+    def commit_before(self, timestamp):
+        """
+        Find the commit a 'git log -1 --until=<timestamp>' would give, i.e.
+        the first commit in history order not newer than the given time
+
+        @param timestamp: seconds since the epoch
+        @type timestamp: C{int}
+        @return: the sha1 of the commit or C{None} if not found
+        @rtype: C{str}
+        """
+        try:
+            self.update()
+        except GitRepositoryError:
+            # No commits yet
+            return None
+        for commit, date in self._commits:
+            if date <= timestamp:
+                return commit
+        return None
+
+# vim:et:ts=4:sw=4:et:sts=4:ai:set list listchars=tab\:»·,trail\:·:
@@ -23,11 +23,12 @@ from gbp.errors import GbpError
 
 class FastImport(object):
     """Add data to a git repository using I{git fast-import}"""
-    _bufsize = 1024
+    _bufsize = 65536
 
     m_regular = 644
     m_exec    = 755
     m_symlink = 120000
+    m_tree    = 40000
 
     def __init__(self, repo):
         """
@@ -35,6 +36,7 @@ class FastImport(object):
         @type repo: L{GitRepository}
         """
         self._repo = repo
+        self._marks = 0
         try:
             self._fi = subprocess.Popen([ 'git', 'fast-import', '--quiet'],
                                         stdin=subprocess.PIPE, cwd=repo.path)
@@ -45,13 +47,43 @@ class FastImport(object):
             raise GbpError(
                 "Invalid argument when spawning git fast-import: %s" % err)
 
+    def _mark(self):
+        """Allocate a new mark"""
+        self._marks += 1
+        return ":%d" % self._marks
+
+    @staticmethod
+    def _quote_path(path):
+        """
+        Quote a path if fast-import would misparse it
+
+        >>> FastImport._quote_path('foo bar')
+        'foo bar'
+        >>> FastImport._quote_path('"foo"')
+        '"\\\\"foo\\\\""'
+        >>> FastImport._quote_path('')
+        '""'
+        """
+        if path and not path.startswith('"') and '\n' not in path:
+            return path
+        for char, quoted in [('\\', '\\\\'), ('"', '\\"'), ('\n', '\\n')]:
+            path = path.replace(char, quoted)
+        return '"%s"' % path
+
+    @staticmethod
+    def _ident(modifier):
+        """Format author, committer or tagger information"""
+        return "%s <%s> %s" % (modifier.name, modifier.email, modifier.date)
+
     def _do_data(self, fd, size):
         self._out.write("data %s\n" % size)
-        while True:
-            data = fd.read(self._bufsize)
+        left = size
+        while left > 0:
+            data = fd.read(min(left, self._bufsize))
+            if not data:
+                raise GbpError("Short read, %d bytes missing" % left)
             self._out.write(data)
-            if len(data) != self._bufsize:
-                break
+            left -= len(data)
         self._out.write("\n")
 
     def _do_file(self, filename, mode, fd, size):
@@ -87,7 +119,55 @@ class FastImport(object):
         self._out.write("data %s\n" % len(linktarget))
         self._out.write("%s\n" % linktarget)
 
-    def start_commit(self, branch, committer, msg):
+    def add_blob(self, data):
+        """
+        Add a blob that can be referenced by later commits
+
+        @param data: the blob's content
+        @type data: C{str}
+        @return: the mark referencing the blob
+        @rtype: C{str}
+        """
+        mark = self._mark()
+        self._out.write("blob\nmark %s\ndata %d\n%s\n" % (mark, len(data),
+                                                          data))
+        return mark
+
+    def add_blob_file(self, fd, size):
+        """
+        Add a blob read from a stream that can be referenced by later commits
+
+        @param fd: stream to read data from
+        @type fd: C{File} like object
+        @param size: size of the data
+        @type size: C{int}
+        @return: the mark referencing the blob
+        @rtype: C{str}
+        """
+        mark = self._mark()
+        self._out.write("blob\nmark %s\n" % mark)
+        self._do_data(fd, size)
+        return mark
+
+    def add_file_ref(self, filename, dataref, mode=m_regular):
+        """
+        Add a file (or with mode L{FastImport.m_tree} a whole tree) whose
+        content is already known to fast-import
+
+        @param filename: the name of the file to add, relative to the top of
+            the tree
+        @type filename: C{str}
+        @param dataref: a mark returned by L{add_blob} or the sha1 of an
+            object in the repository
+        @type dataref: C{str}
+        @param mode: file mode, default is L{FastImport.m_regular}.
+        @type mode: C{int}
+        """
+        self._out.write("M %d %s %s\n" % (mode, dataref,
+                                         self._quote_path(filename)))
+
+    def start_commit(self, branch, committer, msg, author=None,
+                     parents=None):
         """
         Start a fast import commit
 
@@ -97,29 +177,74 @@ class FastImport(object):
         @type committer: L{GitModifier}
         @param msg: the commit message
         @type msg: C{str}
+        @param author: the author information, defaults to the committer
+        @type author: L{GitModifier}
+        @param parents: marks or sha1s of the parent commits, by default the
+            commit goes on top of I{branch}
+        @type parents: C{list} of C{str}
+        @return: the mark referencing the commit
+        @rtype: C{str}
         """
+        mark = self._mark()
         length = len(msg)
-        if not committer.date:
-            committer.date = "%d %s" % (time.time(),
-                                        time.strftime("%z"))
+        for modifier in [committer, author]:
+            if modifier and not modifier.date:
+                modifier.date = "%d %s" % (time.time(),
+                                           time.strftime("%z"))
 
-        if self._repo.has_branch(branch):
+        if parents is not None:
+            from_ = ''.join(["%s %s\n" % (['merge', 'from'][not i], parent)
+                             for i, parent in enumerate(parents)])
+        elif self._repo.has_branch(branch):
             from_ = "from refs/heads/%(branch)s^0\n"
         else:
             from_ = ''
 
         self._out.write("""commit refs/heads/%(branch)s
-committer %(name)s <%(email)s> %(time)s
+mark %(mark)s
+%(author)scommitter %(name)s <%(email)s> %(time)s
 data %(length)s
 %(msg)s%(from)s""" %
             { 'branch': branch,
+              'mark':   mark,
+              'author': "author %s\n" % self._ident(author) if author else '',
               'name':   committer.name,
               'email':  committer.email,
               'time':   committer.date,
               'length': length,
               'msg': msg,
-              'from': from_,
+              'from': from_ % { 'branch': branch },
               })
+        return mark
+
+    def reset(self, branch, commit):
+        """
+        Point a branch at a commit
+
+        @param branch: the branch to reset
+        @type branch: C{str}
+        @param commit: mark or sha1 of the commit
+        @type commit: C{str}
+        """
+        self._out.write("reset refs/heads/%s\nfrom %s\n\n" % (branch, commit))
+
+    def add_tag(self, name, commit, tagger, msg):
+        """
+        Add an annotated tag
+
+        @param name: the tag's name
+        @type name: C{str}
+        @param commit: mark or sha1 of the commit to tag
+        @type commit: C{str}
+        @param tagger: the tagger information
+        @type tagger: L{GitModifier}
+        @param msg: the tag message
+        @type msg: C{str}
+        """
+        if not tagger.date:
+            tagger.date = "%d %s" % (time.time(), time.strftime("%z"))
+        self._out.write("tag %s\nfrom %s\ntagger %s\ndata %d\n%s\n" %
+                        (name, commit, self._ident(tagger), len(msg), msg))
 
     def deleteall(self):
         """
@@ -130,11 +255,14 @@ data %(length)s
     def close(self):
         """
         Close fast-import issuing all pending actions
+
+        @return: the exit status of I{git fast-import}
+        @rtype: C{int}
         """
         if self._out:
             self._out.close()
         if self._fi:
-            self._fi.wait()
+            return self._fi.wait()
 
     def __del__(self):
         self.close()
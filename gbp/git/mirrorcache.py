@@ -0,0 +1,250 @@
+# vim: set fileencoding=utf-8 :
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""Local mirrors of remote repositories that clones can borrow objects from"""
+
+import errno
+import fcntl
+import hashlib
+import os
+import re
+import shutil
+import time
+from contextlib import contextmanager
+
+import gbp.log
+from gbp.git.repository import GitRepository, GitRepositoryError
+
+
+class MirrorCache(object):
+    """
+    A directory of bare mirrors, one per remote URL. Clones reference a
+    mirror so objects already in the mirror don't need to be fetched
+    again. Clones that keep borrowing objects from a mirror (i.e. that
+    weren't dissociated from it) are recorded so the mirror isn't removed
+    from under them when the cache is pruned.
+
+    Each mirror has a lock file next to it. Updating and removing a
+    mirror needs an exclusive lock, cloning from it a shared one.
+
+    @ivar path: the cache directory
+    @type path: C{str}
+    """
+    # Marks the mirror's last use
+    stamp = 'gbp-last-used'
+    # Clones borrowing objects from the mirror
+    borrowers_file = 'gbp-borrowers'
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+
+    def mirror_path(self, url):
+        """
+        The path of the mirror of I{url}
+
+        >>> MirrorCache('/cache').mirror_path('file:///srv/git/foo.git/')
+        '/cache/foo-c8bd5c647cc2.git'
+        >>> MirrorCache('/cache').mirror_path('git.example.com:bar baz')
+        '/cache/bar_baz-4aa706c9b55e.git'
+        """
+        name = re.split('[/:]', url.rstrip('/'))[-1]
+        if name.endswith('.git'):
+            name = name[:-4]
+        name = re.sub(r'[^\w.+-]', '_', name).lstrip('.') or 'repo'
+        return os.path.join(self.path, '%s-%s.git' %
+                            (name, hashlib.sha1(url).hexdigest()[:12]))
+
+    @staticmethod
+    def _lock_path(mirror):
+        return '%s.lock' % mirror
+
+    @contextmanager
+    def _locked(self, mirror):
+        """
+        Lock a mirror between processes, exclusively at first
+
+        @return: the locked lock file, use it to downgrade to a shared lock
+        @rtype: C{file}
+        """
+        path = self._lock_path(mirror)
+        while True:
+            lock = open(path, 'a')
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # The lock file gets removed along with its mirror
+            try:
+                if os.fstat(lock.fileno()).st_ino == os.stat(path).st_ino:
+                    break
+            except OSError:
+                pass
+            lock.close()
+        try:
+            yield lock
+        finally:
+            lock.close()
+
+    @staticmethod
+    def _configure(repo):
+        """
+        Set up a mirror so git's automatic housekeeping doesn't break the
+        clones using it
+        """
+        # Clones borrowing objects can still use the ones of branches that
+        # got removed upstream
+        repo._git_command('config', ['gc.pruneExpire', 'never'])
+        # Cloning with --dissociate from a mirror that has a commit-graph
+        # fails to read the commits after dissociating
+        repo._git_command('config', ['gc.writeCommitGraph', 'false'])
+
+    def _update(self, url, mirror):
+        """Create the mirror of I{url} or fetch into it if it exists already"""
+        if os.path.isdir(mirror):
+            gbp.log.info("Updating cached mirror of '%s'" % url)
+            repo = GitRepository(mirror)
+            # Also for mirrors created before they were set up like this
+            self._configure(repo)
+            repo._git_command('remote', ['update', '--prune'])
+        else:
+            gbp.log.info("Creating cached mirror of '%s'" % url)
+            tmp = '%s.tmp' % mirror
+            if os.path.exists(tmp):
+                shutil.rmtree(tmp)
+            repo = GitRepository.clone(tmp, url, mirror=True, auto_name=False)
+            self._configure(repo)
+            os.rename(tmp, mirror)
+        open(os.path.join(mirror, self.stamp), 'w').close()
+
+    @contextmanager
+    def borrow(self, url):
+        """
+        Update the mirror of I{url} and keep it from being removed while
+        cloning with it as reference. Clones that keep borrowing objects
+        from the mirror need to be recorded with L{add_borrower} before
+        leaving the block.
+
+        If the mirror can't be updated a warning is logged and C{None} is
+        used instead of the mirror.
+
+        @param url: the remote repository
+        @type url: C{str}
+        @return: path of the mirror or C{None}
+        @rtype: C{str}
+        """
+        mirror = self.mirror_path(url)
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        with self._locked(mirror) as lock:
+            try:
+                self._update(url, mirror)
+            except (GitRepositoryError, OSError, IOError) as err:
+                gbp.log.warn("Failed to update cached mirror of '%s', not "
+                             "using it: %s" % (url, err))
+                mirror = None
+            else:
+                # Other clones can use the mirror meanwhile but it can't be
+                # updated or removed
+                fcntl.flock(lock, fcntl.LOCK_SH)
+            yield mirror
+
+    def add_borrower(self, mirror, path):
+        """
+        Record that the clone at I{path} borrows objects from I{mirror}.
+        Only call this within L{borrow}.
+        """
+        # Appending a line is atomic so the shared lock is enough
+        with open(os.path.join(mirror, self.borrowers_file), 'a') as out:
+            out.write('%s\n' % os.path.abspath(path))
+
+    def _borrowers(self, mirror):
+        """The clones still borrowing objects from I{mirror}"""
+        try:
+            with open(os.path.join(mirror, self.borrowers_file)) as borrowers:
+                paths = [line.strip() for line in borrowers if line.strip()]
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return []
+        objects = os.path.realpath(os.path.join(mirror, 'objects'))
+        borrowing = []
+        for path in paths:
+            try:
+                repo = GitRepository(path)
+                with open(os.path.join(repo.git_dir, 'objects', 'info',
+                                       'alternates')) as alternates:
+                    if objects in [os.path.realpath(line.strip()) for line
+                                   in alternates]:
+                        borrowing.append(path)
+            except (GitRepositoryError, IOError):
+                pass
+        return borrowing
+
+    def mirrors(self):
+        """
+        The mirrors in the cache, least recently used first
+
+        @return: time of last use and path of each mirror
+        @rtype: C{list} of C{tuple}
+        """
+        mirrors = []
+        if not os.path.isdir(self.path):
+            return mirrors
+        for name in os.listdir(self.path):
+            mirror = os.path.join(self.path, name)
+            if not name.endswith('.git') or not os.path.isdir(mirror):
+                continue
+            try:
+                used = os.path.getmtime(os.path.join(mirror, self.stamp))
+            except OSError:
+                used = os.path.getmtime(mirror)
+            mirrors.append((used, mirror))
+        return sorted(mirrors)
+
+    def prune(self, keep=0, max_age=0, force=False):
+        """
+        Remove the least recently used mirrors
+
+        @param keep: number of mirrors to keep, C{0} for no limit
+        @type keep: C{int}
+        @param max_age: remove mirrors not used for that many days,
+            C{0} for no limit
+        @type max_age: C{int}
+        @param force: also remove mirrors clones still borrow objects from
+        @type force: C{bool}
+        @return: the removed mirrors
+        @rtype: C{list} of C{str}
+        """
+        mirrors = self.mirrors()
+        now = time.time()
+        removed = []
+        for num, (used, mirror) in enumerate(mirrors):
+            if not ((keep and len(mirrors) - num > keep) or
+                    (max_age and now - used > max_age * 24 * 3600)):
+                continue
+            with self._locked(mirror):
+                if not os.path.isdir(mirror):
+                    # Removed by someone else meanwhile
+                    os.unlink(self._lock_path(mirror))
+                    continue
+                borrowers = self._borrowers(mirror)
+                if borrowers and not force:
+                    gbp.log.warn("Not removing '%s', still used by %s" %
+                                 (mirror, ', '.join(borrowers)))
+                    continue
+                gbp.log.info("Removing cached mirror '%s'" % mirror)
+                shutil.rmtree(mirror)
+                os.unlink(self._lock_path(mirror))
+            removed.append(mirror)
+        return removed
+
+# vim:et:ts=4:sw=4:et:sts=4:ai:set list listchars=tab\:»·,trail\:·:
@@ -0,0 +1,145 @@
+# vim: set fileencoding=utf-8 :
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""Persistent indexes of data about the history of a git ref"""
+
+import os
+
+import gbp.log
+from gbp.git.repository import GitRepositoryError
+
+
+class RefIndex(object):
+    """
+    Data about the commits reachable from a ref, in the order I{git
+    rev-list} lists them. The index is stored under the .git directory and
+    updated incrementally when the ref moves forward.
+
+    Subclasses set L{name} and implement L{_scan} which gets the data about
+    a range of commits.
+
+    @cvar name: directory below .git/gbp the index is stored in
+    @type name: C{str}
+    @ivar ref: the ref whose history is indexed
+    @type ref: C{str}
+    """
+    name = None
+    # Bump this whenever the format of the stored index changes
+    VERSION = 1
+
+    def __init__(self, repo, ref='HEAD'):
+        self._repo = repo
+        self.ref = ref
+        self._tip = None
+        self._commits = None
+
+    def _path(self):
+        """Path of the stored index"""
+        import hashlib
+        out, ret = self._repo._git_getoutput('rev-parse',
+                                             ['--symbolic-full-name',
+                                              self.ref])
+        name = out[0].strip() if not ret and out and out[0].strip() else \
+                    self.ref
+        return os.path.join(self._repo.git_dir, 'gbp', self.name,
+                            hashlib.sha1(name).hexdigest())
+
+    def _load(self, path):
+        """Load stored index, if any"""
+        import cPickle as pickle
+        try:
+            with open(path, 'rb') as index:
+                version, tip, commits = pickle.load(index)
+            if version == self.VERSION:
+                self._tip, self._commits = tip, commits
+        except (IOError, EOFError, ValueError, TypeError,
+                pickle.UnpicklingError) as err:
+            if not isinstance(err, IOError):
+                gbp.log.debug("Ignoring corrupt %s index %s" % (self.name,
+                                                               path))
+
+    def _save(self, path):
+        """Store the index, failures are not fatal"""
+        import cPickle as pickle
+        import tempfile
+        try:
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                            prefix='.tmp')
+            with os.fdopen(fd, 'wb') as index:
+                pickle.dump((self.VERSION, self._tip, self._commits), index,
+                            pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_path, path)
+        except (IOError, OSError) as err:
+            gbp.log.debug("Failed to write %s index: %s" % (self.name, err))
+
+    def _scan(self, since, until):
+        """
+        Get the indexed data of a range of commits
+
+        @param since: commit to start from, C{None} for the whole history
+        @type since: C{str}
+        @param until: last commit
+        @type until: C{str}
+        @return: the data, newest commit first
+        @rtype: C{list}
+        """
+        raise NotImplementedError
+
+    def _has_merges(self, since, until):
+        """Whether there are merges between I{since} and I{until}"""
+        out, dummy, ret = self._repo._git_inout('rev-list',
+                                                ['--merges', '-n1',
+                                                 '%s..%s' % (since, until),
+                                                 '--'],
+                                                capture_stderr=True)
+        return bool(ret or out.strip())
+
+    def update(self):
+        """
+        Bring the index up to date with the ref. Only the commits not
+        indexed yet are scanned, unless the ref was rewound or rewritten
+        or the new commits contain a merge. The commits of a merged branch
+        can be interleaved with the ones already indexed in rev-list's
+        order so a merge means rebuilding the index.
+        """
+        tip = self._repo.rev_parse('%s^0' % self.ref)
+        if tip == self._tip:
+            return
+        path = self._path()
+        if self._commits is None:
+            self._load(path)
+            if tip == self._tip:
+                return
+
+        new = None
+        if self._tip:
+            try:
+                if (self._repo.get_merge_base(self._tip, tip) == self._tip and
+                        not self._has_merges(self._tip, tip)):
+                    new = self._scan(self._tip, tip)
+            except GitRepositoryError:
+                pass
+        if new is None:
+            gbp.log.debug("Building %s index for '%s'" % (self.name,
+                                                         self.ref))
+            self._commits = self._scan(None, tip)
+        else:
+            self._commits = new + self._commits
+        self._tip = tip
+        self._save(path)
+
+# vim:et:ts=4:sw=4:et:sts=4:ai:set list listchars=tab\:»·,trail\:·:
@@ -100,8 +100,19 @@ class GitRepository(object):
                                               capture_stderr=True)
             self._path = os.path.abspath(out.strip())
 
+    # Tags as read by get_tag_index and the stamp of the refs they were
+    # read from
+    _tag_index = None
+
+    # Repositories already looked up, only filled by long running processes
+    # like gbp.server that know when to forget about them again
+    _detected = {}
+
     def __init__(self, path):
         self._path = os.path.abspath(path)
+        if self._path in self._detected:
+            self._bare, self._git_dir, self._path = self._detected[self._path]
+            return
         try:
             # Check for bare repository
             out, dummy, ret = self._git_inout('rev-parse', ['--is-bare-repository'],
@@ -118,6 +129,29 @@ class GitRepository(object):
             raise GitRepositoryError("No Git repository at '%s' (or any parent dir)" % self.path)
 
 
+    @classmethod
+    def remember_detected(klass, path, repo):
+        """
+        Let later instances for I{path} skip looking up the repository
+
+        @param path: the path the repository was looked up from
+        @type path: C{str}
+        @param repo: the repository found there
+        @type repo: L{GitRepository}
+        """
+        klass._detected[os.path.abspath(path)] = (repo.bare, repo.git_dir,
+                                                  repo.path)
+
+    @classmethod
+    def forget_detected(klass, path=None):
+        """
+        Look up the repository at I{path} again, all of them if C{None}
+        """
+        if path is None:
+            klass._detected.clear()
+        else:
+            klass._detected.pop(os.path.abspath(path), None)
+
     @staticmethod
     def __build_env(extra_env):
         """Prepare environment for subprocess calls"""
@@ -250,20 +284,22 @@ class GitRepository(object):
         w_ind = 0
         while out_fds or in_fds:
             ready = select.select(out_fds, in_fds, [])
-            # Write in chunks of 512 bytes
+            # Write in chunks of up to 4k (the pipe atomic write size)
             if ready[1]:
                 try:
-                    popen.stdin.write(stdin[w_ind:w_ind+512])
-                except IOError:
+                    w_ind += os.write(popen.stdin.fileno(),
+                                      stdin[w_ind:w_ind+4096])
+                except OSError:
                     # Ignore, we want to read buffers to e.g. get error message
                     # Git should give an error code so that we catch an error
-                    pass
-                w_ind += 512
-                if w_ind > len(stdin):
+                    w_ind = len(stdin)
+                if w_ind >= len(stdin):
                     rm_polled_fd(popen.stdin, in_fds)
-            # Read in chunks of 4k
-            stdout = popen.stdout.read(4096) if popen.stdout in ready[0] else ''
-            stderr = popen.stderr.read(4096) if popen.stderr in ready[0] else ''
+            # Read in chunks of 4k, don't block waiting for a full chunk
+            stdout = os.read(popen.stdout.fileno(), 4096) \
+                        if popen.stdout in ready[0] else ''
+            stderr = os.read(popen.stderr.fileno(), 4096) \
+                        if popen.stderr in ready[0] else ''
             if popen.stdout in ready[0] and not stdout:
                 rm_polled_fd(popen.stdout, out_fds)
             if popen.stderr in ready[0] and not stderr:
@@ -633,6 +669,66 @@ class GitRepository(object):
             args = [ '-m', msg ] + args
         self._git_command("update-ref", args)
 
+    def update_refs(self, updates, msg=None):
+        """
+        Update several refs in a single transaction, either all of them
+        are updated or none
+
+        @param updates: the refs to update, their new and their old value
+            (C{None} to not check the old value)
+        @type updates: C{list} of C{tuple} of C{str}
+        @param msg: the reason for the update
+        @type msg: C{str}
+        """
+        if not updates:
+            return
+        args = GitArgs('--stdin')
+        args.add_true(msg, '-m', msg)
+        commands = ''.join(["update %s\n" % ' '.join([ref, new] +
+                                                     ([old] if old else []))
+                            for (ref, new, old) in updates])
+        dummy, err, ret = self._git_inout('update-ref', args.args,
+                                          input=commands, capture_stderr=True)
+        if ret:
+            raise GitRepositoryError("Failed to update refs: %s" %
+                                     err.strip())
+
+    def get_tracking_info(self):
+        """
+        Get the upstream branch of all local branches and how far they
+        diverged from it, using a single git call
+
+        @return: the upstream branch's name (like I{origin/master}), the
+            commits of the branch and of the upstream branch (C{None} if
+            the upstream branch doesn't exist) and the number of commits
+            the branch is ahead and behind, indexed by branch name
+        @rtype: C{dict} of C{dict}
+        """
+        args = ['--format=%(refname)%00%(objectname)%00%(upstream)%00'
+                '%(upstream:short)%00%(upstream:track)',
+                'refs/heads/', 'refs/remotes/']
+        out, err, ret = self._git_inout('for-each-ref', args,
+                                        capture_stderr=True)
+        if ret:
+            raise GitRepositoryError("Failed to get tracking branches: %s" %
+                                     err.strip())
+        commits = {}
+        tracking = {}
+        for line in out.splitlines():
+            ref, commit, upstream, name, track = line.split('\0')
+            commits[ref] = commit
+            if ref.startswith('refs/heads/') and upstream:
+                counts = dict(re.findall(r'(ahead|behind) (\d+)', track))
+                tracking[ref[len('refs/heads/'):]] = {
+                    'upstream': name,
+                    'upstream_ref': upstream,
+                    'commit': commit,
+                    'ahead': int(counts.get('ahead', 0)),
+                    'behind': int(counts.get('behind', 0))}
+        for info in tracking.values():
+            info['upstream_commit'] = commits.get(info.pop('upstream_ref'))
+        return tracking
+
     def branch_contains(self, branch, commit, remote=False):
         """
         Check if branch I{branch} contains commit I{commit}
@@ -734,6 +830,7 @@ class GitRepository(object):
         args.add_true(annotate, '-a')
         args.add(name)
         args.add_true(commit, commit)
+        self._tag_index = None
         self._git_command("tag", args.args, interactive=True)
 
     def delete_tag(self, tag):
@@ -744,9 +841,11 @@ class GitRepository(object):
         @type tag: C{str}
         """
         if self.has_tag(tag):
+            self._tag_index = None
             self._git_command("tag", [ "-d", tag ])
 
     def move_tag(self, old, new):
+        self._tag_index = None
         self._git_command("tag", [ new, old ])
         self.delete_tag(old)
 
@@ -762,6 +861,75 @@ class GitRepository(object):
         out, ret = self._git_getoutput('tag', [ '-l', tag ])
         return [ False, True ][len(out)]
 
+    def _tags_stamp(self):
+        """
+        Modification times of the places tags are stored in, C{None} if
+        they aren't where we expect them
+        """
+        tags_dir = os.path.join(self.git_dir, 'refs', 'tags')
+        if not os.path.isdir(tags_dir):
+            return None
+        stamp = []
+        try:
+            stamp.append(os.stat(os.path.join(self.git_dir,
+                                              'packed-refs')).st_mtime)
+        except OSError:
+            stamp.append(None)
+        for dirpath, dummy, dummy in os.walk(tags_dir):
+            stamp.append((dirpath, os.stat(dirpath).st_mtime))
+        return stamp
+
+    def get_tag_index(self):
+        """
+        Get all tags with the objects they point to and their messages,
+        listed at once and kept in memory until the tags change
+
+        @return: the object, the commit (C{None} if the tag doesn't point
+            to a commit directly or via a single annotated tag) and the
+            message (the commit message for lightweight tags) by tag name
+        @rtype: C{dict} of C{tuple}
+        """
+        stamp = self._tags_stamp()
+        if stamp is not None and self._tag_index and \
+                self._tag_index[0] == stamp:
+            return self._tag_index[1]
+
+        out, err, ret = self._git_inout('for-each-ref',
+                                        ['--format=%(refname)%00'
+                                         '%(objecttype)%00%(objectname)%00'
+                                         '%(*objecttype)%00%(*objectname)%00'
+                                         '%(contents)%00', 'refs/tags/'],
+                                        capture_stderr=True)
+        if ret:
+            raise GitRepositoryError("Failed to list tags: %s" % err.strip())
+        index = {}
+        # Each record ends with the NUL after the message and the newline
+        # for-each-ref adds
+        for record in out.split('\0\n')[:-1]:
+            ref, typ, obj, peeled_typ, peeled, msg = record.split('\0', 5)
+            if peeled_typ:
+                commit = peeled if peeled_typ == 'commit' else None
+            else:
+                commit = obj if typ == 'commit' else None
+            index[ref[len('refs/tags/'):]] = (obj, commit, msg)
+        self._tag_index = (stamp, index)
+        return index
+
+    def get_tag_commit(self, tag):
+        """
+        Get the commit a tag points to using L{get_tag_index}
+
+        @param tag: the tag
+        @type tag: C{str}
+        @return: the commit's sha1, C{None} if there's no such tag
+        @rtype: C{str}
+        """
+        entry = self.get_tag_index().get(tag)
+        if entry is None:
+            return None
+        # Tags of tags and of other objects are rare, let git sort them out
+        return entry[1] or self.rev_parse("%s^0" % tag)
+
     def describe(self, commitish, pattern=None, longfmt=False, always=False,
                  abbrev=None, tags=False, exact_match=False):
         """
@@ -896,6 +1064,9 @@ class GitRepository(object):
         if self.bare:
             return (True, '')
 
+        # A single git status checks the index, the working tree
+        # (including submodules) and untracked files in one pass, which is
+        # faster on clean trees than checking them one after another
         out = self._status(porcelain=True,
                            ignore_untracked=ignore_untracked)
         if out:
@@ -1100,6 +1271,101 @@ class GitRepository(object):
             raise GitRepositoryError("Not a Git repository object: '%s'" % obj)
         return out[0].strip()
 
+    def batch_check_objects(self, objects):
+        """
+        Look up several git repository objects using a single git process
+
+        @param objects: names of the objects to look up, e.g. 'HEAD^0'
+        @type objects: C{list} of C{str}
+        @return: the sha1 and type of each object or C{None} if the object
+            doesn't exist
+        @rtype: C{list} of C{tuple} of C{str}
+        """
+        if not objects:
+            return []
+        out, err, ret = self._git_inout('cat-file', ['--batch-check'],
+                                        '\n'.join(objects) + '\n',
+                                        capture_stderr=True)
+        if ret:
+            raise GitRepositoryError("Failed to look up objects: %s" %
+                                     err.strip())
+        result = []
+        for line in out.splitlines():
+            fields = line.split()
+            if len(fields) == 3 and fields[1] != 'missing':
+                result.append((fields[0], fields[1]))
+            else:
+                result.append(None)
+        return result
+
+    def batch_read_objects(self, objects):
+        """
+        Read several git repository objects using a single git process
+
+        @param objects: names of the objects to read, e.g. 'HEAD:foo.spec'
+        @type objects: C{list} of C{str}
+        @return: the sha1, type and content of each object or C{None} if
+            the object doesn't exist
+        @rtype: C{list} of C{tuple} of C{str}
+        """
+        if not objects:
+            return []
+        out, err, ret = self._git_inout('cat-file', ['--batch'],
+                                        '\n'.join(objects) + '\n',
+                                        capture_stderr=True)
+        if ret:
+            raise GitRepositoryError("Failed to read objects: %s" %
+                                     err.strip())
+        result = []
+        pos = 0
+        for _obj in objects:
+            end = out.index('\n', pos)
+            fields = out[pos:end].split(' ')
+            pos = end + 1
+            if len(fields) == 3 and fields[2].isdigit():
+                size = int(fields[2])
+                result.append((fields[0], fields[1], out[pos:pos + size]))
+                # Content is followed by a newline
+                pos += size + 1
+            else:
+                result.append(None)
+        return result
+
+    def batch_list_trees(self, trees):
+        """
+        Get the (non-recursive) content of several trees using a single git
+        process. The content of each tree is a list of objects matching the
+        'ls-tree' output: [ mode, type, sha1, path ].
+
+        @param trees: the trees to list, given as sha1s or as commits
+        @type trees: C{list} of C{str}
+        @return: the content of each tree or C{None} if the tree doesn't
+            exist
+        @rtype: C{list}
+        """
+        result = []
+        for obj in self.batch_read_objects(['%s^{tree}' % tree
+                                            for tree in trees]):
+            if obj is None:
+                result.append(None)
+                continue
+            data = obj[2]
+            entries = []
+            pos = 0
+            while pos < len(data):
+                sep = data.index('\0', pos)
+                mode, name = data[pos:sep].split(' ', 1)
+                sha = data[sep + 1:sep + 21].encode('hex')
+                pos = sep + 21
+                if mode == '40000':
+                    entries.append(['040000', 'tree', sha, name])
+                elif mode == '160000':
+                    entries.append([mode, 'commit', sha, name])
+                else:
+                    entries.append([mode, 'blob', sha, name])
+            result.append(entries)
+        return result
+
     def list_tree(self, treeish, recurse=False, paths=None):
         """
         Get a trees content. It returns a list of objects that match the
@@ -1162,6 +1428,22 @@ class GitRepository(object):
         name = os.getenv("GIT_AUTHOR_NAME", name)
         return GitModifier(name, email)
 
+    def get_identity(self, who='author'):
+        """
+        Get the author or committer information, including the date, git
+        would use for a new commit
+
+        @param who: C{'author'} or C{'committer'}
+        @type who: C{str}
+        @rtype: L{GitModifier}
+        """
+        out, ret = self._git_getoutput('var', ['GIT_%s_IDENT' % who.upper()])
+        if ret or not out:
+            raise GitRepositoryError("Failed to get %s identity" % who)
+        ident, timestamp, offset = out[0].strip().rsplit(' ', 2)
+        name, email = ident.rstrip('>').rsplit('<', 1)
+        return GitModifier(name.strip(), email, "%s %s" % (timestamp, offset))
+
 #{ Remote Repositories
 
     def get_remotes(self):
@@ -1518,6 +1800,17 @@ class GitRepository(object):
         @return: the tree object hash
         @rtype: C{str}
         """
+        # Threads and friends are only needed when importing trees
+        from gbp.git.treebuilder import TreeBuilder, TreeBuilderError
+
+        if TreeBuilder.has_plain_config(self):
+            try:
+                tree = TreeBuilder(self).build(unpack_dir)
+            except TreeBuilderError as err:
+                raise GitRepositoryError(str(err))
+            if tree:
+                return tree
+
         git_index_file = os.path.join(self.path, self._git_dir, 'gbp_index')
         try:
             os.unlink(git_index_file)
@@ -1744,6 +2037,132 @@ class GitRepository(object):
                 'body' : fields[8],
                 'files' : files}
 
+    def get_commits_parents(self, since, until):
+        """
+        Get commits from since to until together with their parents
+
+        @param since: commit to start from
+        @type since: C{str}
+        @param until: last commit to get
+        @type until: C{str}
+        @return: the commits and their parents, newest commit first
+        @rtype: C{list} of C{tuple} of C{str} and C{list} of C{str}
+        """
+        args = GitArgs('--parents', until)
+        args.add_true(since, '^%s' % since)
+        args.add('--')
+        out, err, ret = self._git_inout('rev-list', args.args,
+                                        capture_stderr=True)
+        if ret:
+            raise GitRepositoryError("Error getting commits %s..%s: %s" %
+                                     (since, until, err.strip()))
+        commits = []
+        for line in out.splitlines():
+            fields = line.split()
+            commits.append((fields[0], fields[1:]))
+        return commits
+
+    def get_commits_dates(self, since, until):
+        """
+        Get commits from since to until together with their committer dates
+
+        @param since: commit to start from
+        @type since: C{str}
+        @param until: last commit to get
+        @type until: C{str}
+        @return: the commits and their commit timestamps, in the order
+            listed by 'git rev-list', i.e. newest commit first
+        @rtype: C{list} of C{tuple} of C{str} and C{int}
+        """
+        args = GitArgs('--format=%ct', until)
+        args.add_true(since, '^%s' % since)
+        args.add('--')
+        out, err, ret = self._git_inout('rev-list', args.args,
+                                        capture_stderr=True)
+        if ret:
+            raise GitRepositoryError("Error getting commits %s..%s: %s" %
+                                     (since, until, err.strip()))
+        lines = out.splitlines()
+        # Output consists of 'commit <sha1>' lines followed by the timestamp
+        return [(lines[num].split()[1], int(lines[num + 1])) for num in
+                xrange(0, len(lines) - 1, 2)]
+
+    def get_commits_messages(self, since, until):
+        """
+        Get commits from since to until together with their commit messages
+
+        @param since: commit to start from
+        @type since: C{str}
+        @param until: last commit to get
+        @type until: C{str}
+        @return: the commits and their messages, newest commit first
+        @rtype: C{list} of C{tuple} of C{str} and C{str}
+        """
+        args = GitArgs('-z', '--format=%H%x00%B', until)
+        args.add_true(since, '^%s' % since)
+        args.add('--')
+        out, err, ret = self._git_inout('log', args.args,
+                                        capture_stderr=True)
+        if ret:
+            raise GitRepositoryError("Error getting commits %s..%s: %s" %
+                                     (since, until, err.strip()))
+        # Commit and message, both NUL terminated
+        fields = out.split('\0')
+        return [(fields[num], fields[num + 1]) for num in
+                xrange(0, len(fields) - 1, 2)]
+
+    def get_commits_info(self, commits):
+        """
+        Look up data of several commits using a single git process
+
+        @param commits: the commit sha1s to inspect
+        @type commits: C{list} of C{str}
+        @return: for each commit the same data as
+            L{GitRepository.get_commit_info}
+        @rtype: C{list} of C{dict}
+        """
+        if not commits:
+            return []
+        args = GitArgs('--pretty=format:%H%x00%an%x00%ae%x00%ad%x00%cn%x00%ce%x00%cd%x00%s%x00%f%x00%b%x00',
+                       '-z', '--date=raw', '--no-renames', '--name-status',
+                       '--no-walk=unsorted', '--stdin')
+        out, err, ret = self._git_inout('log', args.args,
+                                        '\n'.join(commits) + '\n',
+                                        capture_stderr=True)
+        if ret:
+            raise GitRepositoryError("Unable to retrieve commit info: %s" %
+                                     err.strip())
+
+        fields = out.split('\x00')
+        infos = []
+        for commit in commits:
+            # Skip record separators
+            while fields and not fields[0].strip():
+                fields.pop(0)
+            if len(fields) < 10 or fields[0].strip() != commit:
+                raise GitRepositoryError("Unable to retrieve commit info "
+                                         "for %s" % commit)
+            author = GitModifier(fields[1].strip(),
+                                 fields[2].strip(),
+                                 fields[3].strip())
+            committer = GitModifier(fields[4].strip(),
+                                    fields[5].strip(),
+                                    fields[6].strip())
+            info = {'id' : commit,
+                    'author' : author,
+                    'committer' : committer,
+                    'subject' : fields[7],
+                    'patchname' : fields[8],
+                    'body' : fields[9],
+                    'files' : defaultdict(list)}
+            del fields[:10]
+            while len(fields) > 1 and fields[0].strip():
+                status = fields.pop(0).strip()
+                path = fields.pop(0)
+                info['files'][status].append(path)
+            infos.append(info)
+        return infos
+
 #{ Patches
     def format_patches(self, start, end, output_dir,
                        signature=True,
@@ -1822,6 +2241,63 @@ class GitRepository(object):
             raise GitRepositoryError("Git diff failed")
         return output
 
+    def diff_commits(self, commits, paths=None, stat=False, summary=False,
+                     text=False, ignore_submodules=True):
+        """
+        Diff several commits against their (first) parent using a single
+        git process
+
+        @param commits: the commits sha1s to diff
+        @type commits: C{list} of C{str}
+        @param paths: List of paths to diff
+        @type paths: C{list}
+        @param stat: Show diffstat
+        @type stat: C{bool} or C{int} or C{str}
+        @param summary: Show diffstat
+        @type summary: C{bool}
+        @param text: Generate textual diffs, treat all files as text
+        @type text: C{bool}
+        @param ignore_submodules: ignore changes to submodules
+        @type ignore_submodules: C{bool}
+        @return: the diff of each commit
+        @rtype: C{dict} of C{str}
+        """
+        diffs = {}
+        if not commits:
+            return diffs
+        options = GitArgs('-p', '--stdin')
+        if stat is True:
+            options.add('--stat')
+        elif stat:
+            options.add('--stat=%s' % stat)
+        options.add_true(summary, '--summary')
+        options.add_true(text, '--text')
+        options.add_true(ignore_submodules, '--ignore-submodules')
+        if paths:
+            options.add('--', paths)
+        output, stderr, ret = self._git_inout('diff-tree', options.args,
+                                              '\n'.join(commits) + '\n',
+                                              capture_stderr=True)
+        if ret:
+            raise GitRepositoryError("Git diff-tree failed: %s" %
+                                     stderr.strip())
+
+        # Each diff is preceded by a line holding the commit's sha1, commits
+        # without changes are omitted from the output
+        positions = dict((commit, pos) for pos, commit in enumerate(commits))
+        next_pos = 0
+        current = []
+        for line in output.splitlines(True):
+            pos = positions.get(line.rstrip('\n'), -1)
+            if pos >= next_pos:
+                next_pos = pos + 1
+                current = diffs[commits[pos]] = []
+            else:
+                current.append(line)
+        for commit in commits:
+            diffs[commit] = ''.join(diffs.get(commit, []))
+        return diffs
+
     def diff_status(self, obj1, obj2):
         """
         Get file-status of two git repository objects
@@ -1894,6 +2370,38 @@ class GitRepository(object):
         args = [ '--auto' ] if auto else []
         self._git_command("gc", args)
 
+    def write_commit_graph(self, changed_paths=True, split=True):
+        """
+        Write the commit-graph of all reachable commits so git can walk
+        the history without parsing every commit
+
+        @param changed_paths: also record the paths each commit changed
+            in Bloom filters to speed up path limited history walks
+        @type changed_paths: C{bool}
+        @param split: only add the commits that aren't in the graph yet as
+            a new layer instead of rewriting the whole graph
+        @type split: C{bool}
+        """
+        args = GitArgs('write', '--reachable')
+        args.add_true(changed_paths, '--changed-paths')
+        args.add_true(split, '--split')
+        dummy, err, ret = self._git_inout('commit-graph', args.args,
+                                          capture_stderr=True)
+        if ret:
+            raise GitRepositoryError("Failed to write commit-graph: %s" %
+                                     err.strip())
+
+    def has_commit_graph(self):
+        """
+        Does the repository have a commit-graph?
+
+        @rtype: C{bool}
+        """
+        info = os.path.join(self.git_dir, 'objects', 'info')
+        return (os.path.exists(os.path.join(info, 'commit-graph')) or
+                os.path.exists(os.path.join(info, 'commit-graphs',
+                                            'commit-graph-chain')))
+
 #{ Submodules
 
     def has_submodules(self, treeish=None):
@@ -2030,7 +2538,7 @@ class GitRepository(object):
 
     @classmethod
     def clone(klass, path, remote, depth=0, recursive=False, mirror=False,
-              bare=False, auto_name=True):
+              bare=False, auto_name=True, reference=None, dissociate=False):
         """
         Clone a git repository at I{remote} to I{path}.
 
@@ -2049,6 +2557,11 @@ class GitRepository(object):
         @param auto_name: If I{True} create a directory below I{path} based on
             the I{remote}s name. Otherwise create the repo directly at I{path}.
         @type auto_name: C{bool}
+        @param reference: local repository to borrow objects from
+        @type reference: C{str}
+        @param dissociate: copy the borrowed objects so the clone doesn't
+            depend on I{reference} afterwards
+        @type dissociate: C{bool}
         @return: git repository object
         @rtype: L{GitRepository}
         """
@@ -2063,6 +2576,8 @@ class GitRepository(object):
         args.add_true(recursive, '--recursive')
         args.add_true(mirror, '--mirror')
         args.add_true(bare, '--bare')
+        args.add_true(reference, '--reference', reference)
+        args.add_true(reference and dissociate, '--dissociate')
         args.add(remote)
         args.add_true(name, name)
         try:
@@ -0,0 +1,266 @@
+# vim: set fileencoding=utf-8 :
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""Build git trees out of directories concurrently"""
+
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+import gbp.log
+from gbp.git.errors import GitError
+
+
+class TreeBuilderError(GitError):
+    """Exception thrown by L{TreeBuilder}"""
+    pass
+
+
+class TreeBuilder(object):
+    """
+    Create a tree object out of a directory like adding the directory's
+    content to an empty index with I{git add -f .} and writing the index
+    does, but without going through an index
+
+    The files are hashed and written to the object database by a pool of
+    I{git hash-object} processes, the trees are then written bottom-up by a
+    single I{git mktree} process.
+
+    Whenever git would convert files when adding them (because of
+    attributes or I{core.autocrlf}) or the directory contains something
+    git would add specially (like nested repositories) L{build} gives up
+    and the tree needs to be created by git itself.
+    """
+    # Git config settings that don't change files when adding them
+    plain_git_config = {'core.autocrlf': 'false',
+                        'core.filemode': 'true',
+                        'core.symlinks': 'true'}
+
+    # Minimum number of files to hash per git process
+    min_chunk = 1000
+
+    m_regular = '100644'
+    m_exec = '100755'
+    m_symlink = '120000'
+    m_tree = '40000'
+
+    def __init__(self, repo, jobs=4):
+        """
+        @param repo: the repository to create the tree in
+        @type repo: L{GitRepository}
+        @param jobs: number of I{git hash-object} processes to run in parallel
+        @type jobs: C{int}
+        """
+        self.repo = repo
+        self.jobs = jobs
+
+    @classmethod
+    def has_plain_config(cls, repo):
+        """
+        Check that adding files to the repository doesn't convert them, i.e.
+        that the repository's configuration doesn't set up any filters or
+        line ending conversion
+
+        @param repo: the repository to check
+        @type repo: L{GitRepository}
+        @rtype: C{bool}
+        """
+        out, dummy = repo._git_getoutput('config', ['--get-regexp',
+                                   r'^core\.(autocrlf|filemode|symlinks|'
+                                   r'attributesfile)$'])
+        config = {}
+        for line in out:
+            name, dummy, value = line.rstrip('\n').partition(' ')
+            # A setting without a value is a boolean true
+            config[name] = value or 'true'
+        for name, plain in cls.plain_git_config.items():
+            if config.get(name, plain).lower() != plain:
+                gbp.log.debug("Config %s=%s, adding files with git" %
+                              (name, config[name]))
+                return False
+        if 'core.attributesfile' in config:
+            attributes = [os.path.expanduser(config['core.attributesfile'])]
+        else:
+            attributes = [os.path.join(
+                            os.getenv('XDG_CONFIG_HOME',
+                                      os.path.expanduser('~/.config')),
+                            'git', 'attributes')]
+        attributes.append(os.path.join(repo.git_dir, 'info', 'attributes'))
+        for path in attributes:
+            if os.path.exists(path):
+                gbp.log.debug("Found %s, adding files with git" % path)
+                return False
+        return True
+
+    @staticmethod
+    def _tree_sha1(entries):
+        """
+        Calculate the sha1 of a tree object
+
+        >>> TreeBuilder._tree_sha1([])
+        '4b825dc642cb6eb9a060e54bf8d69288fbee4904'
+
+        @param entries: mode, sha1 and name of each entry
+        @type entries: C{list} of C{tuple}
+        """
+        def sort_key(entry):
+            # Trees sort as if their name had a trailing slash
+            return entry[2] + '/' if entry[0] == TreeBuilder.m_tree \
+                        else entry[2]
+        content = ''.join(["%s %s\0%s" % (mode, name, sha1.decode('hex'))
+                           for mode, sha1, name in sorted(entries,
+                                                          key=sort_key)])
+        return hashlib.sha1("tree %d\0%s" % (len(content),
+                                             content)).hexdigest()
+
+    def scan(self, top):
+        """
+        Find the files I{git add -f .} would add to the tree
+
+        @param top: the directory
+        @type top: C{str}
+        @return: the files as (directory relative to I{top}, name, mode,
+            path) and the directories, or C{None} if git needs to add the
+            directory itself
+        @rtype: C{tuple}
+        """
+        files = []
+        dirs = []
+        for root, subdirs, names in os.walk(top):
+            reldir = os.path.relpath(root, top)
+            reldir = '' if reldir == os.curdir else reldir
+            if not reldir:
+                for entries in [subdirs, names]:
+                    if '.git' in entries:
+                        entries.remove('.git')
+            if [name for name in subdirs + names if name.lower() == '.git']:
+                gbp.log.debug("Found nested repository in %s, adding files "
+                              "with git" % (reldir or top))
+                return None
+            dirs.append(reldir)
+            for name in subdirs[:]:
+                if os.path.islink(os.path.join(root, name)):
+                    subdirs.remove(name)
+                    names.append(name)
+            for name in names:
+                path = os.path.join(root, name)
+                if name == '.gitattributes' or '\n' in path:
+                    return None
+                mode = os.lstat(path).st_mode
+                if stat.S_ISLNK(mode):
+                    files.append((reldir, name, self.m_symlink, path))
+                elif stat.S_ISREG(mode):
+                    files.append((reldir, name,
+                                  [self.m_regular,
+                                   self.m_exec][bool(mode & stat.S_IXUSR)],
+                                  path))
+        return files, dirs
+
+    def _hash_objects(self, paths):
+        """Write files to the object database"""
+        out, err, ret = self.repo._git_inout('hash-object',
+                                             ['-w', '--no-filters',
+                                              '--stdin-paths'],
+                                             '\n'.join(paths) + '\n',
+                                             capture_stderr=True)
+        shas = out.split()
+        if ret or len(shas) != len(paths):
+            raise TreeBuilderError("Failed to hash files: %s" % err.strip())
+        return shas
+
+    def _hash_files(self, paths):
+        """Hash files using a pool of git processes"""
+        if not paths:
+            return []
+        chunk = max(self.min_chunk,
+                    (len(paths) + self.jobs * 4 - 1) / (self.jobs * 4))
+        chunks = [paths[pos:pos + chunk] for pos in range(0, len(paths),
+                                                           chunk)]
+        if len(chunks) == 1:
+            return self._hash_objects(chunks[0])
+        pool = ThreadPool(min(self.jobs, len(chunks)))
+        try:
+            results = pool.map(self._hash_objects, chunks)
+        finally:
+            pool.close()
+            pool.join()
+        return [sha for result in results for sha in result]
+
+    def _make_trees(self, dirs, files, shas):
+        """Write the trees bottom-up, return the top-level tree"""
+        entries = dict((reldir, []) for reldir in dirs)
+        for (reldir, name, mode, dummy), sha in zip(files, shas):
+            entries[reldir].append((mode, sha, name))
+
+        trees = {}
+        mktree = []
+        # Subdirectories come after their parents in os.walk() order
+        for reldir in reversed(dirs):
+            if not entries[reldir] and reldir:
+                # Git doesn't track empty directories
+                continue
+            sha = self._tree_sha1(entries[reldir])
+            trees[reldir] = sha
+            mktree.append(''.join(["%s %s %s\t%s\0" %
+                                   (mode, ['blob', 'tree'][mode == self.m_tree],
+                                    sha1, name)
+                                   for mode, sha1, name in entries[reldir]]) +
+                          '\0')
+            if reldir:
+                parent, name = os.path.split(reldir)
+                entries[parent].append((self.m_tree, sha, name))
+
+        out, err, ret = self.repo._git_inout('mktree', ['-z', '--batch'],
+                                             ''.join(mktree),
+                                             capture_stderr=True)
+        if ret or out.split() != [trees[reldir] for reldir in reversed(dirs)
+                                  if reldir in trees]:
+            raise TreeBuilderError("Failed to write trees: %s" % err.strip())
+        return trees['']
+
+    def build(self, directory):
+        """
+        Create a tree object out of a directory's content
+
+        @param directory: the directory
+        @type directory: C{str}
+        @return: the tree object's sha1 or C{None} if the tree needs to be
+            created by git itself
+        @rtype: C{str}
+        """
+        scanned = self.scan(os.path.abspath(directory))
+        if scanned is None:
+            return None
+        files, dirs = scanned
+        linkdir = tempfile.mkdtemp(prefix='gbp-links_')
+        try:
+            # Hash the symlinks' targets
+            paths = []
+            for num, (dummy, dummy, mode, path) in enumerate(files):
+                if mode == self.m_symlink:
+                    link = os.path.join(linkdir, str(num))
+                    with open(link, 'w') as target:
+                        target.write(os.readlink(path))
+                    path = link
+                paths.append(path)
+            shas = self._hash_files(paths)
+            return self._make_trees(dirs, files, shas)
+        finally:
+            shutil.rmtree(linkdir)
+
+# vim:et:ts=4:sw=4:et:sts=4:ai:set list listchars=tab\:»·,trail\:·:
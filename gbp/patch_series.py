@@ -16,12 +16,283 @@
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """Handle Patches and Patch Series"""
 
+import binascii
+import codecs
 import os
+import quopri
 import re
-import subprocess
-import tempfile
+from email.header import decode_header, make_header
+from email.message import Message
+from email.utils import parseaddr
+from multiprocessing.pool import ThreadPool
 from gbp.errors import GbpError
 
+MAIL_HEADERS = ['from', 'subject', 'date']
+MIME_HEADERS = ['content-transfer-encoding', 'content-type']
+
+
+def _is_header_line(line):
+    """
+    Check if line looks like a RFC 2822 header line
+
+    >>> _is_header_line("Subject: foo")
+    True
+    >>> _is_header_line("A line: with a colon")
+    False
+    >>> _is_header_line(": foo")
+    False
+    """
+    name = line.split(':', 1)[0]
+    if name == line or not name:
+        return False
+    return not re.search(r'[\x00-\x20\x7f-\xff]', name)
+
+
+def _is_patch_break(line):
+    """
+    Check if line marks the start of the actual diff
+
+    >>> _is_patch_break("---")
+    True
+    >>> _is_patch_break("--- a/foo")
+    True
+    >>> _is_patch_break("diff --git a/foo b/foo")
+    True
+    >>> _is_patch_break("Index: foo")
+    True
+    >>> _is_patch_break("----")
+    False
+    >>> _is_patch_break("--- ")
+    True
+    """
+    if line.startswith('diff -') or line.startswith('Index: '):
+        return True
+    if line.startswith('---'):
+        rest = line[3:].rstrip('\r\n')
+        if rest.startswith(' ') and rest[1:2] and not rest[1:2].isspace():
+            return True
+        return not rest.strip()
+    return False
+
+
+def _decode_header_value(value):
+    """
+    Unfold a header value and decode RFC 2047 encoded words into UTF-8
+
+    >>> _decode_header_value("=?UTF-8?q?J=C3=B6rg?= Foo")
+    'J\\xc3\\xb6rg Foo'
+    >>> _decode_header_value("a \\n\\tfolded\\tline ")
+    'a folded line'
+    """
+    value = re.sub(r'\s+', ' ', value).strip()
+    if '=?' in value:
+        try:
+            value = unicode(make_header(decode_header(value))).encode('utf-8')
+        except (LookupError, UnicodeError, ValueError):
+            pass
+    return value
+
+
+def _cleanup_subject(subject):
+    """
+    Strip reply and [PATCH] prefixes from a subject like I{git mailinfo}
+
+    >>> _cleanup_subject("[PATCH 2/3] Re: foo")
+    'foo'
+    >>> _cleanup_subject("[RFC PATCH v2] [foo] bar baz")
+    'bar baz'
+    >>> _cleanup_subject("Fwd: foo")
+    'Fwd: foo'
+    >>> _cleanup_subject("Remove foo")
+    'Remove foo'
+    """
+    while True:
+        stripped = re.sub(r'^([ \t:]+|[Rr][Ee]:|\[[^\]]*\])', '', subject)
+        if stripped == subject:
+            return subject.strip()
+        subject = stripped
+
+
+def _add_header(info, name, value):
+    """Add a recognized mail header to the patch info"""
+    name = name.lower()
+    value = _decode_header_value(value)
+    if name == 'from':
+        author, email = parseaddr(value)
+        if not email or '@' not in email:
+            author, email = value, ''
+        info['author'] = author.strip('"\' ') or email
+        info['email'] = email
+    elif name == 'subject':
+        info['subject'] = _cleanup_subject(value)
+    elif name == 'date':
+        info['date'] = value
+
+
+def _parse_headers(lines, info, mime=None):
+    """
+    Parse header lines into info stopping at the first non-header line
+
+    @param mime: if given, collects the MIME headers describing the body
+    @type mime: C{dict}
+    @return: the first line not belonging to the header
+    """
+    def add(name, value):
+        if name.lower() in MAIL_HEADERS:
+            _add_header(info, name, value)
+        elif mime is not None and name.lower() in MIME_HEADERS:
+            mime[name.lower()] = value.strip()
+
+    header = None
+    for line in lines:
+        if header and line[:1] in [' ', '\t'] and line.strip():
+            header[1] += line
+            continue
+        if header:
+            add(*header)
+        header = None
+        if _is_header_line(line):
+            header = line.split(':', 1)
+        else:
+            return line
+    if header:
+        add(*header)
+    return None
+
+
+def _decode_body(lines, mime):
+    """
+    Decode the body of a mail according to its MIME headers
+
+    Quoted-printable and base64 bodies are decoded and the text is
+    converted from its charset to UTF-8 like I{git mailinfo} does.
+
+    >>> list(_decode_body(["Caf=E9 is=\\n", " open\\n", "--- \\n"],
+    ...                   {'content-transfer-encoding': 'quoted-printable',
+    ...                    'content-type': 'text/plain; charset=iso-8859-1'}))
+    ['Caf\\xc3\\xa9 is open\\n', '--- \\n']
+    >>> list(_decode_body(["Rm9vCmJhcgo=\\n"],
+    ...                   {'content-transfer-encoding': 'base64'}))
+    ['Foo\\n', 'bar\\n']
+    >>> list(_decode_body(["foo\\n"], {'content-type': 'text/plain'}))
+    ['foo\\n']
+
+    @param lines: the lines of the body
+    @type lines: iterable of C{str}
+    @param mime: the MIME headers of the mail
+    @type mime: C{dict}
+    @return: the decoded lines
+    @rtype: iterator over C{str}
+    """
+    encoding = mime.get('content-transfer-encoding', '').lower()
+    msg = Message()
+    msg['Content-Type'] = mime.get('content-type', 'text/plain')
+    charset = msg.get_content_charset()
+    try:
+        recode = codecs.lookup(charset).name not in ['ascii', 'utf-8']
+    except (LookupError, TypeError):
+        recode = False
+
+    if encoding == 'base64':
+        try:
+            decoded = binascii.a2b_base64("".join(lines))
+        except binascii.Error:
+            decoded = ""
+        lines = decoded.splitlines(True)
+    elif encoding == 'quoted-printable':
+        lines = _decode_qp(lines)
+
+    for line in lines:
+        if recode:
+            line = line.decode(charset, 'replace').encode('utf-8')
+        yield line
+
+
+def _decode_qp(lines):
+    """Decode quoted-printable lines joining soft line breaks"""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if not line.rstrip('\r\n').endswith('='):
+            yield quopri.decodestring("".join(chunk))
+            chunk = []
+    if chunk:
+        yield quopri.decodestring("".join(chunk))
+
+
+def parse_mail_header(patch):
+    """
+    Parse the mail header and the long description of a patch
+
+    This mimics I{git mailinfo}: RFC 2822 headers are decoded, the subject
+    is stripped of C{[PATCH]} prefixes, in-body C{From:}, C{Subject:} and
+    C{Date:} headers override the mail headers and the description ends at
+    the start of the diff. Reading stops there, too. Quoted-printable and
+    base64 encoded bodies are decoded and converted to UTF-8.
+
+    >>> info, desc = parse_mail_header(["From: foo <foo@example.com>\\n",
+    ...                                 "Subject: [PATCH] A\\n", " subject\\n",
+    ...                                 "\\n", "\\n", "Desc\\n", "---\\n",
+    ...                                 "Subject: ignored\\n"])
+    >>> sorted(info.items())
+    [('author', 'foo'), ('email', 'foo@example.com'), ('subject', 'A subject')]
+    >>> desc
+    'Desc\\n'
+    >>> parse_mail_header(["Some text\\n", "diff -u a b\\n"])
+    ({}, 'Some text\\n')
+    >>> info, desc = parse_mail_header(["Subject: foo\\n",
+    ...                 "Content-Transfer-Encoding: base64\\n", "\\n",
+    ...         "RnJvbTogYmFyIDxiYXJAZXhhbXBsZS5jb20+CgpEZXNjCi0tLQo=\\n"])
+    >>> sorted(info.items())
+    [('author', 'bar'), ('email', 'bar@example.com'), ('subject', 'foo')]
+    >>> desc
+    'Desc\\n'
+
+    @param patch: the lines of the patch
+    @type patch: iterable of C{str}
+    @return: the patch info and its long description
+    @rtype: C{tuple} of C{dict} and C{str}
+    """
+    info = {}
+    lines = iter(patch)
+    first = next(lines, None)
+    if first is None:
+        return info, ""
+    if first.startswith('From ') and not _is_header_line(first):
+        first = next(lines, None)
+
+    mime = {}
+    if first is not None and _is_header_line(first):
+        line = _parse_headers(_chain(first, lines), info, mime)
+    else:
+        line = first
+    if mime and line is not None:
+        lines = _decode_body(_chain(line, lines), mime)
+        line = next(lines, None)
+
+    # Skip empty lines and parse in-body headers
+    while line is not None and not line.strip():
+        line = next(lines, None)
+    if line is not None and _is_header_line(line) and \
+            line.split(':', 1)[0].lower() in MAIL_HEADERS:
+        line = _parse_headers(_chain(line, lines), info)
+        while line is not None and not line.strip():
+            line = next(lines, None)
+
+    desc = []
+    while line is not None and not _is_patch_break(line):
+        desc.append(line)
+        line = next(lines, None)
+    return info, "".join(desc)
+
+
+def _chain(first, rest):
+    """Prepend a single item to an iterator"""
+    yield first
+    for item in rest:
+        yield item
+
+
 class Patch(object):
     """
     A patch in a L{PatchSeries}
@@ -43,7 +314,7 @@ class Patch(object):
         self.topic = topic
         self.strip = strip
         self.info = None
-        self.long_desc = None
+        self._long_desc = None
 
     def __repr__(self):
         repr = "<gbp.patch_series.Patch path='%s' " % self.path
@@ -58,28 +329,24 @@ class Patch(object):
         """
         Read patch information into a structured form
 
-        using I{git mailinfo}
+        The header is parsed in-process the same way I{git mailinfo}
+        would do it. Only the part of the patch preceding the actual
+        diff is read.
         """
         self.info = {}
-        body = tempfile.NamedTemporaryFile(prefix='gbp_')
-        pipe = subprocess.Popen("git mailinfo '%s' /dev/null 2>/dev/null < '%s'" %
-                                (body.name, self.path),
-                                shell=True,
-                                stdout=subprocess.PIPE).stdout
-        for line in pipe:
-            if ':' in line:
-                rfc_header, value = line.split(" ", 1)
-                header = rfc_header[:-1].lower()
-                self.info[header] = value.strip()
+        self._long_desc = ""
         try:
-            self.long_desc = "".join([ line for line in body ])
-            body.close()
+            patch = open(self.path)
+        except IOError:
+            return
+
+        try:
+            self.info, self._long_desc = parse_mail_header(patch)
         except IOError as msg:
             raise GbpError("Failed to read patch header of '%s': %s" %
-                           (self.patch, msg))
+                           (self.path, msg))
         finally:
-            if os.path.exists(body.name):
-                os.unlink(body.name)
+            patch.close()
 
     def _get_subject_from_filename(self):
         """
@@ -158,12 +425,42 @@ class Patch(object):
         """The patch's modification time"""
         return self._get_info_field('date')
 
+    @property
+    def long_desc(self):
+        """The long description of the patch"""
+        if self.info == None:
+            self._read_info()
+        return self._long_desc
+
 
 class PatchSeries(list):
     """
     A series of L{Patch}es as read from a quilt series file).
     """
 
+    def read_info(self, threads=4):
+        """
+        Read the header information of all patches in the series
+
+        The headers are parsed concurrently so the subsequent accesses
+        to the patches' attributes don't need to hit the disk.
+
+        @param threads: maximum number of threads to use
+        @type threads: C{int}
+        """
+        pending = [ patch for patch in self if patch.info == None ]
+        if len(pending) < 2 or threads < 2:
+            for patch in pending:
+                patch._read_info()
+            return
+
+        pool = ThreadPool(min(threads, len(pending)))
+        try:
+            pool.map(Patch._read_info, pending)
+        finally:
+            pool.close()
+            pool.join()
+
     @classmethod
     def read_series_file(klass, seriesfile):
         """Read a series file into L{Patch} objects"""
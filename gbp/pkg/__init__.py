@@ -17,12 +17,12 @@
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """Common functionality of the Debian/RPM package helpers"""
 
+import fnmatch
 import os
 import re
 import glob
 import stat
 import subprocess
-import zipfile
 
 import gbp.command_wrappers as gbpc
 from gbp.errors import GbpError
@@ -46,6 +46,11 @@ archive_ext_aliases = { 'tgz'   : ('tar', 'gzip'),
                         'tlz'   : ('tar', 'lzma'),
                         'txz'   : ('tar', 'xz')}
 
+class UnsupportedArchiveError(GbpError):
+    """Archive content that needs to be unpacked on disk to be imported"""
+    pass
+
+
 def parse_archive_filename(filename):
     """
     Given an filename return the basename (i.e. filename without the
@@ -251,7 +256,12 @@ class UpstreamSource(object):
     @type _path: string
     @cvar _unpacked: path to the unpacked source tree
     @type _unpacked: string
+    @cvar _prefix_cache: prefixes of archives, indexed by path, size and
+                         modification time
+    @type _prefix_cache: C{dict}
     """
+    _prefix_cache = {}
+
     def __init__(self, name, unpacked=None, pkg_policy=PkgPolicy, prefix=None):
         self._orig = False
         self._tarball = False
@@ -344,38 +354,73 @@ class UpstreamSource(object):
                 topdir_files.add(('d', split[0]))
         return topdir_files
 
+    def _list_archive(self):
+        """
+        List the type and name of the archive members, a tar archive is
+        listed as a stream and listing can be stopped at any time
+        """
+        if self._archive_fmt == 'zip':
+            import zipfile
+            archive = zipfile.ZipFile(self.path)
+            for info in archive.infolist():
+                typ = 'd' if stat.S_ISDIR(info.external_attr >> 16) else '?'
+                yield typ, info.filename
+        elif self._archive_fmt == 'tar':
+            with open(os.devnull, 'w') as devnull:
+                popen = subprocess.Popen(['tar', '-t', '-v', '-f', self.path],
+                                         stdout=subprocess.PIPE,
+                                         stderr=devnull, bufsize=-1)
+            finished = False
+            try:
+                for line in iter(popen.stdout.readline, ''):
+                    fields = line.rstrip('\n').split(None, 5)
+                    yield fields[0][0], fields[-1]
+                finished = True
+            finally:
+                if not finished:
+                    # Listing was stopped early
+                    popen.kill()
+                popen.stdout.close()
+                if popen.wait() and finished:
+                    raise GbpError("Listing tar archive content failed")
+        else:
+            raise GbpError("Unsupported archive format %s, unable to "
+                           "determine prefix for '%s'" %
+                           (self._archive_fmt, self.path))
+
     def _determine_prefix(self):
-        """Determine the prefix, i.e. the "leading directory name"""
+        """
+        Determine the prefix, i.e. the "leading directory name". Archives
+        are only listed until a second top level entry is found and the
+        result is cached for as long as the archive doesn't change.
+        """
         self._prefix = ''
         if self.is_dir():
             # For directories we presume that the prefix is just the dirname
             self._prefix = os.path.basename(self.path.rstrip('/'))
         else:
-            files = []
-            if self._archive_fmt == 'zip':
-                archive = zipfile.ZipFile(self.path)
-                for info in archive.infolist():
-                    typ = 'd' if stat.S_ISDIR(info.external_attr >> 16) else '?'
-                    files.append((typ, info.filename))
-            elif self._archive_fmt == 'tar':
-                popen = subprocess.Popen(['tar', '-t', '-v', '-f', self.path],
-                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                out, _err = popen.communicate()
-                if popen.returncode:
-                    raise GbpError("Listing tar archive content failed")
-                for line in out.splitlines():
-                    fields = line.split(None, 5)
-                    files.append((fields[0][0], fields[-1]))
-            else:
-                raise GbpError("Unsupported archive format %s, unable to "
-                               "determine prefix for '%s'" %
-                               (self._archive_fmt, self.path))
-            # Determine prefix from the archive content
-            topdir_files = self._get_topdir_files(files)
+            stat_info = os.stat(self.path)
+            key = (os.path.realpath(self.path), stat_info.st_size,
+                   stat_info.st_mtime)
+            if key in self._prefix_cache:
+                self._prefix = self._prefix_cache[key]
+                return
+            topdir_files = set()
+            members = self._list_archive()
+            try:
+                for member in members:
+                    topdir_files |= self._get_topdir_files([member])
+                    # Anything but a single directory means no prefix
+                    if len(topdir_files) > 1 or \
+                            list(topdir_files)[0][0] != 'd':
+                        break
+            finally:
+                members.close()
             if len(topdir_files) == 1:
                 typ, name = topdir_files.pop()
                 if typ == 'd':
                     self._prefix = name
+            self._prefix_cache[key] = self._prefix
 
     @property
     def archive_fmt(self):
@@ -501,12 +546,192 @@ class UpstreamSource(object):
         except gbpc.CommandExecFailed:
             # repackArchive already printed an error
             raise GbpError
-        new = type(self)(newarchive)
+        # The new archive only has the packed directory at the top level
+        prefix = None
+        patterns = [re.compile(fnmatch.translate(filt)) for filt in filters]
+        if newprefix != '' and not self._is_excluded(pack_this, patterns):
+            prefix = newprefix or pack_this
+        new = type(self)(newarchive, prefix=prefix)
         # Reuse the same unpacked dir if the content matches
         if not filters:
             new.unpacked = self.unpacked
         return new
 
+    @staticmethod
+    def _is_excluded(name, patterns):
+        """
+        Check if an archive member is excluded by filters the way
+        I{tar --exclude} does it: a pattern may match any sequence of path
+        components and excluding a directory excludes everything below it
+
+        >>> filters = lambda *args: [re.compile(fnmatch.translate(arg))
+        ...                          for arg in args]
+        >>> UpstreamSource._is_excluded('foo/debian/rules', filters('debian'))
+        True
+        >>> UpstreamSource._is_excluded('foo/debiandir', filters('debian'))
+        False
+        >>> UpstreamSource._is_excluded('foo/a/b.o', filters('*.o', 'x'))
+        True
+        >>> UpstreamSource._is_excluded('foo/a/b/c', filters('a/b'))
+        True
+        >>> UpstreamSource._is_excluded('foo/a/b', filters('a/b/'))
+        False
+
+        @param name: the member's name in the archive
+        @type name: C{str}
+        @param patterns: filters translated to regular expressions
+        @type patterns: C{list} of C{re} objects
+        @rtype: C{bool}
+        """
+        if not patterns:
+            return False
+        parts = name.rstrip('/').split('/')
+        for start in range(len(parts)):
+            for end in range(start + 1, len(parts) + 1):
+                candidate = '/'.join(parts[start:end])
+                for pattern in patterns:
+                    if pattern.match(candidate):
+                        return True
+        return False
+
+    def _strip_prefix(self, name):
+        """
+        Strip the prefix from an archive member's name the way L{unpack}
+        does, C{None} for the prefix itself
+        """
+        name = re.sub('^(?:\./)+', '', name.rstrip('/'))
+        if name in ['', '.']:
+            return None
+        if name.startswith('/') or \
+                [part for part in name.split('/') if part in ['', '.', '..']]:
+            raise UnsupportedArchiveError("Unusual file name '%s'" % name)
+        if self._prefix:
+            if name == self._prefix:
+                return None
+            if not name.startswith(self._prefix + '/'):
+                raise UnsupportedArchiveError("'%s' is outside of '%s'" %
+                                              (name, self._prefix))
+            name = name[len(self._prefix) + 1:]
+        return name
+
+    def _tar_members(self):
+        """Read the members of a tarball as a stream"""
+        import tarfile
+        popen = None
+        if self._compression:
+            if self._compression not in compressor_opts:
+                raise UnsupportedArchiveError("Unsupported compression %s" %
+                                              self._compression)
+            popen = subprocess.Popen([self._compression, '-dc', self.path],
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE)
+            fileobj = popen.stdout
+        else:
+            fileobj = open(self.path, 'rb')
+        finished = False
+        try:
+            try:
+                archive = tarfile.open(fileobj=fileobj, mode='r|')
+                for info in archive:
+                    if info.isreg():
+                        yield (info.name, 'file', info.mode, info.size,
+                               archive.extractfile(info))
+                    elif info.isdir():
+                        yield info.name, 'dir', info.mode, 0, None
+                    elif info.issym():
+                        yield info.name, 'symlink', info.mode, 0, info.linkname
+                    elif info.islnk():
+                        yield (info.name, 'hardlink', info.mode, 0,
+                               info.linkname)
+                    else:
+                        raise UnsupportedArchiveError("Unsupported type of "
+                                                      "member '%s'" % info.name)
+                # Drain the decompressor so that it terminates
+                while popen and fileobj.read(65536):
+                    pass
+            except tarfile.TarError as err:
+                raise GbpError("Reading %s failed: %s" % (self.path, err))
+            finished = True
+        finally:
+            fileobj.close()
+            if popen:
+                err = popen.stderr.read()
+                popen.stderr.close()
+                if popen.wait() and finished:
+                    raise GbpError("Decompressing %s failed: %s" %
+                                   (self.path, err.strip()))
+
+    def _zip_members(self):
+        """Read the members of a zip archive"""
+        import zipfile
+        try:
+            archive = zipfile.ZipFile(self.path)
+        except (zipfile.BadZipfile, IOError) as err:
+            raise GbpError("Reading %s failed: %s" % (self.path, err))
+        try:
+            for info in archive.infolist():
+                name = info.filename
+                if isinstance(name, unicode):
+                    name = name.encode('utf-8')
+                if info.flag_bits & 0x1:
+                    raise UnsupportedArchiveError("'%s' is encrypted" % name)
+                # Like unzip, only use the permissions of archives
+                # created on Unix
+                mode = info.external_attr >> 16 if info.create_system == 3 \
+                            else 0
+                if name.endswith('/') or stat.S_ISDIR(mode):
+                    yield name, 'dir', mode, 0, None
+                elif stat.S_ISLNK(mode):
+                    yield name, 'symlink', mode, 0, archive.read(info)
+                else:
+                    yield (name, 'file', mode or 0644, info.file_size,
+                           archive.open(info))
+        except zipfile.BadZipfile as err:
+            raise GbpError("Reading %s failed: %s" % (self.path, err))
+        finally:
+            archive.close()
+
+    def members(self, filters=None):
+        """
+        Read the content of packed upstream sources without unpacking them
+        on disk. The prefix is stripped from the file names and members
+        matching I{filters} are skipped like L{unpack} does. The data of a
+        file needs to be read before requesting the next member.
+
+        @param filters: filters to exclude files
+        @type filters: C{list} of C{str}
+        @return: name, type (I{file}, I{dir}, I{symlink} or I{hardlink}),
+            permissions, size and, depending on the type, a file object to
+            read the data from, the symlink target or the name of the
+            hardlinked file
+        @rtype: generator of C{tuple}
+        @raise UnsupportedArchiveError: the sources need to be unpacked with
+            L{unpack} instead
+        """
+        if self.is_dir():
+            raise GbpError("Cannot read members of directory %s" % self.path)
+        patterns = [re.compile(fnmatch.translate(filt))
+                    for filt in filters or []]
+        if self._archive_fmt == 'tar':
+            members = self._tar_members()
+        elif self._archive_fmt == 'zip':
+            members = self._zip_members()
+        else:
+            raise UnsupportedArchiveError("Unsupported archive format %s" %
+                                          self._archive_fmt)
+        try:
+            for name, typ, mode, size, data in members:
+                if self._is_excluded(name, patterns):
+                    continue
+                path = self._strip_prefix(name)
+                if path is None:
+                    continue
+                if typ == 'hardlink':
+                    data = self._strip_prefix(data)
+                yield path, typ, mode & 07777, size, data
+        finally:
+            members.close()
+
     @staticmethod
     def known_compressions():
         return [ args[1][-1] for args in compressor_opts.items() ]
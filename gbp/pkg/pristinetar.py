@@ -17,8 +17,71 @@
 """Handle checkin and checkout of archives from the pristine-tar branch"""
 
 import os
+import re
 import gbp.log
 from gbp.command_wrappers import Command
+from gbp.git.refindex import RefIndex
+
+
+def _bre_to_re(regexp):
+    r"""
+    Convert a basic regular expression as used by I{git log --grep} into a
+    python regular expression
+
+    >>> _bre_to_re(r'foo_1.0+dfsg\.orig\.tar\.\w\+')
+    'foo_1.0\\+dfsg\\.orig\\.tar\\.\\w+'
+    >>> _bre_to_re(r'a\(b\|c\)\{2\}(d)')
+    'a(b|c){2}\\(d\\)'
+    """
+    converted = []
+    pos = 0
+    while pos < len(regexp):
+        char = regexp[pos]
+        if char == '\\' and pos + 1 < len(regexp):
+            escaped = regexp[pos + 1]
+            if escaped in '+?{}()|':
+                converted.append(escaped)
+            else:
+                converted.append(char + escaped)
+            pos += 2
+            continue
+        converted.append('\\' + char if char in '+?{}()|' else char)
+        pos += 1
+    return ''.join(converted)
+
+
+class PristineTarIndex(RefIndex):
+    """
+    The pristine-tar commits on a branch, stored as the commit and the line
+    of the commit message naming the archive
+    """
+    name = 'pristine-tar'
+
+    def _scan(self, since, until):
+        commits = []
+        for commit, msg in self._repo.get_commits_messages(since, until):
+            for line in msg.splitlines():
+                if 'pristine-tar ' in line:
+                    commits.append((commit, line))
+        return commits
+
+    def lookup(self, archive_regexp):
+        """
+        Find the newest commit whose message names an archive matching
+        I{archive_regexp}
+
+        @param archive_regexp: archive name to look for (regexp wildcards allowed)
+        @type archive_regexp: C{str}
+        @return: the commit and the name of the archive or C{None}
+        @rtype: C{tuple} of C{str} and C{str}
+        """
+        self.update()
+        regexp = re.compile('pristine-tar .* %s' % _bre_to_re(archive_regexp))
+        for commit, line in self._commits:
+            if regexp.search(line):
+                return commit, line.split()[-1]
+        return None
+
 
 class PristineTar(Command):
     """The pristine-tar branch in a git repository"""
@@ -27,8 +90,16 @@ class PristineTar(Command):
 
     def __init__(self, repo):
         self.repo = repo
+        self._index = None
         super(PristineTar, self).__init__(self.cmd, cwd=repo.path)
 
+    @property
+    def index(self):
+        """The index of commits on the pristine-tar branch"""
+        if self._index is None:
+            self._index = PristineTarIndex(self.repo, self.branch)
+        return self._index
+
     def has_commit(self, archive_regexp):
         """
         Do we have a pristine-tar commit for package I{package} at version
@@ -47,16 +118,29 @@ class PristineTar(Command):
         @param archive_regexp: archive name to look for (regexp wildcards allowed)
         @type archive_regexp: C{str}
         """
+        found = self._lookup(archive_regexp)
+        if found:
+            gbp.log.debug("Found pristine-tar commit at '%s'" % found[0])
+            return found[0]
+        return None
+
+    def get_archive_name(self, archive_regexp):
+        """
+        Get the name of the newest archive on the pristine-tar branch
+        matching I{archive_regexp}
+
+        @param archive_regexp: archive name to look for (regexp wildcards allowed)
+        @type archive_regexp: C{str}
+        @return: the archive name or C{None} if there's no such archive
+        @rtype: C{str}
+        """
+        found = self._lookup(archive_regexp)
+        return found[1] if found else None
+
+    def _lookup(self, archive_regexp):
         if not self.repo.has_pristine_tar_branch():
             return None
-
-        regex = ('pristine-tar .* %s' % archive_regexp)
-        commits = self.repo.grep_log(regex, self.branch)
-        if commits:
-            commit = commits[-1]
-            gbp.log.debug("Found pristine-tar commit at '%s'" % commit)
-            return commit
-        return None
+        return self.index.lookup(archive_regexp)
 
     def checkout(self, archive):
         """
@@ -75,7 +159,7 @@ class PristineTar(Command):
 
         @param archive: the archive to commit
         @type archive: C{str}
-        @param upstream: the upstream branch to diff against
+        @param upstream: the upstream branch (or commit) to diff against
         @type upstream: C{str}
         """
         ref = 'refs/heads/%s' % upstream
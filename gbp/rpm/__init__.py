@@ -34,8 +34,9 @@ from gbp.patch_series import (PatchSeries, Patch)
 import gbp.log
 from gbp.pkg import (UpstreamSource, compressor_opts, parse_archive_filename)
 from gbp.rpm.policy import RpmPkgPolicy
-from gbp.rpm.linkedlist import LinkedList
+from gbp.rpm.linebuffer import LineBuffer, PendingDeletion
 from gbp.rpm.lib_rpm import librpm, get_librpm_log
+from gbp.rpm.speccache import SpecCache
 
 
 class NoSpecError(Exception):
@@ -118,9 +119,12 @@ class SpecFile(object):
             'files', 'changelog', 'triggerin', 'triggerpostin', 'triggerun',
             'triggerpostun')
 
+    # Cache for the parse results, see L{init_spec_cache}
+    cache = None
+
     def __init__(self, filename=None, filedata=None):
 
-        self._content = LinkedList()
+        self._content = LineBuffer(keyfunc=self._line_key)
 
         # Check args: only filename or filedata can be given, not both
         if filename is None and filedata is None:
@@ -134,15 +138,14 @@ class SpecFile(object):
             self.specdir = os.path.dirname(os.path.abspath(filename))
             try:
                 with open(filename) as spec_file:
-                    for line in spec_file.readlines():
-                        self._content.append(line)
+                    self._content.insert_lines(0, spec_file.readlines())
             except IOError as err:
                 raise NoSpecError("Unable to read spec file: %s" % err)
         else:
             self.specfile = None
             self.specdir = None
-            for line in filedata.splitlines():
-                self._content.append(line + '\n')
+            self._content.insert_lines(0, [line + '\n' for line in
+                                           filedata.splitlines()])
 
         # Use rpm-python to parse the spec file content
         self._filtertags = ("excludearch", "excludeos", "exclusivearch",
@@ -155,23 +158,36 @@ class SpecFile(object):
                                   'buildsuggests', 'buildsupplements',
                                   'buildenhances', 'collections',
                                   'nosource', 'nopatch')
-        self._specinfo = self._parse_filtered_spec(self._filtertags)
-
-        # Other initializations
-        source_header = self._specinfo.packages[0].header
-        self.name = source_header[librpm.RPMTAG_NAME]
-        self.upstreamversion = source_header[librpm.RPMTAG_VERSION]
-        self.release = source_header[librpm.RPMTAG_RELEASE]
-        # rpm-python returns epoch as 'long', convert that to string
-        self.epoch = str(source_header[librpm.RPMTAG_EPOCH]) \
-            if source_header[librpm.RPMTAG_EPOCH] != None else None
-        self.packager = source_header[librpm.RPMTAG_PACKAGER]
         self._tags = {}
         self._special_directives = defaultdict(list)
         self._gbp_tags = defaultdict(list)
 
-        # Parse extra info from spec file
-        self._parse_content()
+        cache_key = None
+        cached = None
+        if self.cache:
+            cache_key = self.cache.key(''.join(str(line) for line in
+                                               self._content))
+            cached = self.cache.get(cache_key)
+        if cached:
+            self._load_parsed(cached)
+        else:
+            specinfo = self._parse_filtered_spec(self._filtertags)
+            self._header = self._read_header(specinfo.packages[0].header)
+            self._rpm_sources = [tuple(src) for src in specinfo.sources]
+
+            # Parse extra info from spec file
+            self._parse_content()
+            if cache_key:
+                self.cache.put(cache_key, self._dump_parsed())
+
+        # Other initializations
+        self.name = self._header['NAME']
+        self.upstreamversion = self._header['VERSION']
+        self.release = self._header['RELEASE']
+        # rpm-python returns epoch as 'long', convert that to string
+        self.epoch = str(self._header['EPOCH']) \
+            if self._header['EPOCH'] != None else None
+        self.packager = self._header['PACKAGER']
 
         # Find 'Packager' tag. Needed to circumvent a bug in python-rpm where
         # spec.sourceHeader[librpm.RPMTAG_PACKAGER] is not reset when a new spec
@@ -181,6 +197,65 @@ class SpecFile(object):
 
         self.orig_src = self._guess_orig_file()
 
+    def _read_header(self, header):
+        """
+        Read the values of all the header tags we may need from the
+        rpm-python header of the source package
+        """
+        names = set(['NAME', 'VERSION', 'RELEASE', 'EPOCH', 'PACKAGER', 'VCS'])
+        for line in self._content:
+            match = self.tag_re.match(str(line))
+            if match:
+                names.add(match.group('name').upper())
+        values = {}
+        for name in names:
+            try:
+                values[name] = header[getattr(librpm, 'RPMTAG_%s' % name)]
+            except AttributeError:
+                pass
+        return values
+
+    def _dump_parsed(self):
+        """
+        Get the parse results in a form suitable for caching, i.e. with
+        line references replaced by line numbers
+        """
+        linenums = dict((id(line), num) for num, line in
+                        enumerate(self._content))
+        def records(recs):
+            """Replace line references in records"""
+            return [dict(rec, line=linenums[id(rec['line'])]) for rec in recs]
+
+        tags = dict((name, {'value': tag['value'],
+                            'lines': records(tag['lines'])})
+                    for name, tag in self._tags.iteritems())
+        directives = dict((name, records(recs)) for name, recs in
+                          self._special_directives.iteritems())
+        gbp_tags = dict((name, records(recs)) for name, recs in
+                        self._gbp_tags.iteritems())
+        return {'header': self._header,
+                'sources': self._rpm_sources,
+                'tags': tags,
+                'special_directives': directives,
+                'gbp_tags': gbp_tags}
+
+    def _load_parsed(self, data):
+        """Restore parse results from cached data"""
+        lines = list(self._content)
+        def records(recs):
+            """Replace line numbers in records by line references"""
+            return [dict(rec, line=lines[rec['line']]) for rec in recs]
+
+        self._header = data['header']
+        self._rpm_sources = data['sources']
+        for name, tag in data['tags'].iteritems():
+            self._tags[name] = {'value': tag['value'],
+                                'lines': records(tag['lines'])}
+        for name, recs in data['special_directives'].iteritems():
+            self._special_directives[name] = records(recs)
+        for name, recs in data['gbp_tags'].iteritems():
+            self._gbp_tags[name] = records(recs)
+
     def _parse_filtered_spec(self, skip_tags):
         """Parse a filtered spec file in rpm-python"""
         skip_tags = [tag.lower() for tag in skip_tags]
@@ -296,11 +371,7 @@ class SpecFile(object):
             tagnum = -1 if tagnum is None else tagnum
 
         # Record all tag locations
-        try:
-            header = self._specinfo.packages[0].header
-            tagvalue = header[getattr(librpm, 'RPMTAG_%s' % tagname.upper())]
-        except AttributeError:
-            tagvalue = None
+        tagvalue = self._header.get(tagname.upper())
         # We don't support "multivalue" tags like "Provides:" or "SourceX:"
         # Rpm python doesn't support many of these, thus the explicit list
         if type(tagvalue) is int or type(tagvalue) is long:
@@ -353,6 +424,51 @@ class SpecFile(object):
         arglist = args.split()
         return setupparser.parse_args(arglist)[0]
 
+    @classmethod
+    def _line_key(cls, line):
+        """
+        Get the key of a spec file line in the content index: tags are indexed
+        by name and number, '%patch' macros by patch number and sections by
+        name
+        """
+        matchobj = cls.tag_re.match(line)
+        if matchobj:
+            tagname = matchobj.group('name').lower()
+            tagnum = int(matchobj.group('num')) if matchobj.group('num') \
+                        else None
+            if tagname == 'source':
+                tagnum = 0 if tagnum is None else tagnum
+            elif tagname == 'patch':
+                tagnum = -1 if tagnum is None else tagnum
+            return ('tag', tagname, tagnum)
+
+        matchobj = cls.directive_re.match(line)
+        if matchobj:
+            directivename = matchobj.group('name')
+            if directivename in cls.section_identifiers:
+                return ('section', directivename)
+            if directivename == 'patch':
+                if matchobj.group('num'):
+                    return ('macro', 'patch', int(matchobj.group('num')))
+                opts = cls._patch_macro_opts(matchobj.group('args') or '')
+                return ('macro', 'patch',
+                        int(opts.patchnum) if opts.patchnum else -1)
+        return None
+
+    def _section_end(self, line):
+        """
+        Get the position where the section starting at the given line ends,
+        i.e. the position of the next section directive or the end of file
+        """
+        start = self._content.position(line)
+        end = len(self._content)
+        for name in self.section_identifiers:
+            for section in self._content.find(('section', name)):
+                pos = self._content.position(section)
+                if start < pos < end:
+                    end = pos
+        return end
+
     def _parse_directive(self, lineobj):
         """Parse special directive/scriptlet/macro lines"""
 
@@ -422,7 +538,7 @@ class SpecFile(object):
         # And, double-check that we parsed spec content correctly
         patches = self._patches()
         sources = self._sources()
-        for name, num, typ in self._specinfo.sources:
+        for name, num, typ in self._rpm_sources:
             # workaround rpm parsing bug
             if typ == 1 or typ == 9:
                 if num in sources:
@@ -460,6 +576,17 @@ class SpecFile(object):
             self._tags.pop(key)
         return prev
 
+    @staticmethod
+    def _format_tag(tagname, value, prev_line, next_line):
+        """Format a tag line, indented like the previous or next tag"""
+        # Try to guess the correct indentation from the previous or next tag
+        indent_re = re.compile(r'^([a-z]+([0-9]+)?\s*:\s*)', flags=re.I)
+        match = indent_re.match(str(prev_line))
+        if not match:
+            match = indent_re.match(str(next_line))
+        indent = 12 if not match else len(match.group(1))
+        return '%-*s%s\n' % (indent, '%s:' % tagname, value)
+
     def _set_tag(self, tag, num, value, insertafter):
         """Set a tag value"""
         key = tag.lower()
@@ -469,22 +596,14 @@ class SpecFile(object):
             raise GbpError("Cannot set empty value to '%s:' tag" % tag)
 
         # Check type of tag, we don't support values for 'multivalue' tags
-        try:
-            header = self._specinfo.packages[0].header
-            tagvalue = header[getattr(librpm, 'RPMTAG_%s' % tagname.upper())]
-        except AttributeError:
-            tagvalue = None
+        tagvalue = self._header.get(tagname.upper())
         tagvalue = None if type(tagvalue) is list else value
 
-        # Try to guess the correct indentation from the previous or next tag
-        indent_re = re.compile(r'^([a-z]+([0-9]+)?\s*:\s*)', flags=re.I)
-        match = indent_re.match(str(insertafter))
-        if not match:
-            match = indent_re.match(str(insertafter.next))
-        indent = 12 if not match else len(match.group(1))
-        text = '%-*s%s\n' % (indent, '%s:' % tagname, value)
+        text = self._format_tag(tagname, value, insertafter, insertafter.next)
         if key in self._tags:
             self._tags[key]['value'] = tagvalue
+        # Look up the content index first to avoid scanning all tag records
+        if key in self._tags and self._content.find(self._line_key(text)):
             for line in reversed(self._tags[key]['lines']):
                 if line['num'] == num:
                     gbp.log.debug("Updating '%s:' tag in spec" % tagname)
@@ -548,13 +667,14 @@ class SpecFile(object):
 
         updated = 0
         text = "%%%s%d %s\n" % (name, identifier, args)
-        for line in self._special_directives[key]:
-            if line['id'] == identifier:
-                gbp.log.debug("Updating '%s' macro in spec" % fullname)
-                line['args'] = args
-                line['line'].set_data(text)
-                ret = line['line']
-                updated += 1
+        if self._content.find(self._line_key(text)):
+            for line in self._special_directives[key]:
+                if line['id'] == identifier:
+                    gbp.log.debug("Updating '%s' macro in spec" % fullname)
+                    line['args'] = args
+                    line['line'].set_data(text)
+                    ret = line['line']
+                    updated += 1
         if not updated:
             gbp.log.debug("Adding '%s' macro after '%s...' line in spec" %
                           (fullname, str(insertafter)[0:20]))
@@ -574,11 +694,8 @@ class SpecFile(object):
                                "which to update" % name)
             line = self._special_directives[name][0]['line']
             gbp.log.debug("Removing content of %s section" % name)
-            while line.next:
-                match = self.directive_re.match(str(line.next))
-                if match and match.group('name') in self.section_identifiers:
-                    break
-                self._content.delete(line.next)
+            self._content.delete_range(self._content.position(line) + 1,
+                                       self._section_end(line))
         else:
             gbp.log.debug("Adding %s section to the end of spec file" % name)
             line = self._content.append('%%%s\n' % name)
@@ -586,8 +703,8 @@ class SpecFile(object):
             self._special_directives[name] = [linerec]
         # Add new lines
         gbp.log.debug("Updating content of %s section" % name)
-        for linetext in text.splitlines():
-            line = self._content.insert_after(line, linetext + '\n')
+        self._content.insert_lines_after(line, [linetext + '\n' for linetext
+                                                in text.splitlines()])
 
     def set_changelog(self, text):
         """Update or create the %changelog section"""
@@ -598,45 +715,71 @@ class SpecFile(object):
         text = ''
         if 'changelog' in self._special_directives:
             line = self._special_directives['changelog'][0]['line']
-            while line.next:
-                line = line.next
-                match = self.directive_re.match(str(line))
-                if match and match.group('name') in self.section_identifiers:
-                    break
-                text += str(line)
+            start = self._content.position(line) + 1
+            text = ''.join(str(line) for line in
+                           self._content[start:self._section_end(line)])
         return text
 
     def update_patches(self, patches, commands):
         """Update spec with new patch tags and patch macros"""
-        # Remove non-ignored patches
+        # Remove non-ignored patches. The lines are only marked for deletion
+        # first and then deleted all at once, in order to avoid quadratic
+        # behaviour with big numbers of patches
         tag_prev = None
         macro_prev = None
         ignored = self.ignorepatches
-        # Remove 'Patch:̈́' tags
-        for tag in self._patches().values():
-            if not tag['num'] in ignored:
-                tag_prev = self._delete_tag('patch', tag['num'])
+        deletion = PendingDeletion(self._content)
+        # Remove 'Patch:̈́' tags
+        tag_lines = defaultdict(list)
+        for tag in self._tags.get('patch', {'lines': []})['lines']:
+            tag_lines[tag['num']].append(tag['line'])
+        for num in self._patches():
+            if not num in ignored:
+                gbp.log.debug("Removing 'patch%s:' tag from spec" % num)
+                for line in tag_lines[num]:
+                    deletion.add(line)
+                    tag_prev = deletion.prev(line)
                 # Remove a preceding comment if it seems to originate from GBP
                 if re.match("^\s*#.*patch.*auto-generated",
                             str(tag_prev), flags=re.I):
-                    tag_prev = self._content.delete(tag_prev)
+                    deletion.add(tag_prev)
+                    tag_prev = deletion.prev(tag_prev)
+        if 'patch' in self._tags:
+            self._tags['patch']['lines'] = [tag for tag in
+                                            self._tags['patch']['lines'] if
+                                            tag['num'] in ignored]
+            if not self._tags['patch']['lines']:
+                self._tags.pop('patch')
 
         # Remove '%patch:' macros
+        macro_lines = defaultdict(list)
         for macro in self._special_directives['patch']:
-            if not macro['id'] in ignored:
-                macro_prev = self._delete_special_macro('patch', macro['id'])
+            macro_lines[macro['id']].append(macro['line'])
+        for macro in self._special_directives['patch']:
+            if not macro['id'] in ignored and macro['id'] in macro_lines:
+                gbp.log.debug("Removing '%%patch%s' macro from spec" %
+                              macro['id'])
+                for line in macro_lines.pop(macro['id']):
+                    deletion.add(line)
+                    macro_prev = deletion.prev(line)
                 # Remove surrounding if-else
-                macro_next = macro_prev.next
+                macro_next = deletion.next(macro_prev)
                 if (str(macro_prev).startswith('%if') and
                         str(macro_next).startswith('%endif')):
-                    self._content.delete(macro_next)
-                    macro_prev = self._content.delete(macro_prev)
+                    deletion.add(macro_next)
+                    deletion.add(macro_prev)
+                    macro_prev = deletion.prev(macro_prev)
 
                 # Remove a preceding comment line if it ends with '.patch' or
                 # '.diff' plus an optional compression suffix
                 if re.match("^\s*#.+(patch|diff)(\.(gz|bz2|xz|lzma))?\s*$",
                             str(macro_prev), flags=re.I):
-                    macro_prev = self._content.delete(macro_prev)
+                    deletion.add(macro_prev)
+                    macro_prev = deletion.prev(macro_prev)
+        self._special_directives['patch'] = [macro for macro in
+                                             self._special_directives['patch']
+                                             if macro['id'] in ignored]
+        deletion.commit()
 
         if len(patches) == 0:
             return
@@ -683,25 +826,45 @@ class SpecFile(object):
         startnum = sorted(ignored)[-1] + 1 if ignored else 0
         gbp.log.debug("Starting autoupdate patch numbering from %s" % startnum)
         # Add a comment indicating gbp generated patch tags
-        comment_text = "# Patches auto-generated by git-buildpackage:\n"
-        tag_line = self._content.insert_after(tag_line, comment_text)
+        tag_texts = ["# Patches auto-generated by git-buildpackage:\n"]
+        macro_texts = []
+        macro_pos = []
+        tag_next = tag_line.next
         for ind, patch in enumerate(patches):
             cmds = commands[patch] if patch in commands else {}
             patchnum = startnum + ind
-            tag_line = self._set_tag("Patch", patchnum, patch, tag_line)
+            tag_texts.append(self._format_tag("Patch%d" % patchnum, patch,
+                                              tag_texts[-1], tag_next))
             # Add '%patch' macro and a preceding comment line
-            comment_text = "# %s\n" % patch
-            macro_line = self._content.insert_after(macro_line, comment_text)
-            macro_line = self._set_special_macro('patch', patchnum, '-p1',
-                                                 macro_line)
+            macro_texts.append("# %s\n" % patch)
+            macro_text = "%%patch%d -p1\n" % patchnum
             for cmd, args in cmds.iteritems():
                 if cmd in ('if', 'ifarch'):
-                    self._content.insert_before(macro_line, '%%%s %s\n' %
-                                                (cmd, args))
-                    macro_line = self._content.insert_after(macro_line,
-                                                            '%endif\n')
+                    macro_texts.append('%%%s %s\n' % (cmd, args))
+                    macro_pos.append(len(macro_texts))
+                    macro_texts.extend([macro_text, '%endif\n'])
                     # We only support one command per patch, for now
                     break
+            else:
+                macro_pos.append(len(macro_texts))
+                macro_texts.append(macro_text)
+
+        new_tags = self._content.insert_lines_after(tag_line, tag_texts)
+        new_macros = self._content.insert_lines_after(macro_line, macro_texts)
+        if 'patch' not in self._tags:
+            self._tags['patch'] = {'value': None, 'lines': []}
+        for ind, patch in enumerate(patches):
+            patchnum = startnum + ind
+            tagvalue = self._header.get('PATCH%d' % patchnum)
+            self._tags['patch']['value'] = None if type(tagvalue) is list \
+                                                else patch
+            self._tags['patch']['lines'].append({'line': new_tags[ind + 1],
+                                                 'num': patchnum,
+                                                 'linevalue': patch})
+            self._special_directives['patch'].append(
+                    {'line': new_macros[macro_pos[ind]],
+                     'id': patchnum,
+                     'args': '-p1'})
 
     def patchseries(self, unapplied=False, ignored=False):
         """Return non-ignored patches of the RPM as a gbp patchseries"""
@@ -799,6 +962,18 @@ class SpecFile(object):
         return orig
 
 
+def init_spec_cache(repo):
+    """
+    Cache the parse results of spec files under the git dir of I{repo}.
+    Parsing the same spec content again then only costs a cache lookup.
+
+    @param repo: the repository
+    @type repo: L{GitRepository}
+    """
+    SpecFile.cache = SpecCache(os.path.join(repo.git_dir, 'gbp',
+                                            'spec-cache'))
+
+
 def parse_srpm(srpmfile):
     """parse srpm by creating a SrcRpmFile object"""
     try:
@@ -847,30 +1022,84 @@ def guess_spec(topdir, recursive=True, preferred_name=None):
     return SpecFile(os.path.abspath(guess_spec_fn(file_list, preferred_name)))
 
 
-def guess_spec_repo(repo, treeish, topdir='', recursive=True, preferred_name=None):
+# Spec file locations found by locate_spec_repo(), by tree
+_spec_locations = {}
+
+
+def locate_spec_repo(repo, treeish, topdir='', recursive=True,
+                     preferred_name=None):
     """
-    Try to find/parse the spec file from a given git treeish.
+    Find the spec file from a given git treeish. Directories are read
+    level by level, with all directories of a level at once, and the
+    search stops at the shallowest level that has any spec file. Spec
+    files on deeper levels are only looked at if that level has several
+    of them and none of them has the preferred name. Results are cached
+    per tree.
+
+    @return: path and blob sha1 of the spec file
+    @rtype: C{tuple} of C{str}
     """
-    topdir = topdir.rstrip('/') + ('/') if topdir else ''
+    topdir = topdir.strip('/')
     try:
-        file_list = [nam for (mod, typ, sha, nam) in
-                    repo.list_tree(treeish, recursive, topdir) if typ == 'blob']
+        tree = repo.batch_check_objects(['%s:%s' % (treeish, topdir)])[0]
+        if tree is None or tree[1] != 'tree':
+            raise NoSpecError("Cannot find spec file from treeish %s, no "
+                              "such directory '%s'" % (treeish, topdir))
+        cache_key = (tree[0], topdir, recursive, preferred_name)
+        if cache_key not in _spec_locations:
+            prefix = topdir + '/' if topdir else ''
+            level = [(prefix, tree[0])]
+            specs = []
+            while level:
+                contents = repo.batch_list_trees([sha for _, sha in level])
+                subtrees = []
+                for (path, _), content in zip(level, contents):
+                    for _mode, typ, sha, name in content:
+                        if typ == 'blob' and (name == preferred_name or
+                                              name.endswith('.spec')):
+                            specs.append((path + name, sha))
+                        elif typ == 'tree' and recursive:
+                            subtrees.append((path + name + '/', sha))
+                level = subtrees
+                names = [os.path.basename(path) for path, _ in specs]
+                if len(specs) == 1 or (specs and preferred_name in names):
+                    break
+            # Same order as a recursive ls-tree
+            spec_path = guess_spec_fn(sorted([path for path, _ in specs]),
+                                      preferred_name)
+            _spec_locations[cache_key] = (spec_path, dict(specs)[spec_path])
     except GitRepositoryError as err:
         raise NoSpecError("Cannot find spec file from treeish %s, Git error: %s"
                             % (treeish, err))
-    spec_path = guess_spec_fn(file_list, preferred_name)
-    return spec_from_repo(repo, treeish, spec_path)
+    return _spec_locations[cache_key]
+
+
+def guess_spec_repo(repo, treeish, topdir='', recursive=True, preferred_name=None):
+    """
+    Try to find/parse the spec file from a given git treeish.
+    """
+    spec_path, blob = locate_spec_repo(repo, treeish, topdir, recursive,
+                                       preferred_name)
+    return _spec_from_object(repo, blob, spec_path)
 
 
 def spec_from_repo(repo, treeish, spec_path):
     """Get and parse a spec file from a give Git treeish"""
+    return _spec_from_object(repo, '%s:%s' % (treeish, spec_path), spec_path)
+
+
+def _spec_from_object(repo, obj, spec_path):
+    """Parse a spec file from a Git blob"""
     try:
-        spec = SpecFile(filedata=repo.show('%s:%s' % (treeish, spec_path)))
-        spec.specdir = os.path.dirname(spec_path)
-        spec.specfile = os.path.basename(spec_path)
-        return spec
+        blob = repo.batch_read_objects([obj])[0]
     except GitRepositoryError as err:
         raise NoSpecError("Git error: %s" % err)
+    if blob is None or blob[1] != 'blob':
+        raise NoSpecError("Git error: can't get %s" % obj)
+    spec = SpecFile(filedata=blob[2])
+    spec.specdir = os.path.dirname(spec_path)
+    spec.specfile = os.path.basename(spec_path)
+    return spec
 
 
 def string_to_int(val_str):
@@ -16,6 +16,7 @@
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """An RPM Changelog"""
 
+import collections
 import datetime
 import re
 
@@ -112,18 +113,83 @@ class _ChangelogSection(object):
         return entry
 
 
+class _ChangelogSections(collections.MutableSequence):
+    """
+    The sections of an RPM changelog. Sections are split out from the raw
+    changelog text lazily, only when they are accessed. Sections that have
+    not been accessed are written back verbatim.
+    """
+
+    def __init__(self, text='', section_re=None):
+        """
+        @param text: raw changelog text
+        @type text: C{str}
+        @param section_re: regular expression matching section headers
+        @type section_re: C{RegexObject}
+        """
+        if text and not text.endswith('\n'):
+            text += '\n'
+        self._text = text
+        # Start of the text not yet split into sections
+        self._pos = 0
+        self._sections = []
+        if text:
+            self._headers = section_re.finditer(text, 1)
+
+    def _split(self, index=None):
+        """Split out sections up to the given index, or all sections"""
+        while self._pos < len(self._text) and (index is None or
+                                               len(self._sections) <= index):
+            match = next(self._headers, None)
+            end = match.start() if match else len(self._text)
+            self._sections.append(self._text[self._pos:end])
+            self._pos = end
+
+    def _split_for(self, index):
+        """Split out sections needed for accessing an index"""
+        if isinstance(index, slice) or index < 0:
+            self._split()
+        else:
+            self._split(index)
+
+    def __getitem__(self, index):
+        self._split_for(index)
+        return self._sections[index]
+
+    def __setitem__(self, index, value):
+        self._split_for(index)
+        self._sections[index] = value
+
+    def __delitem__(self, index):
+        self._split_for(index)
+        del self._sections[index]
+
+    def __len__(self):
+        self._split()
+        return len(self._sections)
+
+    def __nonzero__(self):
+        return bool(self._sections) or self._pos < len(self._text)
+
+    def insert(self, index, value):
+        self._split_for(index - 1 if index > 0 else index)
+        self._sections.insert(index, value)
+
+    def __str__(self):
+        return ''.join([str(section) for section in self._sections] +
+                       [self._text[self._pos:]])
+
+
 class Changelog(object):
     """An RPM changelog"""
 
-    def __init__(self, pkgpolicy):
+    def __init__(self, pkgpolicy, sections=None):
         self._pkgpolicy = pkgpolicy
-        self.sections = []
+        self.sections = sections if sections is not None else \
+                            _ChangelogSections()
 
     def __str__(self):
-        string = ""
-        for section in self.sections:
-            string += str(section)
-        return string
+        return str(self.sections)
 
     def create_entry(self, *args, **kwargs):
         """Create and return new entry object"""
@@ -148,21 +214,15 @@ class ChangelogParser(object):
         self.body_name_re = pkgpolicy.Changelog.body_name_re
 
     def raw_parse_string(self, string):
-        """Parse changelog - only splits out raw changelog sections."""
-        changelog = Changelog(self._pkgpolicy)
-        ch_section = ""
-        for line in string.splitlines():
-            if re.match(self.section_match_re, line, re.M | re.S):
-                if ch_section:
-                    changelog.sections.append(ch_section)
-                ch_section = line + '\n'
-            elif ch_section:
-                ch_section += line + '\n'
-            else:
-                raise ChangelogError("First line in changelog is invalid")
-        if ch_section:
-            changelog.sections.append(ch_section)
-        return changelog
+        """
+        Parse changelog - only splits out raw changelog sections. Sections
+        are split lazily, when accessed.
+        """
+        section_re = re.compile(self.section_match_re, re.M | re.S)
+        if string and not section_re.match(string):
+            raise ChangelogError("First line in changelog is invalid")
+        return Changelog(self._pkgpolicy,
+                         _ChangelogSections(string, section_re))
 
     def raw_parse_file(self, changelog):
         """Parse changelog file - only splits out raw changelog sections."""
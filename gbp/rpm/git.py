@@ -44,10 +44,8 @@ class RpmGitRepository(GitRepository):
             tag = self.version_to_tag(format, str_fields)
         except KeyError:
             return None
-        if self.has_tag(tag): # new tags are injective
-            # dereference to a commit object
-            return self.rev_parse("%s^0" % tag)
-        return None
+        # new tags are injective
+        return self.get_tag_commit(tag)
 
     @staticmethod
     def version_to_tag(format, str_fields):
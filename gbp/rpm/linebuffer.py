@@ -0,0 +1,424 @@
+# vim: set fileencoding=utf-8 :
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""Array-backed buffer of text lines with line indexes"""
+
+import collections
+
+import gbp.log
+
+
+class Line(object):
+    """
+    A line stored in a L{LineBuffer}. Line objects stay valid as references
+    to the line while the buffer is modified around them.
+    """
+    __slots__ = ('_data', '_buffer', '_pos', '_key')
+
+    def __init__(self, data="", buf=None):
+        self._data = data
+        self._buffer = buf
+        self._pos = -1
+        self._key = None
+
+    def __str__(self):
+        return str(self.data)
+
+    @property
+    def data(self):
+        """Get data stored into the line"""
+        if self._data is None:
+            gbp.log.debug("BUG: referencing a deleted line!")
+            return("")
+        return self._data
+
+    def set_data(self, data):
+        """
+        Set data stored into the line
+
+        >>> line = Line('foo')
+        >>> line.data
+        'foo'
+        >>> line.set_data('bar')
+        >>> line.data
+        'bar'
+        >>> line.set_data(None)
+        >>> line.data
+        ''
+        """
+        if data is None:
+            gbp.log.debug("BUG: trying to store 'None', not allowed")
+            data = ""
+        if self._buffer is not None:
+            self._buffer._unindex(self)
+            self._data = data
+            self._buffer._index_line(self)
+        else:
+            self._data = data
+
+    @property
+    def prev(self):
+        """The previous line in the buffer, C{None} for the first line"""
+        if self._buffer is None:
+            return None
+        return self._buffer._neighbour(self, -1)
+
+    @property
+    def next(self):
+        """The next line in the buffer, C{None} for the last line"""
+        if self._buffer is None:
+            return None
+        return self._buffer._neighbour(self, 1)
+
+
+class LineBuffer(collections.Iterable):
+    """
+    Lines of text stored in a Python list. Line positions are maintained
+    lazily, i.e. they are renumbered only when needed after an insertion or
+    deletion. Multiple lines can be inserted or deleted in one go at the cost
+    of a single list operation.
+
+    An optional key function is used to maintain an index of the lines: it
+    is called with the data of each line and the line is indexed under the
+    returned key (lines for which C{None} is returned are not indexed). The
+    index is kept up-to-date when lines are inserted, deleted or changed.
+
+    @ivar _lines: the lines
+    @type _lines: C{list} of L{Line}
+    @ivar _stale: position from which line positions need to be renumbered
+    @type _stale: C{int}
+    """
+
+    def __init__(self, lines=None, keyfunc=None):
+        self._lines = []
+        self._stale = 0
+        self._keyfunc = keyfunc
+        self._index = collections.defaultdict(list)
+        if lines:
+            self.insert_lines(0, lines)
+
+    def __iter__(self):
+        return iter(self._lines)
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __getitem__(self, pos):
+        return self._lines[pos]
+
+    @property
+    def first(self):
+        """Get the first line of the buffer"""
+        return self._lines[0] if self._lines else None
+
+    @property
+    def last(self):
+        """Get the last line of the buffer"""
+        return self._lines[-1] if self._lines else None
+
+    def _renumber(self):
+        """Update the positions of lines after the last modification"""
+        lines = self._lines
+        for pos in xrange(self._stale, len(lines)):
+            lines[pos]._pos = pos
+        self._stale = len(lines)
+
+    def position(self, line):
+        """
+        Get the position of a line in the buffer
+
+        >>> buf = LineBuffer(['foo', 'bar'])
+        >>> buf.position(buf[1])
+        1
+        >>> line = buf.prepend('baz')
+        >>> buf.position(buf.last)
+        2
+        """
+        if line._buffer is not self:
+            raise ValueError("Line not in buffer")
+        if not 0 <= line._pos < self._stale:
+            self._renumber()
+        return line._pos
+
+    def _neighbour(self, line, offset):
+        """Get the line at an offset from the given line"""
+        pos = self.position(line) + offset
+        if 0 <= pos < len(self._lines):
+            return self._lines[pos]
+        return None
+
+    def _index_line(self, line):
+        """Add a line to the index"""
+        if self._keyfunc:
+            line._key = self._keyfunc(line._data)
+            if line._key is not None:
+                self._index[line._key].append(line)
+
+    def _unindex(self, line):
+        """Remove a line from the index"""
+        if line._key is not None:
+            self._index[line._key].remove(line)
+            if not self._index[line._key]:
+                del self._index[line._key]
+            line._key = None
+
+    def find(self, key):
+        """
+        Get all lines indexed under a key
+
+        >>> buf = LineBuffer(['a1', 'b1', 'a2'], keyfunc=lambda data: data[0])
+        >>> [str(line) for line in buf.find('a')]
+        ['a1', 'a2']
+        >>> buf.last.set_data('b2')
+        >>> [str(line) for line in buf.find('b')]
+        ['b1', 'b2']
+        >>> buf.find('c')
+        []
+
+        @param key: the index key
+        @return: the lines in buffer order
+        @rtype: C{list} of L{Line}
+        """
+        if key not in self._index:
+            return []
+        return sorted(self._index[key], key=self.position)
+
+    def insert_lines(self, pos, datas):
+        """
+        Insert lines into a position in the buffer
+
+        >>> buf = LineBuffer(['foo'])
+        >>> [str(line) for line in buf.insert_lines(0, ['bar', 'baz'])]
+        ['bar', 'baz']
+        >>> [str(line) for line in buf]
+        ['bar', 'baz', 'foo']
+
+        @return: the new lines
+        @rtype: C{list} of L{Line}
+        """
+        new = [Line(data, self) for data in datas]
+        for line in new:
+            self._index_line(line)
+        self._lines[pos:pos] = new
+        self._stale = min(self._stale, pos)
+        return new
+
+    def insert_lines_after(self, line, datas):
+        """
+        Insert lines after a line, or to the beginning of the buffer if
+        C{line} is C{None}
+
+        >>> buf = LineBuffer(['foo', 'bar'])
+        >>> lines = buf.insert_lines_after(buf.first, ['baz', 'qux'])
+        >>> [str(line) for line in buf]
+        ['foo', 'baz', 'qux', 'bar']
+        """
+        pos = self.position(line) + 1 if line is not None else 0
+        return self.insert_lines(pos, datas)
+
+    def prepend(self, data):
+        """
+        Insert to the beginning of the buffer
+
+        >>> buf = LineBuffer()
+        >>> [str(data) for data in buf]
+        []
+        >>> line = buf.prepend("foo")
+        >>> len(buf)
+        1
+        >>> line = buf.prepend("bar")
+        >>> [str(data) for data in buf]
+        ['bar', 'foo']
+        """
+        return self.insert_lines(0, [data])[0]
+
+    def append(self, data):
+        """
+        Insert to the end of the buffer
+
+        >>> buf = LineBuffer()
+        >>> line = buf.append('foo')
+        >>> len(buf)
+        1
+        >>> line = buf.append('bar')
+        >>> [str(data) for data in buf]
+        ['foo', 'bar']
+        """
+        return self.insert_lines(len(self._lines), [data])[0]
+
+    def insert_before(self, line, data=""):
+        """
+        Insert before a line
+
+        >>> buf = LineBuffer()
+        >>> line1 = buf.append('foo')
+        >>> line2 = buf.insert_before(line1, 'bar')
+        >>> line3 = buf.insert_before(line1, 'baz')
+        >>> [str(data) for data in buf]
+        ['bar', 'baz', 'foo']
+        """
+        return self.insert_lines(self.position(line), [data])[0]
+
+    def insert_after(self, line, data=""):
+        """
+        Insert after a line
+
+        >>> buf = LineBuffer()
+        >>> line1 = buf.prepend('foo')
+        >>> line2 = buf.insert_after(line1, 'bar')
+        >>> line3 = buf.insert_after(line1, 'baz')
+        >>> [str(data) for data in buf]
+        ['foo', 'baz', 'bar']
+        """
+        return self.insert_lines(self.position(line) + 1, [data])[0]
+
+    def _release(self, line):
+        """Detach a deleted line from the buffer"""
+        self._unindex(line)
+        line._buffer = None
+        line._data = None
+
+    def delete(self, line):
+        """
+        Delete a line
+
+        >>> buf = LineBuffer()
+        >>> line1 = buf.prepend('foo')
+        >>> line2 = buf.insert_after(line1, 'bar')
+        >>> line3 = buf.insert_before(line2, 'baz')
+        >>> [str(data) for data in buf]
+        ['foo', 'baz', 'bar']
+        >>> str(buf.delete(line3))
+        'foo'
+        >>> [str(data) for data in buf]
+        ['foo', 'bar']
+        >>> print "%s" % line3
+        <BLANKLINE>
+        >>> str(buf.delete(line1))
+        'bar'
+        >>> [str(data) for data in buf]
+        ['bar']
+        >>> buf.delete(line2)
+        >>> [str(data) for data in buf]
+        []
+
+        @return: the previous line, or the new first line if the first line
+            was deleted
+        @rtype: L{Line}
+        """
+        pos = self.position(line)
+        del self._lines[pos]
+        self._release(line)
+        self._stale = min(self._stale, pos)
+        if pos > 0:
+            return self._lines[pos - 1]
+        return self.first
+
+    def delete_lines(self, lines):
+        """
+        Delete multiple lines
+
+        >>> buf = LineBuffer(['foo', 'bar', 'baz', 'qux'])
+        >>> buf.delete_lines([buf[2], buf[0]])
+        >>> [str(data) for data in buf]
+        ['bar', 'qux']
+        """
+        if not lines:
+            return
+        positions = set(self.position(line) for line in lines)
+        for line in lines:
+            self._release(line)
+        start = min(positions)
+        self._lines[start:] = [line for pos, line in
+                               enumerate(self._lines[start:], start)
+                               if pos not in positions]
+        self._stale = min(self._stale, start)
+
+    def delete_range(self, start, stop):
+        """
+        Delete lines from position C{start} up to, but not including, C{stop}
+
+        >>> buf = LineBuffer(['foo', 'bar', 'baz', 'qux'])
+        >>> buf.delete_range(1, 3)
+        >>> [str(data) for data in buf]
+        ['foo', 'qux']
+        """
+        for line in self._lines[start:stop]:
+            self._release(line)
+        del self._lines[start:stop]
+        self._stale = min(self._stale, start)
+
+
+
+class PendingDeletion(object):
+    """
+    Lines marked for deletion from a L{LineBuffer}. The neighbours of the
+    marked lines are looked up as if the lines were already deleted, but the
+    actual deletion is done in one go by L{commit}.
+
+    >>> buf = LineBuffer(['foo', 'bar', 'baz', 'qux'])
+    >>> deletion = PendingDeletion(buf)
+    >>> deletion.add(buf[1])
+    >>> deletion.add(buf[2])
+    >>> str(deletion.prev(buf[2]))
+    'foo'
+    >>> str(deletion.next(buf[0]))
+    'qux'
+    >>> deletion.commit()
+    >>> [str(data) for data in buf]
+    ['foo', 'qux']
+    """
+
+    def __init__(self, buf):
+        self._buffer = buf
+        self._lines = []
+        # Links skipping over marked lines, (previous, next)
+        self._skip = ({}, {})
+
+    def add(self, line):
+        """Mark a line for deletion"""
+        pos = self._buffer.position(line)
+        if pos not in self._skip[0]:
+            self._skip[0][pos] = pos - 1
+            self._skip[1][pos] = pos + 1
+            self._lines.append(line)
+
+    def _unmarked(self, pos, skip):
+        """Follow (and shorten) the links over marked lines"""
+        path = []
+        while pos in skip:
+            path.append(pos)
+            pos = skip[pos]
+        for marked in path:
+            skip[marked] = pos
+        if 0 <= pos < len(self._buffer):
+            return self._buffer[pos]
+        return None
+
+    def prev(self, line):
+        """Get the closest preceding line that is not marked for deletion"""
+        return self._unmarked(self._buffer.position(line) - 1, self._skip[0])
+
+    def next(self, line):
+        """Get the closest following line that is not marked for deletion"""
+        return self._unmarked(self._buffer.position(line) + 1, self._skip[1])
+
+    def commit(self):
+        """Delete the marked lines from the buffer"""
+        self._buffer.delete_lines(self._lines)
+        self._lines = []
+        self._skip = ({}, {})
+
+# vim:et:ts=4:sw=4:et:sts=4:ai:set list listchars=tab\:»·,trail\:·:
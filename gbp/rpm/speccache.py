@@ -0,0 +1,177 @@
+# vim: set fileencoding=utf-8 :
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""Cache for parsed spec files"""
+
+import cPickle as pickle
+import glob
+import hashlib
+import os
+import tempfile
+
+import gbp.log
+from gbp.rpm.lib_rpm import librpm
+
+# Bump this whenever the format of the cached data changes
+CACHE_VERSION = 1
+
+
+def macro_env_fingerprint():
+    """
+    Fingerprint of the rpm macro environment, i.e. the rpm library version
+    and the macro files rpm reads. Parse results depend on these.
+
+    @return: the fingerprint
+    @rtype: C{str}
+    """
+    parts = [librpm.__name__, getattr(librpm, '__version__', '')]
+    try:
+        configdir = librpm.expandMacro('%{_rpmconfigdir}')
+    except Exception:
+        configdir = '/usr/lib/rpm'
+    patterns = [os.path.join(configdir, 'macros*'),
+                os.path.join(configdir, 'macros.d', '*'),
+                os.path.join(configdir, 'platform', '*', 'macros'),
+                '/etc/rpm/macros*',
+                os.path.expanduser('~/.rpmmacros')]
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            parts.append('%s:%d:%d' % (path, stat.st_mtime, stat.st_size))
+    return hashlib.sha1('\n'.join(parts)).hexdigest()
+
+
+class SpecCache(object):
+    """
+    On-disk cache of parsed spec file data, keyed by the spec content and
+    the rpm macro environment
+
+    Entries are touched when read and the least recently used ones are
+    removed when storing new data would exceed I{max_entries}.
+
+    @ivar path: directory holding the cache entries
+    @type path: C{str}
+    @ivar max_entries: maximum number of entries kept
+    @type max_entries: C{int}
+    """
+    _macro_env = None
+    max_entries = 256
+
+    def __init__(self, path, max_entries=None):
+        self.path = path
+        if max_entries is not None:
+            self.max_entries = max_entries
+
+    @classmethod
+    def macro_env(cls):
+        """The (memoized) rpm macro environment fingerprint"""
+        if cls._macro_env is None:
+            cls._macro_env = macro_env_fingerprint()
+        return cls._macro_env
+
+    def key(self, content):
+        """
+        Get the cache key of spec content
+
+        @param content: the spec file content
+        @type content: C{str}
+        """
+        return hashlib.sha1('%d\n%s\n%s' % (CACHE_VERSION, self.macro_env(),
+                                            content)).hexdigest()
+
+    def _entry_path(self, key):
+        """Path of the cache entry"""
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def get(self, key):
+        """
+        Get cached data
+
+        @return: the cached data or C{None} if not found
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'rb') as entry:
+                data = pickle.load(entry)
+        except (IOError, EOFError, pickle.UnpicklingError, ValueError,
+                AttributeError, ImportError, IndexError) as err:
+            if not isinstance(err, IOError):
+                gbp.log.debug("Ignoring corrupt spec cache entry %s" % key)
+            return None
+        try:
+            os.utime(entry_path, None)
+        except OSError:
+            pass
+        return data
+
+    def _entries(self):
+        """
+        List the cache entries
+
+        @return: modification time and path of the entries
+        @rtype: C{list} of C{tuple}
+        """
+        entries = []
+        try:
+            subdirs = os.listdir(self.path)
+        except OSError:
+            return entries
+        for subdir in subdirs:
+            subdir = os.path.join(self.path, subdir)
+            try:
+                names = os.listdir(subdir)
+            except OSError:
+                continue
+            for name in names:
+                if name.startswith('.tmp'):
+                    continue
+                path = os.path.join(subdir, name)
+                try:
+                    entries.append((os.stat(path).st_mtime, path))
+                except OSError:
+                    continue
+        return entries
+
+    def prune(self):
+        """Remove the least recently used entries exceeding I{max_entries}"""
+        entries = self._entries()
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for dummy, path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.unlink(path)
+            except OSError as err:
+                gbp.log.debug("Failed to remove spec cache entry: %s" % err)
+
+    def put(self, key, data):
+        """Store data into the cache, failures are not fatal"""
+        entry_path = self._entry_path(key)
+        try:
+            if not os.path.exists(os.path.dirname(entry_path)):
+                os.makedirs(os.path.dirname(entry_path))
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path),
+                                            prefix='.tmp')
+            with os.fdopen(fd, 'wb') as entry:
+                pickle.dump(data, entry, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_path, entry_path)
+        except (IOError, OSError) as err:
+            gbp.log.debug("Failed to write spec cache entry: %s" % err)
+        self.prune()
+
+# vim:et:ts=4:sw=4:et:sts=4:ai:set list listchars=tab\:»·,trail\:·:
@@ -315,14 +315,13 @@ def guess_comp_type(repo, comp_type, cp, tarball_dir):
             else:
                 comp_type = 'gzip'
         else:
-            regex = 'pristine-tar .* %s_%s\.orig.tar\.' % (srcpkg, upstream_version)
-            commits = repo.grep_log(regex, repo.pristine_tar_branch)
-            if commits:
-                commit = commits[-1]
-                gbp.log.debug("Found pristine-tar commit at '%s'" % commit)
+            regex = '%s_%s\.orig.tar\.' % (srcpkg, upstream_version)
+            tarball = repo.pristine_tar.get_archive_name(regex)
+            if tarball:
+                gbp.log.debug("Found pristine-tar data for '%s'" % tarball)
             else:
                 commit = repo.pristine_tar_branch
-            tarball = repo.get_commit_info(commit)['subject']
+                tarball = repo.get_commit_info(commit)['subject']
             (base_name, archive_fmt, comp_type) = parse_archive_filename(tarball)
             gbp.log.debug("Determined compression type '%s'" % comp_type)
             if not comp_type:
@@ -210,11 +210,12 @@ def dump_meta(cfg_data, options, repo, treeish, dump_dir):
     return BBFile(full_path, cfg_data)
 
 
-def build_parser(name, prefix=None, git_treeish=None):
+def build_parser(name, prefix=None, git_treeish=None, repo=None):
     """Create command line parser"""
     try:
         parser = GbpOptionParserBB(command=os.path.basename(name),
-                                   prefix=prefix, git_treeish=git_treeish)
+                                   prefix=prefix, git_treeish=git_treeish,
+                                   repo=repo)
     except ConfigParser.ParsingError, err:
         gbp.log.err(err)
         return None
@@ -325,7 +326,7 @@ def build_parser(name, prefix=None, git_treeish=None):
     export_group.add_config_file_option("bb-vcs-info", dest="bb_vcs_info")
     return parser
 
-def parse_args(argv, prefix, git_treeish=None):
+def parse_args(argv, prefix, git_treeish=None, repo=None):
     """Parse config and command line arguments"""
     args = [arg for arg in argv[1:] if arg.find('--%s' % prefix) == 0]
     builder_args = [arg for arg in argv[1:] if arg.find('--%s' % prefix) == -1]
@@ -335,7 +336,8 @@ def parse_args(argv, prefix, git_treeish=None):
         if arg in builder_args:
             args.append(arg)
 
-    parser = build_parser(argv[0], prefix=prefix, git_treeish=git_treeish)
+    parser = build_parser(argv[0], prefix=prefix, git_treeish=git_treeish,
+                          repo=repo)
     if not parser:
         return None, None, None
     options, args = parser.parse_args(args)
@@ -383,7 +385,7 @@ def main(argv):
         return 1
     # Re-parse config options with using the per-tree config file(s) from the
     # exported tree-ish
-    options, gbp_args, builder_args = parse_args(argv, prefix, tree)
+    options, gbp_args, builder_args = parse_args(argv, prefix, tree, repo)
 
     branch = get_current_branch(repo)
 
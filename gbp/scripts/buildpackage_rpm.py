@@ -377,7 +377,7 @@ def disable_hooks(options):
             setattr(options, hook, '')
 
 
-def parse_args(argv, prefix, git_treeish=None):
+def parse_args(argv, prefix, git_treeish=None, repo=None):
     """Parse config and command line arguments"""
     args = [ arg for arg in argv[1:] if arg.find('--%s' % prefix) == 0 ]
     builder_args = [ arg for arg in argv[1:] if arg.find('--%s' % prefix) == -1 ]
@@ -389,7 +389,8 @@ def parse_args(argv, prefix, git_treeish=None):
 
     try:
         parser = GbpOptionParserRpm(command=os.path.basename(argv[0]),
-                                    prefix=prefix, git_treeish=git_treeish)
+                                    prefix=prefix, git_treeish=git_treeish,
+                                    repo=repo)
     except ConfigParser.ParsingError, err:
         gbp.log.err(err)
         return None, None, None
@@ -529,6 +530,7 @@ def main(argv):
     except GitRepositoryError:
         gbp.log.err("%s is not a git repository" % (os.path.abspath('.')))
         return 1
+    rpm.init_spec_cache(repo)
 
     # Determine tree-ish to be exported
     try:
@@ -538,7 +540,7 @@ def main(argv):
         return 1
     # Re-parse config options with using the per-tree config file(s) from the
     # exported tree-ish
-    options, gbp_args, builder_args = parse_args(argv, prefix, tree)
+    options, gbp_args, builder_args = parse_args(argv, prefix, tree, repo)
 
     try:
         # Create base temporary directory for this run
@@ -20,10 +20,12 @@
 """Clone a GIT repository and set it up for gbp"""
 
 import ConfigParser
+from contextlib import contextmanager
 import sys
 import os, os.path
 from gbp.config import (GbpOptionParser, GbpOptionGroup)
 from gbp.git import GitRepositoryError
+from gbp.git.mirrorcache import MirrorCache
 from gbp.errors import GbpError
 import gbp.log
 try:
@@ -52,6 +54,24 @@ def build_parser(name):
     branch_group.add_option("--depth", action="store", dest="depth", default=0,
                             help="git history depth (for creating shallow clones)")
 
+    cache_group = GbpOptionGroup(parser, "cache options",
+                                 "sharing objects between clones")
+    parser.add_option_group(cache_group)
+    cache_group.add_config_file_option(option_name="cache-dir", dest="cache_dir")
+    cache_group.add_option("--dissociate", action="store_true",
+                           dest="dissociate", default=False,
+                           help="copy the objects borrowed from the cache so "
+                                "the clone doesn't depend on it")
+    cache_group.add_option("--prune-cache", action="store_true",
+                           dest="prune_cache", default=False,
+                           help="remove the least recently used mirrors from "
+                                "the cache, the repository to clone is "
+                                "optional then")
+    cache_group.add_config_file_option(option_name="cache-keep",
+                                       dest="cache_keep", type="int")
+    cache_group.add_config_file_option(option_name="cache-max-age",
+                                       dest="cache_max_age", type="int")
+
     parser.add_option("-v", "--verbose", action="store_true", dest="verbose", default=False,
                       help="verbose command execution")
     parser.add_config_file_option(option_name="color", dest="color", type='tristate')
@@ -60,6 +80,18 @@ def build_parser(name):
     return parser
 
 
+@contextmanager
+def borrow_mirror(cache, source):
+    """Cached mirror of I{source} to use as reference while cloning"""
+    if cache is None:
+        yield None
+        return
+    # Mirror local repositories independent of the current directory
+    url = os.path.abspath(source) if os.path.exists(source) else source
+    with cache.borrow(url) as mirror:
+        yield mirror
+
+
 def parse_args (argv):
     parser = build_parser(argv[0])
     if not parser:
@@ -77,6 +109,19 @@ def main(argv):
     if not options:
         return 1
 
+    if options.prune_cache:
+        if not options.cache_dir:
+            gbp.log.err("Need a cache directory to prune.")
+            return 1
+        try:
+            MirrorCache(options.cache_dir).prune(options.cache_keep,
+                                                 options.cache_max_age)
+        except (OSError, IOError) as err:
+            gbp.log.err("Failed to prune cache: %s" % err)
+            return 1
+        if len(args) < 2:
+            return 0
+
     if len(args) < 2:
         gbp.log.err("Need a repository to clone.")
         return 1
@@ -92,8 +137,14 @@ def main(argv):
         pass
 
     try:
-        repo = GitRepository.clone(clone_to, source, options.depth,
-                                   auto_name=auto_name)
+        cache = MirrorCache(options.cache_dir) if options.cache_dir else None
+        with borrow_mirror(cache, source) as reference:
+            repo = GitRepository.clone(clone_to, source, options.depth,
+                                       auto_name=auto_name,
+                                       reference=reference,
+                                       dissociate=options.dissociate)
+            if reference and not options.dissociate:
+                cache.add_borrower(reference, repo.path)
         os.chdir(repo.path)
 
         # Reparse the config files of the cloned repository so we pick up the
@@ -15,3 +15,22 @@
 #    along with this program; if not, write to the Free Software
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """Parts shared between the deb and rpm commands"""
+
+import gbp.log
+from gbp.git import GitRepositoryError
+
+
+def update_commit_graph(repo):
+    """
+    Add new commits to the repository's commit-graph after bulk imports
+    and pulls. The graph only speeds things up so failing to write it
+    (e.g. with git older than 2.27) is not an error.
+
+    @param repo: the repository to update
+    @type repo: L{GitRepository}
+    """
+    gbp.log.debug("Updating commit-graph")
+    try:
+        repo.write_commit_graph()
+    except GitRepositoryError as err:
+        gbp.log.warn(err)
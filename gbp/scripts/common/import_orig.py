@@ -17,11 +17,18 @@
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 #
 """Common functionality for import-orig scripts"""
+import copy
 import os
+import stat
 import tempfile
+import time
+from multiprocessing.pool import ThreadPool
 
 import gbp.command_wrappers as gbpc
-from gbp.pkg import parse_archive_filename
+from gbp.errors import GbpError
+from gbp.git import FastImport, GitRepositoryError
+from gbp.git.treebuilder import TreeBuilder
+from gbp.pkg import parse_archive_filename, UnsupportedArchiveError
 import gbp.log
 
 # Try to import readline, since that will cause raw_input to get fancy
@@ -78,8 +85,75 @@ def ask_package_version(default, ver_validator_func, err_msg):
         # bit clearer.
         gbp.log.warn("\nNot a valid upstream version: '%s'.\n%s" % (version, err_msg))
 
+class ImportStages(object):
+    """
+    Run the stages of an import and keep track of how long each of them
+    took. Stages that don't depend on each other can be started in the
+    background to overlap with the ones run in the foreground.
+
+    @ivar timings: names and durations of the finished stages
+    @type timings: C{list} of C{tuple}
+    """
+    def __init__(self):
+        self.timings = []
+        self._start = time.time()
+        self._pool = None
+        self._pending = {}
+
+    def _timed(self, name, func, args, kwargs):
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.timings.append((name, time.time() - start))
+
+    def run(self, name, func, *args, **kwargs):
+        """Run stage I{name} and return its result"""
+        return self._timed(name, func, args, kwargs)
+
+    def start(self, name, func, *args, **kwargs):
+        """Start stage I{name} in the background, see L{wait}"""
+        if not self._pool:
+            self._pool = ThreadPool(2)
+        self._pending[name] = self._pool.apply_async(self._timed,
+                                                     (name, func, args,
+                                                      kwargs))
+
+    def wait(self, name):
+        """
+        Wait for background stage I{name} to finish
+
+        @return: the result of the stage, C{None} if it wasn't started
+        @raises: the exception the stage failed with
+        """
+        if name in self._pending:
+            return self._pending.pop(name).get()
+
+    def finish(self):
+        """
+        Wait for all background stages, only needed for cleanup after
+        errors so the stages' failures are just logged
+        """
+        for name in self._pending.keys():
+            try:
+                self.wait(name)
+            except Exception as err:
+                gbp.log.debug("Stage '%s' failed: %s" % (name, err))
+        if self._pool:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def report(self):
+        """Log the timings of the stages"""
+        gbp.log.debug("Import took %.2fs: %s" %
+                      (time.time() - self._start,
+                       ', '.join(['%s %.2fs' % timing for timing in
+                                  self.timings])))
+
+
 def prepare_sources(source, pkg_name, pkg_version, pristine_commit_name,
-                    filters, filter_pristine, prefix, tmpdir):
+                    filters, filter_pristine, prefix, tmpdir, unpack=True):
     """
     Prepare upstream sources for importing
 
@@ -102,8 +176,12 @@ def prepare_sources(source, pkg_name, pkg_version, pristine_commit_name,
     @type prefix: C{str} or C{None}
     @param tmpdir: temporary working dir (cleanup left to caller)
     @type tmpdir: C{str}
-    @return: path to prepared source tree and tarball to commit to pristine-tar
-    @rtype: C{tuple} of C{str}
+    @param unpack: unpack source archives, not needed if they were imported
+        with L{import_archive}
+    @type unpack: C{bool}
+    @return: path to prepared source tree (C{None} if not unpacked) and
+        tarball to commit to pristine-tar
+    @rtype: C{tuple} of C{str}
     """
     pristine = None
     # Determine parameters for pristine tar
@@ -137,16 +215,171 @@ def prepare_sources(source, pkg_name, pkg_version, pristine_commit_name,
             filtered = source
     # Handle source archives
     else:
-        unpack_dir = tempfile.mkdtemp(prefix='filtered_', dir=tmpdir)
-        gbp.log.debug("Unpacking '%s' to '%s'" % (source.path, unpack_dir))
-        filtered = source.unpack(unpack_dir, filters)
+        if unpack:
+            unpack_dir = tempfile.mkdtemp(prefix='filtered_', dir=tmpdir)
+            gbp.log.debug("Unpacking '%s' to '%s'" % (source.path,
+                                                      unpack_dir))
+            filtered = source.unpack(unpack_dir, filters)
+        else:
+            filtered = None
         if pristine_commit_name:
             pristine = prepare_pristine_tar(source, pkg_name, pkg_version,
                                             pristine_commit_name,
                                             pristine_filters, pristine_prefix,
                                             tmpdir)
     pristine_path = pristine.path if pristine else ''
-    return (filtered.unpacked, pristine_path)
+    return (filtered.unpacked if filtered else None, pristine_path)
+
+
+def import_archive(repo, source, filters, msg, branch, other_parents=None,
+                   create_missing_branch=False):
+    """
+    Import packed upstream sources straight from the archive, without
+    unpacking them on disk. The files are read in one go and fed to
+    I{git fast-import}, the result is the same as unpacking the archive
+    with L{prepare_sources} and committing the tree with
+    L{GitRepository.commit_dir}.
+
+    @param repo: the repository to import to
+    @type repo: L{GitRepository}
+    @param source: original upstream sources
+    @type source: C{UpstreamSource}
+    @param filters: filter to exclude files
+    @type filters: C{list} of C{str}
+    @param msg: commit message
+    @type msg: C{str}
+    @param branch: branch to commit to, C{None} in an empty repository
+    @type branch: C{str}
+    @param other_parents: additional parents of the commit
+    @type other_parents: C{list} of C{str}
+    @param create_missing_branch: create I{branch} if it doesn't exist
+    @type create_missing_branch: C{bool}
+    @return: the new commit or C{None} if the sources need to be unpacked
+        and committed with L{GitRepository.commit_dir} instead
+    @rtype: C{str}
+    """
+    # Git would convert files when adding them
+    if not TreeBuilder.has_plain_config(repo):
+        return None
+
+    if branch:
+        try:
+            cur = repo.rev_parse(branch)
+        except GitRepositoryError:
+            if not create_missing_branch:
+                raise
+            gbp.log.debug("Will create missing branch '%s'..." % branch)
+            cur = None
+    else:
+        cur = None
+        branch = 'master'
+    parents = [cur] if cur else []
+    for parent in other_parents or []:
+        sha = repo.rev_parse(parent)
+        if sha not in parents:
+            parents.append(sha)
+    author = repo.get_identity('author')
+    committer = repo.get_identity('committer')
+
+    gbp.log.debug("Importing '%s' without unpacking" % source.path)
+    fastimport = FastImport(repo)
+    files = {}
+    try:
+        members = source.members(filters)
+        try:
+            for path, typ, mode, size, data in members:
+                parts = path.split('/')
+                if parts[0] == '.git':
+                    raise GbpError("The orig tarball contains .git metadata "
+                                   "- giving up.")
+                if '.git' in [part.lower() for part in parts] or \
+                        parts[-1] == '.gitattributes':
+                    raise UnsupportedArchiveError("Found '%s'" % path)
+                if typ == 'file':
+                    files[path] = ([FastImport.m_regular,
+                                    FastImport.m_exec][bool(mode &
+                                                            stat.S_IXUSR)],
+                                   fastimport.add_blob_file(data, size))
+                elif typ == 'symlink':
+                    files[path] = (FastImport.m_symlink,
+                                   fastimport.add_blob(data))
+                elif typ == 'hardlink':
+                    if data not in files:
+                        raise UnsupportedArchiveError("Link target of '%s' "
+                                                      "not found" % path)
+                    files[path] = files[data]
+        finally:
+            members.close()
+    except UnsupportedArchiveError as err:
+        gbp.log.debug("%s, unpacking '%s'" % (err, source.path))
+        fastimport.close()
+        return None
+    except:
+        fastimport.close()
+        raise
+
+    fastimport.start_commit(branch, committer, msg, author, parents)
+    fastimport.deleteall()
+    for path in sorted(files):
+        mode, mark = files[path]
+        fastimport.add_file_ref(path, mark, mode)
+    if fastimport.close():
+        raise GitRepositoryError("Failed to import '%s' with git fast-import"
+                                 % source.path)
+    return repo.rev_parse('refs/heads/%s' % branch)
+
+def import_sources(repo, source, stages, pkg_name, pkg_version,
+                   pristine_commit_name, filters, filter_pristine, prefix,
+                   tmpdir, msg, branch, other_parents=None,
+                   create_missing_branch=False):
+    """
+    Commit upstream sources to the repository and prepare the archive to
+    commit to pristine-tar. Archives are repacked for pristine-tar in the
+    background while their contents are imported.
+
+    See L{prepare_sources} and L{import_archive} for the parameters.
+
+    @param stages: runs and times the stages of the import, the caller
+        needs to L{ImportStages.finish} it on errors
+    @type stages: L{ImportStages}
+    @return: the new commit and the tarball to commit to pristine-tar
+    @rtype: C{tuple} of C{str}
+    """
+    commit = None
+    pristine_orig = None
+    if not source.is_dir():
+        if pristine_commit_name:
+            # Works on a copy since unpacking for the import below changes
+            # the source
+            stages.start('repack', prepare_sources, copy.copy(source),
+                         pkg_name, pkg_version, pristine_commit_name, filters,
+                         filter_pristine, prefix, tmpdir, unpack=False)
+            pristine_commit_name = None
+        commit = stages.run('import', import_archive, repo, source, filters,
+                            msg, branch, other_parents, create_missing_branch)
+
+    if commit is None:
+        unpacked_orig, pristine_orig = stages.run('unpack', prepare_sources,
+                                                  source, pkg_name,
+                                                  pkg_version,
+                                                  pristine_commit_name,
+                                                  filters, filter_pristine,
+                                                  prefix, tmpdir)
+        # Don't mess up our repo with git metadata from an upstream
+        # tarball
+        if os.path.isdir(os.path.join(unpacked_orig, '.git/')):
+            raise GbpError("The orig tarball contains .git metadata "
+                           "- giving up.")
+        commit = stages.run('commit', repo.commit_dir, unpacked_orig,
+                            msg=msg, branch=branch,
+                            other_parents=other_parents,
+                            create_missing_branch=create_missing_branch)
+
+    repacked = stages.wait('repack')
+    if repacked:
+        pristine_orig = repacked[1]
+    return commit, pristine_orig
+
 
 def prepare_pristine_tar(source, pkg_name, pkg_version, pristine_commit_name,
                          filters=None, prefix=None, tmpdir=None):
@@ -190,53 +190,65 @@ def patch_path_filter(file_status, exclude_regex=None):
     return include_paths
 
 
-def write_patch_file(filename, commit_info, diff):
-    """Write patch file"""
+def write_patch_file(filename, commit_info, diff, writer=None):
+    """
+    Write patch file
+
+    @param writer: function used for writing the patch content to
+        I{filename} instead of writing it directly
+    @type writer: C{callable} taking the filename and the content
+    """
     if not diff:
         gbp.log.debug("I won't generate empty diff %s" % filename)
         return None
+    msg = Message()
+    charset = Charset('utf-8')
+    charset.body_encoding = None
+    charset.header_encoding = QP
+
+    # Write headers
+    name = commit_info['author']['name']
+    email = commit_info['author']['email']
+    # Git compat: put name in quotes if special characters found
+    if re.search("[,.@()\[\]\\\:;]", name):
+        name = '"%s"' % name
+    from_header = Header(unicode(name, 'utf-8'), charset, 77, 'from')
+    from_header.append(unicode('<%s>' % email))
+    msg['From'] = from_header
+    date = commit_info['author'].datetime
+    datestr = date.strftime('%a, %-d %b %Y %H:%M:%S %z')
+    msg['Date'] = Header(unicode(datestr, 'utf-8'), charset, 77, 'date')
+    msg['Subject'] = Header(unicode(commit_info['subject'], 'utf-8'),
+                            charset, 77, 'subject')
+    # Write message body
+    if commit_info['body']:
+        # Strip extra linefeeds
+        body = commit_info['body'].rstrip() + '\n'
+        try:
+            msg.set_payload(body.encode('ascii'))
+        except UnicodeDecodeError:
+            msg.set_payload(body, charset)
+    content = msg.as_string(unixfrom=False) + '---\n' + diff
+
     try:
-        with open(filename, 'w') as patch:
-            msg = Message()
-            charset = Charset('utf-8')
-            charset.body_encoding = None
-            charset.header_encoding = QP
-
-            # Write headers
-            name = commit_info['author']['name']
-            email = commit_info['author']['email']
-            # Git compat: put name in quotes if special characters found
-            if re.search("[,.@()\[\]\\\:;]", name):
-                name = '"%s"' % name
-            from_header = Header(unicode(name, 'utf-8'), charset, 77, 'from')
-            from_header.append(unicode('<%s>' % email))
-            msg['From'] = from_header
-            date = commit_info['author'].datetime
-            datestr = date.strftime('%a, %-d %b %Y %H:%M:%S %z')
-            msg['Date'] = Header(unicode(datestr, 'utf-8'), charset, 77, 'date')
-            msg['Subject'] = Header(unicode(commit_info['subject'], 'utf-8'),
-                                    charset, 77, 'subject')
-            # Write message body
-            if commit_info['body']:
-                # Strip extra linefeeds
-                body = commit_info['body'].rstrip() + '\n'
-                try:
-                    msg.set_payload(body.encode('ascii'))
-                except UnicodeDecodeError:
-                    msg.set_payload(body, charset)
-            patch.write(msg.as_string(unixfrom=False))
-
-            # Write diff
-            patch.write('---\n')
-            patch.write(diff)
+        if writer:
+            writer(filename, content)
+        else:
+            with open(filename, 'w') as patch:
+                patch.write(content)
     except IOError as err:
         raise GbpError('Unable to create patch file: %s' % err)
     return filename
 
 
 def format_patch(outdir, repo, commit_info, series, numbered=True,
-                 path_exclude_regex=None, topic=''):
-    """Create patch of a single commit"""
+                 path_exclude_regex=None, topic='', diff=None, writer=None):
+    """
+    Create patch of a single commit
+
+    If I{diff} is given it is used as the content of the patch instead of
+    diffing the commit against its parent.
+    """
 
     # Determine filename and path
     outdir = os.path.join(outdir, topic)
@@ -261,15 +273,17 @@ def format_patch(outdir, repo, commit_info, series, numbered=True,
     # Finally, create the patch
     patch = None
     if paths:
-        diff = repo.diff('%s^!' % commit_info['id'], paths=paths, stat=80,
-                         summary=True, text=True)
-        patch = write_patch_file(filepath, commit_info, diff)
+        if diff is None:
+            diff = repo.diff('%s^!' % commit_info['id'], paths=paths, stat=80,
+                             summary=True, text=True)
+        patch = write_patch_file(filepath, commit_info, diff, writer)
         if patch:
             series.append(patch)
     return patch
 
 
-def format_diff(outdir, filename, repo, start, end, path_exclude_regex=None):
+def format_diff(outdir, filename, repo, start, end, path_exclude_regex=None,
+                writer=None):
     """Create a patch of diff between two repository objects"""
 
     info = {'author': get_author(repo)}
@@ -288,7 +302,7 @@ def format_diff(outdir, filename, repo, start, end, path_exclude_regex=None):
     if paths:
         diff = repo.diff(start, end, paths=paths, stat=80, summary=True,
                          text=True)
-        return write_patch_file(filename, info, diff)
+        return write_patch_file(filename, info, diff, writer)
     return None
 
 
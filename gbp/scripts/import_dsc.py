@@ -264,6 +264,9 @@ def build_parser(name):
                       dest="author_committer_date")
     import_group.add_boolean_config_file_option(option_name="allow-unauthenticated",
                       dest="allow_unauthenticated")
+    # only used by gbp import-dscs, a single import doesn't update the graph
+    import_group.add_boolean_config_file_option(option_name="commit-graph",
+                      dest="commit_graph")
     return parser
 
 
@@ -277,7 +280,7 @@ def parse_args(argv):
     return options, args
 
 
-def main(argv):
+def main(argv, unpacked=None):
     dirs = dict(top=os.path.abspath(os.curdir))
     needs_repo = False
     ret = 0
@@ -330,10 +333,13 @@ def main(argv):
             if repo.bare:
                 set_bare_repo_options(options)
 
-            dirs['tmp'] = tempfile.mkdtemp(dir=options.tmp_dir,
-                                           prefix='import-dsc_')
-            upstream = DebianUpstreamSource(src.tgz)
-            upstream = upstream.unpack(dirs['tmp'], options.filters)
+            if unpacked:
+                upstream = DebianUpstreamSource(src.tgz, unpacked=unpacked)
+            else:
+                dirs['tmp'] = tempfile.mkdtemp(dir=options.tmp_dir,
+                                               prefix='import-dsc_')
+                upstream = DebianUpstreamSource(src.tgz)
+                upstream = upstream.unpack(dirs['tmp'], options.filters)
 
             format = [(options.upstream_tag, "Upstream"), (options.packaging_tag, "Debian")][src.native]
             tag = repo.version_to_tag(format[0], src.upstream_version)
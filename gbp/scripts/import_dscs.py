@@ -16,17 +16,26 @@
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """Import multiple dsc files into GIT in one go"""
 
+import collections
 import glob
+import hashlib
 import os
 import sys
 import tempfile
+from multiprocessing.pool import ThreadPool
 import gbp.command_wrappers as gbpc
+import gbp.tmpfile
 from gbp.deb import DpkgCompareVersions
 from gbp.deb.dscfile import DscFile
+from gbp.deb.git import DebianGitRepository
+from gbp.deb.upstreamsource import DebianUpstreamSource
 from gbp.errors import GbpError
-from gbp.git import GitRepository, GitRepositoryError
+from gbp.git import GitRepository, GitRepositoryError, FastImport
+from gbp.git.modifier import GitModifier
+from gbp.git.treebuilder import TreeBuilder
 from gbp.scripts import import_dsc
-from gbp.config import GbpOptionParser
+from gbp.scripts.common import update_commit_graph
+from gbp.config import GbpOptionParser, no_upstream_branch_msg
 import gbp.log
 
 class DscCompareVersions(DpkgCompareVersions):
@@ -37,12 +46,593 @@ class DscCompareVersions(DpkgCompareVersions):
         return DpkgCompareVersions.__call__(self, dsc1.version, dsc2.version)
 
 
+class SourceUnpacker(object):
+    """
+    Unpack the upstream sources of the packages to import ahead of the
+    importer
+
+    A pool of workers unpacks the next packages into private temporary
+    directories while the current package is being imported. The unpacked
+    trees are handed out in the order of the packages so commits, tags and
+    branches are still created one after another in version order.
+
+    Up to I{jobs} packages are unpacked ahead of the package being imported
+    and no new unpacking is started while the trees waiting to be imported
+    take more than I{max_size} bytes. Trees still being unpacked are
+    assumed to be as large as the largest tree unpacked so far. Packages
+    that fail to unpack are handed out without an unpacked tree so the
+    importer reports the error itself.
+    """
+    def __init__(self, filters=None, tmpdir_base=None, jobs=2,
+                 max_size=1024 * 1024 * 1024):
+        self.filters = filters or []
+        self.tmpdir_base = os.path.abspath(tmpdir_base or
+                                           tempfile.gettempdir())
+        self.jobs = jobs
+        self.max_size = max_size
+
+    @staticmethod
+    def _tree_size(path):
+        """Disk space used by a directory tree"""
+        size = 0
+        for root, dirs, files in os.walk(path):
+            for name in dirs + files:
+                try:
+                    size += os.lstat(os.path.join(root, name)).st_blocks * 512
+                except OSError:
+                    pass
+        return size
+
+    def _unpack(self, dsc):
+        """
+        Unpack the upstream sources of one package
+
+        @return: the temporary directory, the unpacked tree and its size or
+            C{None} if unpacking failed
+        @rtype: C{tuple}
+        """
+        tmpdir = None
+        try:
+            tmpdir = gbp.tmpfile.mkdtemp(dir=self.tmpdir_base,
+                                         prefix='import-dscs_')
+            upstream = DebianUpstreamSource(dsc.tgz)
+            upstream = upstream.unpack(tmpdir, self.filters)
+        except (GbpError, gbpc.CommandExecFailed) as err:
+            gbp.log.debug("Unpacking '%s' ahead failed: %s" % (dsc.tgz, err))
+            if tmpdir:
+                gbpc.RemoveTree(tmpdir)()
+            return None
+        return tmpdir, upstream.unpacked, self._tree_size(tmpdir)
+
+    @staticmethod
+    def _queued_size(queue, estimate):
+        """
+        Size of the trees waiting in the queue, counting the ones still
+        being unpacked as I{estimate} bytes
+        """
+        size = 0
+        for dummy, result in queue:
+            if not result.ready():
+                size += estimate
+            elif result.get():
+                size += result.get()[2]
+        return size
+
+    def unpack(self, dscs):
+        """
+        Unpack the upstream sources of packages
+
+        The unpacked tree of a package is removed when the next package is
+        requested.
+
+        @param dscs: the packages in import order
+        @type dscs: C{list} of L{DscFile}
+        @return: the packages and their unpacked upstream trees (C{None} if
+            not unpacked)
+        @rtype: generator of C{tuple}
+        """
+        if self.jobs < 1:
+            for dsc in dscs:
+                yield dsc, None
+            return
+
+        todo = collections.deque(dscs)
+        queue = collections.deque()
+        largest = 0
+        pool = ThreadPool(self.jobs)
+
+        def start():
+            dsc = todo.popleft()
+            queue.append((dsc, pool.apply_async(self._unpack, (dsc,))))
+
+        try:
+            while todo or queue:
+                if not queue:
+                    start()
+                dsc, result = queue.popleft()
+                # Unpack the next packages while this one gets imported
+                while (todo and len(queue) < self.jobs and
+                       self._queued_size(queue, largest) < self.max_size):
+                    start()
+                unpacked = result.get()
+                if unpacked:
+                    largest = max(largest, unpacked[2])
+                try:
+                    yield dsc, unpacked[1] if unpacked else None
+                finally:
+                    if unpacked:
+                        gbpc.RemoveTree(unpacked[0])()
+        finally:
+            pool.close()
+            pool.join()
+            for dummy, result in queue:
+                if result.get():
+                    gbpc.RemoveTree(result.get()[0])()
+
+
+def parse_import_dsc_args(args):
+    """Parse the arguments passed on to gbp import-dsc"""
+    parser = import_dsc.build_parser('import-dsc')
+    if not parser:
+        raise GbpError
+    options, dummy = parser.parse_args(args)
+    return options
+
+
+def not_imported(repo, dscs, options):
+    """
+    Drop the packages whose version is already imported, checking all of
+    them against a single listing of the tags
+
+    @param repo: the repository to import to
+    @type repo: L{DebianGitRepository}
+    @param dscs: the packages to import
+    @type dscs: C{list} of L{DscFile}
+    @param options: gbp import-dsc's options
+    @return: the packages to import
+    @rtype: C{list} of L{DscFile}
+    """
+    if options.allow_same_version:
+        return dscs
+    found = repo.find_versions(options.packaging_tag,
+                               [dsc.version for dsc in dscs])
+    for dsc in dscs:
+        if dsc.version in found:
+            gbp.log.info("Version %s already imported, skipping" %
+                         dsc.version)
+    return [dsc for dsc in dscs if dsc.version not in found]
+
+
+class ImportCheckpoint(object):
+    """
+    The packages of an import and which of them were imported already,
+    stored in the repository so an interrupted import can be resumed
+
+    The file lists one package per line, prefixed with I{imported} or
+    I{pending}.
+
+    @ivar dscfiles: the packages to import
+    @type dscfiles: C{list} of C{str}
+    @ivar imported: the packages imported
+    @type imported: C{set} of C{str}
+    """
+    def __init__(self, git_dir):
+        self.path = os.path.join(git_dir, 'gbp', 'import-dscs')
+        self.dscfiles = []
+        self.imported = set()
+
+    def load(self):
+        """
+        Load the stored checkpoint
+
+        @return: C{False} if there's no checkpoint
+        @rtype: C{bool}
+        """
+        try:
+            with open(self.path) as checkpoint:
+                for line in checkpoint:
+                    state, dscfile = line.rstrip('\n').split(' ', 1)
+                    self.dscfiles.append(dscfile)
+                    if state == 'imported':
+                        self.imported.add(dscfile)
+        except IOError:
+            return False
+        except ValueError:
+            raise GbpError("Invalid checkpoint file %s" % self.path)
+        return True
+
+    def _save(self):
+        """Store the checkpoint"""
+        if not os.path.exists(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path),
+                                        prefix='.tmp')
+        with os.fdopen(fd, 'w') as checkpoint:
+            for dscfile in self.dscfiles:
+                state = ['pending', 'imported'][dscfile in self.imported]
+                checkpoint.write("%s %s\n" % (state, dscfile))
+        os.rename(tmp_path, self.path)
+
+    def start(self, dscs):
+        """Record the packages to import"""
+        self.dscfiles = [dsc.dscfile for dsc in dscs]
+        self._save()
+
+    def done(self, dsc):
+        """Record a package as imported"""
+        self.imported.add(dsc.dscfile)
+        self._save()
+
+    def remove(self):
+        """Remove the checkpoint once everything got imported"""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
 class GitImportDsc(object):
     def __init__(self, args):
         self.args = args
 
-    def importdsc(self, dsc):
-        return import_dsc.main(['import-dsc'] + self.args + [dsc.dscfile])
+    def not_imported(self, repo, dscs):
+        """Drop the packages whose version is already imported"""
+        return not_imported(repo, dscs, parse_import_dsc_args(self.args))
+
+    def importdsc(self, dsc, unpacked=None):
+        return import_dsc.main(['import-dsc'] + self.args + [dsc.dscfile],
+                               unpacked=unpacked)
+
+    def unpacker(self, jobs, max_size):
+        """
+        Get a L{SourceUnpacker} that unpacks like gbp import-dsc does with
+        our arguments
+        """
+        options = parse_import_dsc_args(self.args)
+        return SourceUnpacker(options.filters, options.tmp_dir, jobs,
+                              max_size)
+
+
+class GitFastImportDscs(object):
+    """
+    Import packages the way gbp import-dsc does but write the whole history
+    with a single I{git fast-import} stream instead of committing and
+    tagging every package separately. Blobs already sent to fast-import
+    are referenced by their marks instead of being sent again.
+
+    Trees are built the way I{git add -f .} does. If the repository or the
+    unpacked sources use anything that would make git convert files on
+    adding them (like attributes or I{core.autocrlf}) the tree is built by
+    git instead and handed to fast-import as a whole.
+    """
+    def __init__(self, args):
+        self.options = parse_import_dsc_args(args)
+        for option, name in [('sign_tags', 'signing tags'),
+                             ('allow_same_version',
+                              'importing the same version again'),
+                             ('download', 'downloading packages')]:
+            if getattr(self.options, option):
+                raise GbpError("Fast import doesn't support %s" % name)
+        self.repo = None
+        self._fastimport = None
+        self._empty = False
+        # Branches and tags written to the stream, pointing to marks
+        self._heads = {}
+        self._tags = {}
+        # Parents of the commits in the stream
+        self._parents = {}
+        # Marks of the blobs in the stream, indexed by blob sha1
+        self._blobs = {}
+        self._git_add = False
+        # Packages written to the stream and imported once it's done
+        self._written = []
+        self.imported = []
+
+    def not_imported(self, repo, dscs):
+        """Drop the packages whose version is already imported"""
+        return not_imported(repo, dscs, self.options)
+
+    def unpacker(self, jobs, max_size):
+        """Get a L{SourceUnpacker} that unpacks like gbp import-dsc does"""
+        return SourceUnpacker(self.options.filters, self.options.tmp_dir,
+                              jobs, max_size)
+
+    @staticmethod
+    def _author(who, author=None):
+        """
+        Fill in author or committer information the way git would
+        """
+        info = GitModifier(author.name, author.email,
+                           author.date) if author else GitModifier()
+        if not info.name:
+            info.name = os.getenv('GIT_%s_NAME' % who)
+        if not info.email:
+            info.email = os.getenv('GIT_%s_EMAIL' % who)
+        if not info.date and os.getenv('GIT_%s_DATE' % who):
+            info.date = os.getenv('GIT_%s_DATE' % who)
+        return info
+
+    def _identity(self, who, author=None):
+        """Author or committer information with defaults from git config"""
+        info = self._author(who, author)
+        if not (info.name and info.email):
+            default = self.repo.get_author_info()
+            info.name = info.name or default.name
+            info.email = info.email or default.email
+        return info
+
+    def _head(self, branch):
+        """Current head of a branch, C{None} if it doesn't exist"""
+        if branch in self._heads:
+            return self._heads[branch]
+        if self.repo.has_branch(branch):
+            return self.repo.rev_parse(branch)
+        return None
+
+    def _find_version(self, format, version):
+        """Commit of an already imported version"""
+        tag = self.repo.version_to_tag(format, version)
+        if tag in self._tags:
+            return self._tags[tag]
+        return self.repo.find_version(format, version)
+
+    def _contains(self, head, commit):
+        """Check if commit I{commit} is an ancestor of I{head}"""
+        todo, seen = [head], set()
+        while todo:
+            rev = todo.pop()
+            if rev == commit:
+                return True
+            if rev in seen:
+                continue
+            seen.add(rev)
+            if rev in self._parents:
+                todo.extend(self._parents[rev])
+            elif commit not in self._parents:
+                # Both commits existed before the import
+                try:
+                    if self.repo.get_merge_base(rev, commit) == commit:
+                        return True
+                except GitRepositoryError:
+                    pass
+        return False
+
+    def _tree_entries(self, top):
+        """
+        Send the blobs of a directory tree to fast-import
+
+        @return: mode, mark and path of the files or C{None} if git needs
+            to add the directory itself
+        @rtype: C{list} of C{tuple}
+        """
+        scanned = TreeBuilder(self.repo).scan(top)
+        if scanned is None:
+            return None
+        modes = {TreeBuilder.m_regular: FastImport.m_regular,
+                 TreeBuilder.m_exec: FastImport.m_exec,
+                 TreeBuilder.m_symlink: FastImport.m_symlink}
+        entries = []
+        for reldir, name, mode, path in scanned[0]:
+            if mode == TreeBuilder.m_symlink:
+                data = os.readlink(path)
+            else:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            sha1 = hashlib.sha1("blob %d\0%s" % (len(data), data))
+            sha1 = sha1.hexdigest()
+            if sha1 not in self._blobs:
+                self._blobs[sha1] = self._fastimport.add_blob(data)
+            entries.append((modes[mode], self._blobs[sha1],
+                            os.path.join(reldir, name)))
+        return entries
+
+    def _commit(self, branch, unpack_dir, msg, parents, author, committer):
+        """Commit the contents of a directory to a branch"""
+        entries = None if self._git_add else self._tree_entries(unpack_dir)
+        if entries is None:
+            tree = self.repo.create_tree(unpack_dir)
+            entries = [(FastImport.m_tree, tree, '')]
+        author = self._identity('AUTHOR', author)
+        committer = self._identity('COMMITTER', committer)
+        parents = [parent for i, parent in enumerate(parents)
+                   if parent not in parents[:i]]
+        commit = self._fastimport.start_commit(branch, committer, msg,
+                                               author=author,
+                                               parents=parents)
+        self._fastimport.deleteall()
+        for mode, dataref, path in entries:
+            self._fastimport.add_file_ref(path, dataref, mode)
+        self._parents[commit] = parents
+        self._heads[branch] = commit
+        self._empty = False
+        return commit
+
+    def _branch(self, branch, commit):
+        """Point a branch at a commit"""
+        self._fastimport.reset(branch, commit)
+        self._heads[branch] = commit
+
+    def _tag(self, name, msg, commit):
+        """Create an annotated tag"""
+        self._fastimport.add_tag(name, commit,
+                                 self._identity('COMMITTER'), msg + '\n')
+        self._tags[name] = commit
+
+    def _import_debian_patch(self, src, unpack_dir, tag):
+        """Apply the Debian patch and commit it on the packaging branch"""
+        options = self.options
+        try:
+            os.chdir(unpack_dir)
+            if src.diff and not import_dsc.apply_patch(src.diff):
+                raise GbpError
+            if src.deb_tgz and not import_dsc.apply_deb_tgz(src.deb_tgz):
+                raise GbpError
+            if os.path.exists('debian/rules'):
+                os.chmod('debian/rules', 0755)
+        except gbpc.CommandExecFailed as err:
+            gbp.log.err("Failed to import Debian package: %s" % err)
+            raise GbpError
+        finally:
+            os.chdir(self.repo.path)
+
+        head = self._head(options.packaging_branch)
+        parents = [head] if head else []
+        upstream = self._tags.get(tag)
+        if not upstream and self.repo.has_tag(tag):
+            upstream = self.repo.rev_parse("%s^{commit}" % tag)
+        if upstream and not (head and self._contains(head, upstream)):
+            parents.append(upstream)
+
+        author = import_dsc.get_author_from_changelog(unpack_dir)
+        committer = import_dsc.get_committer_from_author(author, options)
+        commit = self._commit(options.packaging_branch, unpack_dir,
+                              "Imported Debian patch %s" % src.version,
+                              parents, author, committer)
+        if not options.skip_packaging_tag:
+            self._tag(self.repo.version_to_tag(options.packaging_tag,
+                                               src.version),
+                      "Debian release %s" % src.version, commit)
+
+    def _import(self, src, unpack_dir):
+        """
+        Import a single package
+
+        @return: the upstream tarball and tag to commit to pristine-tar
+        @rtype: C{tuple}
+        """
+        options = self.options
+        pristine_tar = None
+        if src.pkgformat not in [ '1.0', '3.0' ]:
+            raise GbpError("Importing %s source format not yet supported." %
+                           src.pkgformat)
+        if self._find_version(options.packaging_tag, src.version):
+            gbp.log.warn("Version %s already imported." % src.version)
+            return None
+
+        empty = self._empty
+        format = [(options.upstream_tag, "Upstream"),
+                  (options.packaging_tag, "Debian")][src.native]
+        tag = self.repo.version_to_tag(format[0], src.upstream_version)
+        msg = "%s version %s" % (format[1], src.upstream_version)
+
+        if not self._find_version(format[0], src.upstream_version):
+            gbp.log.info("Tag %s not found, importing %s tarball" %
+                         (tag, format[1]))
+            if empty:
+                branch, parents = 'master', []
+            else:
+                branch = [options.upstream_branch,
+                          options.packaging_branch][src.native]
+                head = self._head(branch)
+                if not head:
+                    if options.create_missing_branches:
+                        gbp.log.info("Creating missing branch '%s'" % branch)
+                        head = self._head(self.repo.get_branch())
+                    else:
+                        gbp.log.err(no_upstream_branch_msg % branch +
+                                    "\nAlso check the --create-missing-branches option.")
+                        raise GbpError
+                parents = [head]
+
+            if src.native:
+                author = import_dsc.get_author_from_changelog(unpack_dir)
+                committer = import_dsc.get_committer_from_author(author,
+                                                                 options)
+            else:
+                author = committer = None
+            commit = self._commit(branch, unpack_dir, "Imported %s" % msg,
+                                  parents, author, committer)
+            if not (src.native and options.skip_packaging_tag):
+                self._tag(tag, msg, commit)
+            if not src.native:
+                if empty:
+                    self._branch(options.upstream_branch, commit)
+                if options.pristine_tar:
+                    pristine_tar = (src.tgz, tag)
+            if (not self._head(options.packaging_branch)
+                and (empty or options.create_missing_branches)):
+                self._branch(options.packaging_branch, commit)
+        if not src.native:
+            if src.diff or src.deb_tgz:
+                self._import_debian_patch(src, unpack_dir, tag)
+            else:
+                gbp.log.warn("Didn't find a diff to apply.")
+        if empty and self._head(options.packaging_branch):
+            # The initial import checks out the packaging branch
+            self._branch('master', self._head(options.packaging_branch))
+        gbp.log.info("Version '%s' imported under '%s'" % (src.version,
+                                                           src.pkg))
+        return pristine_tar
+
+    def importdscs(self, unpacked_dscs):
+        """
+        Import packages
+
+        @param unpacked_dscs: the packages and their unpacked upstream
+            sources as returned by L{SourceUnpacker.unpack}
+        """
+        options = self.options
+        try:
+            self.repo = DebianGitRepository('.')
+        except GitRepositoryError:
+            self.repo = None
+        pristine_tars = []
+        was_empty = False
+        try:
+            for src, unpacked in unpacked_dscs:
+                if not self.repo:
+                    gbp.log.info("No git repository found, creating one.")
+                    self.repo = DebianGitRepository.create(src.pkg)
+                    os.chdir(self.repo.path)
+                if not self._fastimport:
+                    self._empty = was_empty = self.repo.is_empty()
+                    if self.repo.bare:
+                        import_dsc.set_bare_repo_options(options)
+                    self._git_add = not TreeBuilder.has_plain_config(
+                                            self.repo)
+                    self._fastimport = FastImport(self.repo)
+
+                tmpdir = None
+                try:
+                    if not unpacked:
+                        tmpdir = gbp.tmpfile.mkdtemp(dir=options.tmp_dir,
+                                                     prefix='import-dsc_')
+                        upstream = DebianUpstreamSource(src.tgz)
+                        unpacked = upstream.unpack(tmpdir,
+                                                   options.filters).unpacked
+                    pristine_tar = self._import(src, unpacked)
+                    self._written.append(src)
+                finally:
+                    if tmpdir:
+                        gbpc.RemoveTree(tmpdir)()
+                if pristine_tar:
+                    pristine_tars.append(pristine_tar)
+        except:
+            # Keep what got imported so far, like importing the packages
+            # one by one would, but don't hide why the import failed
+            exc_info = sys.exc_info()
+            if self._fastimport:
+                try:
+                    self._finish(pristine_tars, was_empty)
+                except (GbpError, GitRepositoryError,
+                        gbpc.CommandExecFailed) as err:
+                    gbp.log.err("Failed to finish the partial import: %s"
+                                % err)
+            raise exc_info[0], exc_info[1], exc_info[2]
+        if self._fastimport:
+            self._finish(pristine_tars, was_empty)
+
+    def _finish(self, pristine_tars, was_empty):
+        """Let fast-import update the refs and update pristine-tar and HEAD"""
+        options = self.options
+        if self._fastimport.close():
+            raise GbpError("git fast-import failed")
+        self._fastimport = None
+        self.imported = self._written
+        for tarball, tag in pristine_tars:
+            self.repo.pristine_tar.commit(tarball, tag)
+        if self.repo.get_branch() == options.packaging_branch:
+            self.repo.force_head(options.packaging_branch, hard=True)
+        elif was_empty and not self.repo.bare:
+            self.repo.force_head('HEAD', hard=True)
 
 
 def fetch_snapshots(pkg, downloaddir):
@@ -80,11 +670,17 @@ def set_gbp_conf_files():
 
 def print_help():
     print """Usage: gbp import-dscs [options] [gbp-import-dsc options] /path/to/dsc1 [/path/to/dsc2] ...
+       gbp import-dscs --resume [options] [gbp-import-dsc options]
        gbp import-dscs --debsnap [options] [gbp-import-dsc options] package
 
 Options:
 
     --ignore-repo-config: ignore gbp.conf in git repo
+    --resume: continue an interrupted import
+    --fast-import: write the history with a single git fast-import stream
+    --unpack-jobs=<n>: number of packages to unpack ahead, 0 to disable
+    --unpack-max-size=<mb>: don't unpack further ahead while the unpacked
+                            sources take more than <mb> megabytes
 """
 
 
@@ -95,6 +691,10 @@ def main(argv):
     verbose = False
     dsc_cmp = DscCompareVersions()
     use_debsnap = False
+    use_fast_import = False
+    resume = False
+    unpack_jobs = 2
+    unpack_max_size = 1024
 
     try:
         import_args = argv[1:]
@@ -106,6 +706,22 @@ def main(argv):
         if '--ignore-repo-config' in import_args:
             set_gbp_conf_files()
             import_args.remove('--ignore-repo-config')
+        if '--fast-import' in import_args:
+            use_fast_import = True
+            import_args.remove('--fast-import')
+        if '--resume' in import_args:
+            resume = True
+            import_args.remove('--resume')
+        for arg in import_args[:]:
+            try:
+                if arg.startswith('--unpack-jobs='):
+                    unpack_jobs = int(arg.split('=', 1)[1])
+                    import_args.remove(arg)
+                elif arg.startswith('--unpack-max-size='):
+                    unpack_max_size = int(arg.split('=', 1)[1])
+                    import_args.remove(arg)
+            except ValueError:
+                raise GbpError("Invalid value in '%s'" % arg)
         # Not using Configparser since we want to pass all unknown options
         # unaltered to gbp import-dsc
         if '--debsnap' in import_args:
@@ -122,7 +738,19 @@ def main(argv):
                     dscs.append(DscFile.parse(arg))
                     import_args.remove(arg)
 
-        if not use_debsnap and not dscs:
+        checkpoint = None
+        if resume and not use_debsnap and not dscs:
+            # Resume the import of the repository we're in
+            try:
+                checkpoint = ImportCheckpoint(GitRepository('.').git_dir)
+            except GitRepositoryError:
+                raise GbpError("No git repository to resume the import in")
+            if not checkpoint.load():
+                raise GbpError("No import to resume")
+            dscs = [DscFile.parse(dscfile) for dscfile in checkpoint.dscfiles
+                    if dscfile not in checkpoint.imported]
+
+        if not use_debsnap and not dscs and not checkpoint:
             print_help()
             raise GbpError
 
@@ -131,10 +759,14 @@ def main(argv):
             dscs = [ DscFile.parse(f) for f in fetch_snapshots(pkg, dirs['tmp']) ]
 
         dscs.sort(cmp=dsc_cmp)
-        importer = GitImportDsc(import_args)
+        if use_fast_import:
+            importer = GitFastImportDscs(import_args)
+        else:
+            importer = GitImportDsc(import_args)
 
+        repo = None
         try:
-            repo = GitRepository('.')
+            repo = DebianGitRepository('.')
             (clean, out) = repo.is_clean()
             if not clean:
                 gbp.log.err("Repository has uncommitted changes, "
@@ -144,15 +776,53 @@ def main(argv):
                 dirs['pkg'] = dirs['top']
         except GitRepositoryError:
             # no git repository there yet
-            dirs['pkg'] = os.path.join(dirs['top'], dscs[0].pkg)
+            dirs['pkg'] = os.path.join(dirs['top'], dscs[0].pkg) if dscs \
+                                else dirs['top']
+            if os.path.isdir(os.path.join(dirs['pkg'], '.git')):
+                # Continue a previous import
+                repo = DebianGitRepository(dirs['pkg'])
+                os.chdir(dirs['pkg'])
 
-        if importer.importdsc(dscs[0]):
-            raise GbpError("Failed to import '%s'" % dscs[0].dscfile)
-        os.chdir(dirs['pkg'])
+        if repo:
+            if not checkpoint:
+                checkpoint = ImportCheckpoint(repo.git_dir)
+                if resume and checkpoint.load():
+                    dscs = [dsc for dsc in dscs
+                            if dsc.dscfile not in checkpoint.imported]
+            dscs = importer.not_imported(repo, dscs)
+            if dscs:
+                checkpoint.start(dscs)
 
-        for dsc in dscs[1:]:
-            if importer.importdsc(dsc):
-                raise GbpError("Failed to import '%s'" % dscs[0].dscfile)
+        unpacker = importer.unpacker(unpack_jobs,
+                                     unpack_max_size * 1024 * 1024)
+        unpacked_dscs = unpacker.unpack(dscs)
+        try:
+            if use_fast_import:
+                try:
+                    importer.importdscs(unpacked_dscs)
+                finally:
+                    if importer.imported and not checkpoint:
+                        checkpoint = ImportCheckpoint(
+                            GitRepository(dirs['pkg']).git_dir)
+                        checkpoint.start(dscs)
+                    for dsc in importer.imported:
+                        checkpoint.done(dsc)
+            else:
+                for dsc, unpacked in unpacked_dscs:
+                    if importer.importdsc(dsc, unpacked):
+                        raise GbpError("Failed to import '%s'" % dsc.dscfile)
+                    os.chdir(dirs['pkg'])
+                    if not checkpoint:
+                        checkpoint = ImportCheckpoint(
+                            GitRepository('.').git_dir)
+                        checkpoint.start(dscs)
+                    checkpoint.done(dsc)
+        finally:
+            unpacked_dscs.close()
+        if dscs and parse_import_dsc_args(import_args).commit_graph:
+            update_commit_graph(GitRepository(dirs['pkg']))
+        if checkpoint:
+            checkpoint.remove()
 
     except (GbpError, gbpc.CommandExecFailed, GitRepositoryError) as err:
         if len(err.__str__()):
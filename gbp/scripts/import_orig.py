@@ -34,7 +34,7 @@ import gbp.log
 from gbp.pkg import compressor_opts
 from gbp.scripts.common.import_orig import (cleanup_tmp_tree, ask_package_name,
 						ask_package_version,
-						prepare_sources)
+						ImportStages, import_sources)
 
 def upstream_import_commit_msg(options, version):
     return options.import_msg % dict(version=version)
@@ -231,6 +231,7 @@ def main(argv):
         return 1
 
     tmpdir = tempfile.mkdtemp(dir=options.tmp_dir, prefix='import-orig_')
+    stages = ImportStages()
 
     try:
         source = find_source(options.uscan, args)
@@ -263,19 +264,8 @@ def main(argv):
         if repo.bare:
             set_bare_repo_options(options)
 
-        # Prepare sources for importing
         pristine_name = pristine_tarball_name(source, pkg_name, version)
         prepare_pristine = pristine_name if options.pristine_tar else None
-        unpacked_orig, pristine_orig = prepare_sources(
-                source, pkg_name, version, prepare_pristine, options.filters,
-                options.filter_pristine_tar, None, tmpdir)
-
-        # Don't mess up our repo with git metadata from an upstream tarball
-        try:
-            if os.path.isdir(os.path.join(unpacked_orig, '.git/')):
-                raise GbpError("The orig tarball contains .git metadata - giving up.")
-        except OSError:
-            pass
 
         try:
             upstream_branch = [ options.upstream_branch, 'master' ][is_empty]
@@ -295,14 +285,17 @@ def main(argv):
             else:
                 parents = None
 
-            commit = repo.commit_dir(unpacked_orig,
-                        msg=msg,
-                        branch=import_branch,
-                        other_parents=parents,
-                        create_missing_branch=options.create_missing_branches)
+            commit, pristine_orig = import_sources(
+                    repo, source, stages, pkg_name, version, prepare_pristine,
+                    options.filters, options.filter_pristine_tar, None,
+                    tmpdir, msg, import_branch, parents,
+                    options.create_missing_branches)
 
             if options.pristine_tar and pristine_orig:
-                repo.pristine_tar.commit(pristine_orig, upstream_branch)
+                # The delta only needs the archive and the imported tree so
+                # it's generated while tagging and merging
+                stages.start('pristine-tar', repo.pristine_tar.commit,
+                             pristine_orig, commit)
 
             tag = repo.version_to_tag(options.upstream_tag, version)
             repo.create_tag(name=tag,
@@ -317,10 +310,11 @@ def main(argv):
                 gbp.log.info("Merging to '%s'" % options.packaging_branch)
                 repo.set_branch(options.packaging_branch)
                 try:
-                    repo.merge(tag)
+                    stages.run('merge', repo.merge, tag)
                 except GitRepositoryError:
                     raise GbpError("Merge failed, please resolve.")
                 if options.postimport:
+                    stages.wait('pristine-tar')
                     epoch = ''
                     if os.access('debian/changelog', os.R_OK):
                         # No need to check the changelog file from the
@@ -332,6 +326,7 @@ def main(argv):
                     info = { 'version': "%s%s-1" % (epoch, version) }
                     env = { 'GBP_BRANCH': options.packaging_branch }
                     gbpc.Command(format_msg(options.postimport, info), extra_env=env, shell=True)()
+            stages.wait('pristine-tar')
             # Update working copy and index if we've possibly updated the
             # checked out branch
             current_branch = repo.get_branch()
@@ -357,6 +352,8 @@ def main(argv):
             gbp.log.err(err)
         ret = 1
 
+    stages.finish()
+    stages.report()
     if tmpdir:
         cleanup_tmp_tree(tmpdir)
 
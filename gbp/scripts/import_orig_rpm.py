@@ -27,7 +27,7 @@ import re
 import string
 from gbp.pkg import parse_archive_filename
 from gbp.rpm import (RpmUpstreamSource, SpecFile, NoSpecError, guess_spec,
-                     guess_spec_repo)
+                     guess_spec_repo, init_spec_cache)
 from gbp.rpm.policy import RpmPkgPolicy
 from gbp.rpm.git import (GitRepositoryError, RpmGitRepository)
 from gbp.config import GbpOptionParserRpm, GbpOptionGroup, no_upstream_branch_msg
@@ -35,7 +35,7 @@ from gbp.errors import GbpError
 import gbp.log
 from gbp.scripts.common.import_orig import (cleanup_tmp_tree, ask_package_name,
                                             ask_package_version,
-                                            prepare_sources)
+                                            ImportStages, import_sources)
 from gbp.scripts.import_srpm import download_file
 
 
@@ -224,11 +224,13 @@ def main(argv):
         return 1
 
     tmpdir = tempfile.mkdtemp(dir=options.tmp_dir, prefix='import-orig-rpm_')
+    stages = ImportStages()
     try:
         try:
             repo = RpmGitRepository('.')
         except GitRepositoryError:
             raise GbpError, "%s is not a git repository" % (os.path.abspath('.'))
+        init_spec_cache(repo)
 
         spec = find_spec(repo, options)
         source = find_source(spec, options, args)
@@ -257,23 +259,13 @@ def main(argv):
         if repo.bare:
             set_bare_repo_options(options)
 
-        # Prepare sources for importing
         if options.pristine_tar:
             prepare_pristine = pristine_tarball_name(source, sourcepackage,
                                                   version,
                                                   options.pristine_tarball_name)
         else:
             prepare_pristine = None
-        unpacked_orig, pristine_orig = \
-                prepare_sources(source, sourcepackage, version,
-                                prepare_pristine, options.filters,
-                                options.filter_pristine_tar,
-                                options.orig_prefix, tmpdir)
-
-        # Don't mess up our repo with git metadata from an upstream tarball
-        if os.path.isdir(os.path.join(unpacked_orig, '.git/')):
-            raise GbpError("The orig tarball contains .git metadata - "
-                           "giving up.")
+
         try:
             filter_msg = ["", " (filtering out %s)"
                               % options.filters][len(options.filters) > 0]
@@ -290,14 +282,19 @@ def main(argv):
             else:
                 parents = None
 
-            commit = repo.commit_dir(unpacked_orig,
-                        msg=msg,
-                        branch=options.upstream_branch,
-                        other_parents=parents,
-                        create_missing_branch=options.create_missing_branches)
+            commit, pristine_orig = \
+                    import_sources(repo, source, stages, sourcepackage,
+                                   version, prepare_pristine, options.filters,
+                                   options.filter_pristine_tar,
+                                   options.orig_prefix, tmpdir, msg,
+                                   options.upstream_branch, parents,
+                                   options.create_missing_branches)
             if options.pristine_tar and pristine_orig:
                 gbp.log.info("Pristine-tar: commiting %s" % pristine_orig)
-                repo.pristine_tar.commit(pristine_orig, options.upstream_branch)
+                # The delta only needs the archive and the imported tree so
+                # it's generated while tagging and merging
+                stages.start('pristine-tar', repo.pristine_tar.commit,
+                             pristine_orig, commit)
 
             tag_str_fields = dict(upstreamversion=version, vendor="Upstream")
             tag = repo.version_to_tag(options.upstream_tag, tag_str_fields)
@@ -311,7 +308,7 @@ def main(argv):
                 if repo.has_branch(options.packaging_branch):
                     repo.set_branch(options.packaging_branch)
                     try:
-                        repo.merge(tag)
+                        stages.run('merge', repo.merge, tag)
                     except GitRepositoryError:
                         raise GbpError, """Merge failed, please resolve."""
                 else:
@@ -319,10 +316,12 @@ def main(argv):
                     if repo.get_branch() == options.packaging_branch:
                         repo.force_head(options.packaging_branch, hard=True)
                 if options.postimport:
+                    stages.wait('pristine-tar')
                     info = { 'upstreamversion': version }
                     env = { 'GBP_BRANCH': options.packaging_branch }
                     gbpc.Command(options.postimport % info, extra_env=env,
                                  shell=True)()
+            stages.wait('pristine-tar')
             # Update working copy and index if we've possibly updated the
             # checked out branch
             current_branch = repo.get_branch()
@@ -336,6 +335,8 @@ def main(argv):
             gbp.log.err(err)
         ret = 1
 
+    stages.finish()
+    stages.report()
     if tmpdir:
         cleanup_tmp_tree(tmpdir)
 
@@ -30,7 +30,7 @@ import urllib2
 import gbp.tmpfile as tempfile
 import gbp.command_wrappers as gbpc
 from gbp.rpm import (parse_srpm, guess_spec, SpecFile, NoSpecError,
-                    RpmUpstreamSource)
+                    RpmUpstreamSource, init_spec_cache)
 from gbp.rpm.policy import RpmPkgPolicy
 from gbp.rpm.git import (RpmGitRepository, GitRepositoryError)
 from gbp.git.modifier import GitModifier
@@ -39,6 +39,7 @@ from gbp.config import (GbpOptionParserRpm, GbpOptionGroup,
 from gbp.errors import GbpError
 import gbp.log
 from gbp.scripts.pq_rpm import safe_patches, rm_patch_files, get_packager
+from gbp.scripts.common import update_commit_graph
 from gbp.scripts.common.pq import apply_and_commit_patch
 from gbp.pkg import parse_archive_filename
 
@@ -242,6 +243,8 @@ def parse_args(argv):
                       dest="packaging_dir")
     import_group.add_boolean_config_file_option(option_name="patch-import",
                                                 dest="patch_import")
+    import_group.add_boolean_config_file_option(option_name="commit-graph",
+                                                dest="commit_graph")
     (options, args) = parser.parse_args(argv[1:])
     gbp.log.setup(options.color, options.verbose, options.color_scheme)
     return options, args
@@ -313,6 +316,7 @@ def main(argv):
             is_empty = True
             repo = RpmGitRepository.create(spec.name)
             os.chdir(repo.path)
+        init_spec_cache(repo)
 
         if repo.bare:
             set_bare_repo_options(options)
@@ -502,6 +506,8 @@ def main(argv):
                             keyid=options.keyid)
 
         force_to_branch_head(repo, options.packaging_branch)
+        if options.commit_graph:
+            update_commit_graph(repo)
 
     except KeyboardInterrupt:
         ret = 1
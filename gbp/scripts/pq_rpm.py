@@ -28,6 +28,7 @@ import gzip
 import bz2
 import tarfile
 import subprocess
+from multiprocessing.pool import ThreadPool
 import gbp.tmpfile as tempfile
 from gbp.config import GbpOptionParserRpm
 from gbp.rpm.git import GitRepositoryError, RpmGitRepository
@@ -38,10 +39,11 @@ import gbp.log
 from gbp.patch_series import PatchSeries, Patch
 from gbp.pkg import parse_archive_filename
 from gbp.rpm import (SpecFile, NoSpecError, guess_spec, guess_spec_repo,
-                     spec_from_repo, string_to_int)
+                     spec_from_repo, string_to_int, init_spec_cache)
 from gbp.scripts.common.pq import (is_pq_branch, pq_branch_name, pq_branch_base,
                                    parse_gbp_commands, format_patch,
-                                   format_diff, apply_and_commit_patch, drop_pq)
+                                   format_diff, apply_and_commit_patch, drop_pq,
+                                   patch_path_filter)
 from gbp.scripts.common.buildpackage import dump_tree
 
 USAGE_STRING = \
@@ -62,21 +64,69 @@ convert        [experimental] Convert package from single-branch development
                into the orphan-packaging plus patch-queue / development branch
                development model."""
 
-def compress_patches(patches, compress_size=0):
+class PatchCompressor(object):
     """
-    Rename and/or compress patches
+    Write patch files, compressing the ones larger than a given size
+
+    Compressed patches are piped to a pool of I{gzip -n} processes while the
+    rest of the patches is being generated so the uncompressed versions are
+    never written to disk. GNU gzip is used instead of zlib so that the
+    compressed patches stay byte-identical to what previous versions
+    produced.
     """
-    ret_patches = []
-    for patch in patches:
-        # Compress if patch file is larger than "threshold" value
-        suffix = ''
-        if compress_size and os.path.getsize(patch) > compress_size:
-            gbp.log.debug("Compressing %s" % os.path.basename(patch))
-            subprocess.Popen(['gzip', '-n', patch]).communicate()
-            suffix = '.gz'
-
-        ret_patches.append(os.path.basename(patch) + suffix)
-    return ret_patches
+    def __init__(self, compress_size=0, threads=4):
+        self.compress_size = compress_size
+        self.threads = threads
+        self.compressed = set()
+        self._pool = None
+        self._results = []
+
+    def __call__(self, filename, content):
+        """Write (or schedule compressing) one patch"""
+        if self.compress_size and len(content) > self.compress_size:
+            if not self._pool:
+                self._pool = ThreadPool(self.threads)
+            self.compressed.add(filename)
+            self._results.append(self._pool.apply_async(self._gzip,
+                                                        (filename, content)))
+        else:
+            with open(filename, 'w') as patch:
+                patch.write(content)
+
+    @staticmethod
+    def _gzip(filename, content):
+        """Compress content into filename.gz"""
+        gbp.log.debug("Compressing %s" % os.path.basename(filename))
+        with open(filename + '.gz', 'w') as compressed:
+            popen = subprocess.Popen(['gzip', '-n', '-c'],
+                                     stdin=subprocess.PIPE, stdout=compressed,
+                                     close_fds=True)
+            popen.communicate(content)
+        if popen.returncode:
+            raise GbpError("Failed to compress patch %s" %
+                           os.path.basename(filename))
+
+    def finish(self, patches):
+        """
+        Wait for the compression to finish
+
+        @param patches: paths of the patches written
+        @type patches: C{list} of C{str}
+        @return: the (compressed) patches' filenames
+        @rtype: C{list} of C{str}
+        """
+        try:
+            for result in self._results:
+                result.get()
+        finally:
+            if self._pool:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+            self._results = []
+        return [os.path.basename(patch) +
+                    ('.gz' if patch in self.compressed else '')
+                for patch in patches]
 
 def is_ancestor(repo, parent, child):
     """Check if commit is ancestor of another"""
@@ -88,6 +138,24 @@ def is_ancestor(repo, parent, child):
         merge_base = None
     return merge_base == parent_sha1
 
+def _ancestors(commit, parents):
+    """
+    Get the ancestors of a commit, including the commit itself, that are
+    part of a revision walk
+
+    >>> sorted(_ancestors('b', {'a': ['x'], 'b': ['a'], 'c': ['b']}))
+    ['a', 'b']
+    """
+    seen = set()
+    todo = [commit]
+    while todo:
+        sha1 = todo.pop()
+        if sha1 in seen or sha1 not in parents:
+            continue
+        seen.add(sha1)
+        todo.extend(parents[sha1])
+    return seen
+
 def generate_patches(repo, start, squash, end, outdir, options):
     """
     Generate patch files from git
@@ -95,32 +163,47 @@ def generate_patches(repo, start, squash, end, outdir, options):
     gbp.log.info("Generating patches from git (%s..%s)" % (start, end))
     patches = []
     commands = {}
-    for treeish in [start, end]:
-        if not repo.has_treeish(treeish):
+    writer = PatchCompressor(options.patch_export_compress)
+
+    # Resolve all the revisions we need at once
+    names = [start, end]
+    objs = repo.batch_check_objects(['%s^{tree}' % start, '%s^{tree}' % end,
+                                     '%s^0' % start, '%s^0' % end, 'HEAD^0'])
+    for treeish, obj in zip(names, objs[:2]):
+        if not obj:
             raise GbpError('Invalid treeish object %s' % treeish)
-
-    start_sha1 = repo.rev_parse("%s^0" % start)
-    try:
+    if not objs[2]:
+        raise GitRepositoryError("revision '%s^0' not found" % start)
+    start_sha1 = objs[2][0]
+    if objs[3]:
         end_commit = end
-        end_commit_sha1 = repo.rev_parse("%s^0" % end_commit)
-    except GitRepositoryError:
+        end_commit_sha1 = objs[3][0]
+    else:
         # In case of plain tree-ish objects, assume current branch head is the
         # last commit
         end_commit = "HEAD"
-        end_commit_sha1 = repo.rev_parse("%s^0" % end_commit)
-
-    start_sha1 = repo.rev_parse("%s^0" % start)
-
-    if not is_ancestor(repo, start_sha1, end_commit_sha1):
+        if not objs[4]:
+            raise GitRepositoryError("revision 'HEAD^0' not found")
+        end_commit_sha1 = objs[4][0]
+
+    # Walk the history once, everything else is computed from that
+    walk = repo.get_commits_parents(start_sha1, end_commit_sha1)
+    parents = dict(walk)
+    if start_sha1 != end_commit_sha1 and \
+            not any(start_sha1 in commit_parents for _c, commit_parents in walk):
         raise GbpError("Start commit '%s' not an ancestor of end commit "
                        "'%s'" % (start, end_commit))
+    excluded = set()
     # Squash commits, if requested
     if squash[0]:
         if squash[0] == 'HEAD':
             squash[0] = end_commit
-        squash_sha1 = repo.rev_parse("%s^0" % squash[0])
+        squash_obj = repo.batch_check_objects(['%s^0' % squash[0]])[0]
+        if not squash_obj:
+            raise GitRepositoryError("revision '%s^0' not found" % squash[0])
+        squash_sha1 = squash_obj[0]
         if start_sha1 != squash_sha1:
-            if not squash_sha1 in repo.get_commits(start, end_commit):
+            if not squash_sha1 in parents:
                 raise GbpError("Given squash point '%s' not in the history "
                                "of end commit '%s'" % (squash[0], end_commit))
             # Shorten SHA1s
@@ -130,49 +213,68 @@ def generate_patches(repo, start, squash, end, outdir, options):
                          (start_sha1, squash_sha1))
             patch_fn = format_diff(outdir, squash[1], repo,
                                    start_sha1, squash_sha1,
-                                   options.patch_export_ignore_path)
+                                   options.patch_export_ignore_path, writer)
             if patch_fn:
                 patches.append(patch_fn)
                 start = squash_sha1
+                excluded = _ancestors(squash_obj[0], parents)
     # Check for merge commits, yet another squash if merges found
-    merges = repo.get_commits(start, end_commit, options=['--merges'])
+    merges = [commit for commit, commit_parents in walk
+                if len(commit_parents) > 1 and commit not in excluded]
     if merges:
         # Shorten SHA1s
         start_sha1 = repo.rev_parse(start, short=7)
         merge_sha1 = repo.rev_parse(merges[0], short=7)
         patch_fn = format_diff(outdir, None, repo, start_sha1, merge_sha1,
-                               options.patch_export_ignore_path)
+                               options.patch_export_ignore_path, writer)
         if patch_fn:
             gbp.log.info("Merge commits found! Diff between %s..%s written "
                          "into one monolithic diff" % (start_sha1, merge_sha1))
             patches.append(patch_fn)
             start = merge_sha1
-            print start
+            excluded = _ancestors(merges[0], parents)
 
-    # Generate patches
-    for commit in reversed(repo.get_commits(start, end_commit)):
-        info = repo.get_commit_info(commit)
+    # Generate patches, fetching the metadata and diffs of all commits at once
+    commits = [commit for commit, _p in reversed(walk) if commit not in excluded]
+    infos = repo.get_commits_info(commits)
+    to_export = []
+    for info in infos:
         cmds = parse_gbp_commands(info, 'gbp-rpm', ('ignore'),
                                   ('if', 'ifarch'))[0]
         if not 'ignore' in cmds:
-            patch_fn = format_patch(outdir, repo, info, patches,
-                                    options.patch_numbers,
-                                    options.patch_export_ignore_path)
-            if patch_fn:
-                commands[os.path.basename(patch_fn)] = cmds
+            to_export.append((info, cmds))
         else:
             gbp.log.info('Ignoring commit %s' % info['id'])
 
+    paths = None
+    if options.patch_export_ignore_path:
+        paths = set()
+        for info, _cmds in to_export:
+            paths.update(patch_path_filter(info['files'],
+                                           options.patch_export_ignore_path))
+        paths = sorted(paths)
+    diffs = {}
+    if paths is None or paths:
+        diffs = repo.diff_commits([info['id'] for info, _c in to_export],
+                                  paths=paths, stat=80, summary=True, text=True)
+    for info, cmds in to_export:
+        patch_fn = format_patch(outdir, repo, info, patches,
+                                options.patch_numbers,
+                                options.patch_export_ignore_path,
+                                diff=diffs.get(info['id'], ''), writer=writer)
+        if patch_fn:
+            commands[os.path.basename(patch_fn)] = cmds
+
     # Generate diff to the tree-ish object
     if end_commit != end:
         gbp.log.info("Generating diff file %s..%s" % (end_commit, end))
         patch_fn = format_diff(outdir, None, repo, end_commit, end,
-                               options.patch_export_ignore_path)
+                               options.patch_export_ignore_path, writer)
         if patch_fn:
             patches.append(patch_fn)
 
-    # Compress
-    patches = compress_patches(patches, options.patch_export_compress)
+    # Wait for the compression to finish
+    patches = writer.finish(patches)
 
     return patches, commands
 
@@ -324,6 +426,7 @@ def safe_patches(queue, tmpdir_base):
         safequeue.append(patch)
         safequeue[-1].path = dst_name
 
+    safequeue.read_info()
     return safequeue
 
 
@@ -699,6 +802,7 @@ def main(argv):
     except GitRepositoryError:
         gbp.log.err("%s is not a git repository" % (os.path.abspath('.')))
         return 1
+    init_spec_cache(repo)
 
     if os.path.abspath('.') != repo.path:
         gbp.log.warn("Switching to topdir before running commands")
@@ -20,33 +20,60 @@
 """Pull remote changes and fast forward debian, upstream and pristine-tar branch"""
 
 import ConfigParser
+import glob
+import subprocess
 import sys
 import os, os.path
+import time
+import gbp
 from gbp.command_wrappers import (Command, CommandExecFailed)
 from gbp.config import (GbpOptionParser, GbpOptionGroup)
 from gbp.errors import GbpError
 from gbp.git import GitRepositoryError
+from gbp.scripts.common import update_commit_graph
 import gbp.log
 try:
     from gbp.deb.git import DebianGitRepository as GitRepository
 except ImportError:
     from gbp.rpm.git import RpmGitRepository as GitRepository
 
-def update_branch(branch, repo, options):
+# Update the commit-graph if a pull brings in at least that many commits or
+# the repository doesn't have one yet
+COMMIT_GRAPH_MIN_COMMITS = 100
+
+def update_branch(branch, repo, options, tracking=None, current=None,
+                  fast_forwards=None):
     """
     update branch to its remote branch, fail on non fast forward updates
     unless --force is given
+    @param tracking: tracking info of the repository's branches as returned
+        by L{GitRepository.get_tracking_info}, looked up if not given
+    @type tracking: C{dict}
+    @param current: the currently checked out branch, looked up if not given
+    @type current: C{str}
+    @param fast_forwards: if given, fast forwards of branches that aren't
+        checked out are added to it instead of being done right away so
+        they can be done at once with L{GitRepository.update_refs}
+    @type fast_forwards: C{list}
     @return: branch updated or already up to date
     @rtype: boolean
     """
     update = None
 
-    remote = repo.get_merge_branch(branch)
-    if not remote:
+    if tracking is None:
+        tracking = repo.get_tracking_info()
+    info = tracking.get(branch)
+    if not info:
         gbp.log.warn("No branch tracking '%s' found - skipping." % branch)
         return False
+    remote = info['upstream']
+    if not info['upstream_commit']:
+        gbp.log.warn("Branch '%s' tracked by '%s' not found - skipping." %
+                     (remote, branch))
+        return False
 
-    can_fast_forward, up_to_date = repo.is_fast_forward(branch, remote)
+    can_fast_forward = info['ahead'] == 0
+    up_to_date = info['behind'] == 0
 
     if up_to_date: # Great, we're done
         gbp.log.info("Branch '%s' is already up to date." % branch)
@@ -67,7 +94,9 @@ def update_branch(branch, repo, options):
 
     if update:
         gbp.log.info("Updating '%s'" % branch)
-        if repo.branch == branch:
+        if current is None:
+            current = repo.branch
+        if current == branch:
             if update == 'merge':
                 repo.merge(remote)
             elif update == 'clean':
@@ -83,23 +112,154 @@ def update_branch(branch, repo, options):
                 repo.rename_branch(tmpbranch, branch)
         else:
             if can_fast_forward or (update == 'clean'):
-                sha1 = repo.rev_parse(remote)
-                repo.update_ref("refs/heads/%s" % branch, sha1,
-                                msg="gbp: forward %s to %s" % (branch, remote))
+                ref = "refs/heads/%s" % branch
+                sha1 = info['upstream_commit']
+                if fast_forwards is None:
+                    repo.update_ref(ref, sha1, msg="gbp: forward %s to %s" %
+                                                   (branch, remote))
+                else:
+                    fast_forwards.append((ref, sha1, info['commit']))
             elif update == 'merge':
                 # Merge other branch, if it cannot be fast-forwarded
-                current_branch=repo.branch
                 repo.set_branch(branch)
                 repo.merge(remote)
-                repo.set_branch(current_branch)
+                repo.set_branch(current)
 
     return (update != None)
 
 
+def find_repos(patterns):
+    """
+    Expand the repositories given on the command line
+
+    @param patterns: paths or shell globs of repositories
+    @type patterns: C{list} of C{str}
+    @return: the repositories, each one listed once
+    @rtype: C{list} of C{str}
+    """
+    repos = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            path = os.path.normpath(path)
+            if path not in repos:
+                repos.append(path)
+    return repos
+
+
+def pull_repo(path, args):
+    """
+    Pull a single repository by running gbp pull in it so the repository's
+    configuration is used and failures stay isolated
+
+    @param path: the repository
+    @type path: C{str}
+    @param args: options to pass to gbp pull
+    @type args: C{list} of C{str}
+    @return: the repository, the exit code, the output and the time it took
+    @rtype: C{tuple}
+    """
+    start = time.time()
+    # Make sure the same gbp runs in the repository
+    env = os.environ.copy()
+    libdir = os.path.dirname(os.path.dirname(os.path.abspath(gbp.__file__)))
+    if env.get('PYTHONPATH'):
+        libdir += os.pathsep + env['PYTHONPATH']
+    env['PYTHONPATH'] = libdir
+    cmd = [sys.executable, '-m', 'gbp.scripts.supercommand', 'pull'] + args
+    try:
+        popen = subprocess.Popen(cmd, cwd=path, env=env,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT)
+        output = popen.communicate()[0]
+        ret = popen.returncode
+    except OSError as err:
+        output = "Failed to run gbp pull: %s\n" % err
+        ret = 1
+    return path, ret, output, time.time() - start
+
+
+def pull_repos(repos, args, jobs, verbose=False):
+    """
+    Pull several repositories using at most I{jobs} concurrent pulls
+
+    @param repos: the repositories to update
+    @type repos: C{list} of C{str}
+    @param args: options to pass to gbp pull
+    @type args: C{list} of C{str}
+    @param jobs: number of repositories to update concurrently
+    @type jobs: C{int}
+    @param verbose: show the output of successful pulls too
+    @type verbose: C{bool}
+    @return: exit code like for a single repository
+    @rtype: C{int}
+    """
+    from multiprocessing.pool import ThreadPool
+
+    status = { 0: 'ok', 1: 'failed', 2: 'not fast forwarded' }
+    results = dict([(ret, []) for ret in status])
+    start = time.time()
+    pool = ThreadPool(max(1, min(jobs, len(repos))))
+    try:
+        for path, ret, output, duration in pool.imap_unordered(
+                lambda path: pull_repo(path, args), repos):
+            ret = ret if ret in status else 1
+            results[ret].append(path)
+            report = gbp.log.info if ret == 0 else gbp.log.warn
+            report("%s: %s (%.1fs)" % (path, status[ret], duration))
+            if ret or verbose:
+                for line in output.splitlines():
+                    report("%s:   %s" % (path, line))
+    finally:
+        pool.close()
+        pool.join()
+
+    gbp.log.info("Pulled %d repositories in %.1fs: %s" %
+                 (len(repos), time.time() - start,
+                  ', '.join(["%d %s" % (len(results[ret]), status[ret])
+                             for ret in sorted(status)])))
+    for ret in [2, 1]:
+        if results[ret]:
+            gbp.log.warn("%s: %s" % (status[ret].capitalize(),
+                                     ' '.join(sorted(results[ret]))))
+    if results[1]:
+        return 1
+    return 2 if results[2] else 0
+
+
+def repo_args(argv):
+    """
+    Drop the repositories from the command line so it can be used to pull
+    a single repository
+
+    >>> repo_args(['pull', '--force=merge', 'a', '-v', 'b/'])
+    ['--force=merge', '-v']
+    >>> repo_args(['pull', 'pkg', '--upstream-branch', 'pkg', 'other'])
+    ['--upstream-branch', 'pkg']
+    >>> repo_args(['pull', '-v', '--', '-a', 'b'])
+    ['-v']
+    """
+    parser = build_parser(argv[0])
+    # Stop at each repository to tell it from option values
+    parser.disable_interspersed_args()
+    args = []
+    rest = argv[1:]
+    while rest:
+        dummy, remaining = parser.parse_args(rest)
+        consumed = rest[:len(rest) - len(remaining)]
+        if consumed and consumed[-1] == '--':
+            # Only repositories follow
+            args.extend(consumed[:-1])
+            break
+        args.extend(consumed)
+        rest = remaining[1:]
+    return args
+
+
 def build_parser(name):
     try:
         parser = GbpOptionParser(command=os.path.basename(name), prefix='',
-                             usage='%prog [options] - safely update a repository from remote')
+                             usage='%prog [options] [repository ...] - safely update '
+                                   'repositories from remote')
     except ConfigParser.ParsingError as err:
         gbp.log.err(err)
         return None
@@ -123,6 +283,12 @@ def build_parser(name):
     branch_group.add_boolean_config_file_option(option_name="pristine-tar", dest="pristine_tar")
     branch_group.add_option("--depth", action="store", dest="depth", default=0,
                             help="git history depth (for deepening shallow clones)")
+    parser.add_boolean_config_file_option(option_name="commit-graph",
+                                          dest="commit_graph")
+    parser.add_option("--jobs", action="store", type="int", dest="jobs",
+                      default=4,
+                      help="number of repositories to update concurrently "
+                           "when given several, default is '%default'")
     parser.add_option("-v", "--verbose", action="store_true", dest="verbose", default=False,
                       help="verbose command execution")
     parser.add_config_file_option(option_name="color", dest="color", type='tristate')
@@ -148,6 +314,11 @@ def main(argv):
 
     gbp.log.setup(options.color, options.verbose, options.color_scheme)
 
+    # args[0] is the program name
+    if len(args) > 1:
+        return pull_repos(find_repos(args[1:]), repo_args(argv),
+                          options.jobs, options.verbose)
+
     try:
         repo = GitRepository(os.path.curdir)
     except GitRepositoryError:
@@ -173,19 +344,6 @@ def main(argv):
         if repo.has_pristine_tar_branch() and options.pristine_tar:
             branches.add(repo.pristine_tar_branch)
 
-        if options.all:
-            current_remote = repo.get_merge_branch(current)
-            if current_remote:
-                fetch_remote = current_remote.split('/')[0]
-            else:
-                fetch_remote = 'origin'
-            for branch in repo.get_local_branches():
-                merge_branch = repo.get_merge_branch(branch)
-                if merge_branch:
-                    rem, rem_br = merge_branch.split('/', 1)
-                    if rem == fetch_remote and branch == rem_br:
-                        branches.add(branch)
-
         (ret, out) = repo.is_clean()
         if not ret:
             gbp.log.err("You have uncommitted changes in your source tree:")
@@ -194,9 +352,30 @@ def main(argv):
 
         repo.fetch(depth=options.depth)
         repo.fetch(depth=options.depth, tags=True)
+        tracking = repo.get_tracking_info()
+        if options.all:
+            if current in tracking:
+                fetch_remote = tracking[current]['upstream'].split('/')[0]
+            else:
+                fetch_remote = 'origin'
+            for branch, info in tracking.items():
+                if info['upstream'] == '%s/%s' % (fetch_remote, branch):
+                    branches.add(branch)
+        new_commits = sum([tracking[branch]['behind'] for branch in branches
+                           if branch in tracking])
+        fast_forwards = []
         for branch in branches:
-            if not update_branch(branch, repo, options):
+            if not update_branch(branch, repo, options, tracking, current,
+                                 fast_forwards):
                 retval = 2
+        forwarded = [ref[len('refs/heads/'):] for ref, dummy, dummy in
+                     fast_forwards]
+        repo.update_refs(fast_forwards,
+                         msg="gbp: forward %s" % ', '.join(forwarded))
+        if options.commit_graph and new_commits and (
+                new_commits >= COMMIT_GRAPH_MIN_COMMITS or
+                not repo.has_commit_graph()):
+            update_commit_graph(repo)
 
         if options.redo_pq:
             repo.set_branch(options.packaging_branch)
@@ -25,13 +25,15 @@ import pwd
 import re
 import sys
 import socket
+import time
 
 import gbp.command_wrappers as gbpc
 import gbp.log
 from gbp.config import GbpOptionParserRpm, GbpOptionGroup
 from gbp.errors import GbpError
+from gbp.git.commitdates import CommitDateIndex
 from gbp.git.modifier import GitModifier
-from gbp.rpm import guess_spec, NoSpecError, SpecFile
+from gbp.rpm import guess_spec, NoSpecError, SpecFile, init_spec_cache
 from gbp.rpm.changelog import Changelog, ChangelogParser, ChangelogError
 from gbp.rpm.git import GitRepositoryError, RpmGitRepository
 from gbp.rpm.policy import RpmPkgPolicy
@@ -190,43 +192,54 @@ def guess_commit(section, repo, options):
     match = re.match(rev_re, header['revision'], re.I)
     fields = match.groupdict() if match else {}
 
-    # First, try to find tag-name, if present
-    if 'tagname' in fields:
-        gbp.log.debug("Trying to find tagname %s" % fields['tagname'])
-        try:
-            return repo.rev_parse("%s^0" % fields['tagname'])
-        except GitRepositoryError:
-            gbp.log.warn("Changelog points to tagname '%s' which is not found "
-                         "in the git repository" % fields['tagname'])
-
-    # Next, try to find packaging tag matching the version
+    # Resolve the tag-name and the packaging tag matching the version, if
+    # present, both at once
     tag_str_fields = {'vendor': options.vendor}
     if 'version' in fields:
-        gbp.log.debug("Trying to find packaging tag for version '%s'" %
-                      fields['version'])
-        full_version = fields['version']
-        tag_str_fields.update(RpmPkgPolicy.split_full_version(full_version))
+        tag_str_fields.update(RpmPkgPolicy.split_full_version(
+                                                        fields['version']))
     elif 'upstreamversion' in fields:
-        gbp.log.debug("Trying to find packaging tag for version '%s'" %
-                      fields['upstreamversion'])
         tag_str_fields['upstreamversion'] = fields['upstreamversion']
         if 'release' in fields:
             tag_str_fields['release'] = fields['release']
-    commit = repo.find_version(options.packaging_tag,
-                                   tag_str_fields)
-    if commit:
-        return commit
+    try:
+        version_tag = repo.version_to_tag(options.packaging_tag,
+                                          tag_str_fields)
+    except KeyError:
+        version_tag = None
+    names = []
+    if 'tagname' in fields:
+        names.append('%s^0' % fields['tagname'])
+    if version_tag:
+        names.append('refs/tags/%s^0' % version_tag)
+    found = dict(zip(names, repo.batch_check_objects(names)))
+
+    # First, try to find tag-name, if present
+    if 'tagname' in fields:
+        gbp.log.debug("Trying to find tagname %s" % fields['tagname'])
+        if found['%s^0' % fields['tagname']]:
+            return found['%s^0' % fields['tagname']][0]
+        gbp.log.warn("Changelog points to tagname '%s' which is not found "
+                     "in the git repository" % fields['tagname'])
+
+    # Next, try to find packaging tag matching the version
+    if 'version' in fields or 'upstreamversion' in fields:
+        gbp.log.debug("Trying to find packaging tag for version '%s'" %
+                      fields.get('version', fields.get('upstreamversion')))
+    if version_tag and found['refs/tags/%s^0' % version_tag]:
+        return found['refs/tags/%s^0' % version_tag][0]
     else:
         gbp.log.info("Couldn't find packaging tag for version %s" %
                      header['revision'])
 
     # As a last resort we look at the timestamp
     timestamp = header['time'].isoformat()
-    last = repo.get_commits(num=1, options="--until='%s'" % timestamp)
+    last = CommitDateIndex(repo).commit_before(
+                                    time.mktime(header['time'].timetuple()))
     if last:
         gbp.log.info("Using commit (%s) before the last changelog timestamp "
                      "(%s)" % (last, timestamp))
-        return last[0]
+        return last
     return None
 
 
@@ -492,6 +505,7 @@ def main(argv):
 
         repo = RpmGitRepository('.')
         check_repo_state(repo, options)
+        init_spec_cache(repo)
 
         # Find and parse spec file
         spec = parse_spec_file(repo, options)
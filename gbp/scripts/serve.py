@@ -0,0 +1,84 @@
+# vim: set fileencoding=utf-8 :
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+"""Run gbp commands in a long running server"""
+
+import ConfigParser
+import os
+import socket
+import sys
+from gbp.config import GbpOptionParser
+from gbp.server import Server, ServerError, socket_path, stop_server
+import gbp.log
+
+
+def build_parser(name):
+    try:
+        parser = GbpOptionParser(command=os.path.basename(name), prefix='',
+                                 usage='%prog [options] - run gbp commands '
+                                       'in a long running server')
+    except ConfigParser.ParsingError as err:
+        gbp.log.err(err)
+        return None
+
+    parser.add_option("--socket", dest="socket", default=socket_path(),
+                      help="socket to listen on, default is '%default'")
+    parser.add_option("--stop", action="store_true", dest="stop",
+                      default=False, help="stop the running server")
+    parser.add_option("-v", "--verbose", action="store_true", dest="verbose",
+                      default=False, help="verbose command execution")
+    parser.add_config_file_option(option_name="color", dest="color",
+                                  type='tristate')
+    parser.add_config_file_option(option_name="color-scheme",
+                                  dest="color_scheme")
+    return parser
+
+
+def parse_args(argv):
+    parser = build_parser(argv[0])
+    if not parser:
+        return None, None
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    (options, args) = parse_args(argv)
+    if not options:
+        return 1
+
+    gbp.log.setup(options.color, options.verbose, options.color_scheme)
+
+    if options.stop:
+        if not stop_server(options.socket):
+            gbp.log.err("No server running on '%s'" % options.socket)
+            return 1
+        return 0
+
+    server = Server(options.socket)
+    server.preload()
+    try:
+        server.serve()
+    except (ServerError, socket.error, OSError) as err:
+        gbp.log.err(err)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
+
+# vim:et:ts=4:sw=4:et:sts=4:ai:set list listchars=tab\:»·,trail\:·:
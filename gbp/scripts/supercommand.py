@@ -17,7 +17,6 @@
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """Supercommand for all gbp commands"""
 
-import glob
 import os
 import re
 import sys
@@ -26,6 +25,32 @@ import sys
 # so we don't allow these to be imported:
 invalid_modules = [ 'common', 'supercommand' ]
 
+# The available commands and their descriptions (the docstrings of the
+# command modules) so listing them doesn't need to import every module
+commands = {
+    'buildpackage':       'Build a debian package out of a GIT repository',
+    'buildpackage-bb':    'Build an RPM package out of a Git repo with Bitbake meta data',
+    'buildpackage-rpm':   'run commands to build an RPM package out of a git repository',
+    'clone':              'Clone a GIT repository and set it up for gbp',
+    'clone-bb':           'Clone a package Git repository from a bitbake-based distro',
+    'config':             'Query and display config file values',
+    'create-remote-repo': 'Create a remote GIT repository based on the current one',
+    'dch':                'Generate Debian changelog entries from GIT commit messages',
+    'import-bb':          'Import an RPM package in Bitbake format',
+    'import-dsc':         'Import a Debian source package into a GIT repository',
+    'import-dscs':        'Import multiple dsc files into GIT in one go',
+    'import-orig':        'Import a new upstream version into a GIT repository',
+    'import-orig-rpm':    'Import a new upstream version into a git repository',
+    'import-srpm':        'Import an RPM source package into a GIT repository',
+    'pq':                 'Manage Debian patches on a patch queue branch',
+    'pq-bb':              'manage patches in a patch queue',
+    'pq-rpm':             'manage patches in a patch queue',
+    'pull':               'Pull remote changes and fast forward debian, upstream and pristine-tar branch',
+    'rpm-ch':             'Generate RPM changelog entries from git commit messages',
+    'serve':              'Run gbp commands in a long running server',
+    'submit-bb':          'Create and push submit tag',
+}
+
 def sanitize(cmd):
     """
     '-' is not allowed in module names
@@ -77,6 +102,8 @@ def pymod_to_cmd(mod):
 
 
 def get_available_commands(path):
+    import glob
+
     cmds = []
     for f in glob.glob(os.path.join(path, '*.py')):
         if os.path.basename(f) in ['__init__.py', 'supercommand.py']:
@@ -85,9 +112,22 @@ def get_available_commands(path):
     return cmds
 
 
+def get_command_description(cmd):
+    """
+    Get the description of a command, only commands missing from
+    L{commands} are imported for that.
+
+    >>> get_command_description('config')
+    'Query and display config file values'
+    """
+    try:
+        return commands[cmd]
+    except KeyError:
+        return import_command(cmd).__doc__
+
+
 def list_available_commands():
-    mod = __import__('gbp.scripts', fromlist='main', level=0)
-    path = os.path.dirname(mod.__file__)
+    path = os.path.dirname(os.path.abspath(__file__))
     maxlen = 0
 
     print("Available commands in %s\n" % path)
@@ -96,13 +136,16 @@ def list_available_commands():
         if len(cmd[0]) > maxlen:
             maxlen = len(cmd[0])
     for cmd in cmds:
-        mod = import_command(cmd[0])
-        doc = mod.__doc__
+        doc = get_command_description(cmd[0])
         print("    %s - %s" % (cmd[0].rjust(maxlen), doc))
     print('')
 
 
-def supercommand(argv=None):
+def supercommand(argv=None, use_server=True):
+    """
+    Run a gbp command, in a running L{gbp.server} unless I{use_server} is
+    C{False}
+    """
     argv = argv or sys.argv
 
     if len(argv) < 2:
@@ -122,6 +165,12 @@ def supercommand(argv=None):
         list_available_commands()
         return 0
 
+    if use_server and cmd != 'serve':
+        from gbp.server import run_client
+        ret = run_client(argv)
+        if ret is not None:
+            return ret
+
     try:
         module = import_command(cmd)
     except ImportError as e:
@@ -0,0 +1,491 @@
+# vim: set fileencoding=utf-8 :
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Run gbp commands in a long running server
+
+The server keeps the command modules imported and what it learned about
+the repositories it ran commands in. Every command runs in a process
+forked off the server so commands can't interfere with each other or
+with the server. The client forwards its arguments, working directory
+and environment and relays the command's stdout and stderr. Input is
+only relayed from a terminal, otherwise the command reads from
+I{/dev/null} so the caller's stdin is left alone.
+
+Messages are frames of a type, a length and data. The client sends a
+I{request} frame followed by I{stdin} frames if its stdin is a terminal,
+the server answers with
+I{stdout} and I{stderr} frames and finally an I{exit} frame holding the
+exit code.
+"""
+
+import errno
+import marshal
+import os
+import socket
+import struct
+import sys
+
+REQUEST, STDIN, STDOUT, STDERR, EXIT = 'R', 'i', 'o', 'e', 'x'
+
+# Frame header: type and length of the data
+_header = struct.Struct('!cI')
+
+
+class ServerError(Exception):
+    """Communication with the server failed"""
+    pass
+
+
+def socket_path():
+    """
+    The socket the server listens on, I{GBP_SERVER_SOCKET} if set.
+    Otherwise it's in a directory only accessible by the current user.
+    """
+    path = os.getenv('GBP_SERVER_SOCKET')
+    if path:
+        return path
+    rundir = os.getenv('XDG_RUNTIME_DIR') or '/tmp'
+    return os.path.join(rundir, 'gbp-%d' % os.getuid(), 'server')
+
+
+def _set_cloexec(fd):
+    """Don't pass I{fd} on to executed programs"""
+    import fcntl
+
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+
+def _check_socket_dir(path):
+    """Make sure nobody else can connect to or replace our socket"""
+    dirname = os.path.dirname(os.path.abspath(path))
+    stat = os.stat(dirname)
+    if stat.st_uid != os.getuid() or stat.st_mode & 0077:
+        raise ServerError("Socket directory '%s' isn't private" % dirname)
+
+
+def send_frame(sock, kind, data=''):
+    """Send a frame"""
+    sock.sendall(_header.pack(kind, len(data)) + data)
+
+
+def _recv_exactly(sock, size):
+    """Receive I{size} bytes, C{None} if the peer closed the connection"""
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+def recv_frame(sock):
+    """
+    Receive a frame
+
+    @return: the frame's type and data, C{(None, None)} if the peer closed
+        the connection
+    @rtype: C{tuple}
+    """
+    header = _recv_exactly(sock, _header.size)
+    if header is None:
+        return None, None
+    kind, length = _header.unpack(header)
+    data = _recv_exactly(sock, length) if length else ''
+    if data is None:
+        return None, None
+    return kind, data
+
+
+def run_client(argv, path=None):
+    """
+    Run a command in the server
+
+    @param argv: the command line
+    @type argv: C{list} of C{str}
+    @param path: the server's socket
+    @type path: C{str}
+    @return: the command's exit code, C{None} if no server is running
+    @rtype: C{int}
+    """
+    import threading
+
+    path = path or socket_path()
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        _check_socket_dir(path)
+        sock.connect(path)
+    except (socket.error, OSError, ServerError):
+        sock.close()
+        return None
+
+    # marshal keeps byte strings as they are and client and server run
+    # the same python
+    request = dict(argv=argv, cwd=os.getcwd(), env=dict(os.environ),
+                   tty=[os.isatty(fd) for fd in range(3)])
+    try:
+        send_frame(sock, REQUEST, marshal.dumps(request))
+    except socket.error:
+        sock.close()
+        return None
+
+    def forward_stdin(fd):
+        import select
+        import time
+
+        try:
+            while True:
+                if not select.select([fd], [], [], 0.2)[0]:
+                    continue
+                # Reading the terminal while in the background would
+                # get us stopped
+                if os.tcgetpgrp(fd) != os.getpgrp():
+                    time.sleep(0.2)
+                    continue
+                data = os.read(fd, 65536)
+                send_frame(sock, STDIN, data)
+                if not data:
+                    break
+        except (OSError, socket.error, select.error):
+            pass
+
+    if request['tty'][0]:
+        feeder = threading.Thread(target=forward_stdin,
+                                  args=(sys.stdin.fileno(),))
+        feeder.daemon = True
+        feeder.start()
+
+    streams = {STDOUT: sys.stdout, STDERR: sys.stderr}
+    try:
+        while True:
+            kind, data = recv_frame(sock)
+            if kind in streams:
+                streams[kind].write(data)
+                streams[kind].flush()
+            elif kind == EXIT:
+                return int(data)
+            else:
+                print >>sys.stderr, "gbp: lost connection to server"
+                return 1
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        sock.close()
+
+
+def stop_server(path=None):
+    """
+    Stop a running server
+
+    @return: whether a server was running
+    @rtype: C{bool}
+    """
+    path = path or socket_path()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        send_frame(sock, REQUEST, marshal.dumps(dict(stop=True)))
+        recv_frame(sock)
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+    return True
+
+
+class Server(object):
+    """
+    Serve gbp commands on a Unix socket
+
+    @ivar path: the socket
+    @type path: C{str}
+    """
+    # Files whose change means the repository's state changed
+    watched = ['HEAD', 'config', 'index', 'packed-refs', 'refs/heads',
+               'refs/tags', 'refs/remotes']
+
+    def __init__(self, path=None):
+        self.path = path or socket_path()
+        self._sock = None
+        self._children = set()
+        # Repository path -> (stamp, detected repository)
+        self._repos = {}
+
+    def _listen(self):
+        import gbp.log
+
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname, 0700)
+        _check_socket_dir(self.path)
+        if os.path.exists(self.path):
+            if stop_server(self.path):
+                gbp.log.info("Replacing running server")
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        self._sock.listen(16)
+
+    @staticmethod
+    def preload():
+        """Import all commands so running them doesn't need to"""
+        import gbp.scripts.supercommand as supercommand
+
+        for cmd in supercommand.commands:
+            try:
+                supercommand.import_command(cmd)
+            except ImportError:
+                # Missing optional dependencies, e.g. for rpm support
+                pass
+
+    def _stamp(self, git_dir):
+        """Modification times of the repository's refs and index"""
+        stamp = []
+        for name in self.watched:
+            try:
+                stamp.append(os.stat(os.path.join(git_dir, name)).st_mtime)
+            except OSError:
+                stamp.append(None)
+        return stamp
+
+    def warm_up(self, path):
+        """
+        Look up the repository at I{path} and parse its config files so
+        commands don't need to, drop what we know about the repository once
+        its refs or index changed
+        """
+        import ConfigParser
+        from gbp.config import GbpOptionParser
+        from gbp.git import GitRepository, GitRepositoryError
+
+        path = os.path.abspath(path)
+        cached = self._repos.get(path)
+        if cached and self._stamp(cached[1].git_dir) != cached[0]:
+            del self._repos[path]
+            GitRepository.forget_detected(path)
+            cached = None
+        if not cached:
+            try:
+                repo = GitRepository(path)
+            except GitRepositoryError:
+                return
+            GitRepository.remember_detected(path, repo)
+            cached = self._repos[path] = (self._stamp(repo.git_dir), repo)
+        try:
+            GbpOptionParser.preload_config_files(cached[1])
+        except ConfigParser.Error:
+            # Leave reporting broken config files to the command
+            pass
+
+    def _reap(self):
+        """Collect exited commands"""
+        for pid in list(self._children):
+            try:
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    self._children.discard(pid)
+            except OSError:
+                self._children.discard(pid)
+
+    def serve(self):
+        """Handle requests until asked to stop"""
+        import gbp.log
+
+        self._listen()
+        gbp.log.info("Serving gbp commands on '%s'" % self.path)
+        try:
+            while True:
+                try:
+                    conn = self._sock.accept()[0]
+                except socket.error as err:
+                    if err.errno == errno.EINTR:
+                        continue
+                    raise
+                self._reap()
+                try:
+                    kind, data = recv_frame(conn)
+                    if kind != REQUEST:
+                        continue
+                    request = marshal.loads(data)
+                    if request.get('stop'):
+                        send_frame(conn, EXIT, '0')
+                        break
+                    self.warm_up(request['cwd'])
+                    pid = os.fork()
+                    if not pid:
+                        self._sock.close()
+                        self._run_command(conn, request)
+                    self._children.add(pid)
+                except (socket.error, ValueError, EOFError, OSError) as err:
+                    gbp.log.warn("Failed to handle request: %s" % err)
+                finally:
+                    conn.close()
+        finally:
+            self._sock.close()
+            os.unlink(self.path)
+            gbp.log.info("Server stopped")
+
+    @staticmethod
+    def _run_command(conn, request):
+        """Run the requested command in the forked off process, never returns"""
+        ret = 1
+        try:
+            ret = _Command(conn, request).run()
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+        finally:
+            os._exit(ret)
+
+
+class _Command(object):
+    """A command run on behalf of a client"""
+    def __init__(self, conn, request):
+        import threading
+
+        self._conn = conn
+        self._request = request
+        self._lock = threading.Lock()
+        self._done = False
+
+    def _send(self, kind, data=''):
+        with self._lock:
+            send_frame(self._conn, kind, data)
+
+    def _relay_output(self, fd, kind):
+        """Send what the command writes to I{fd} to the client"""
+        while True:
+            try:
+                data = os.read(fd, 65536)
+            except OSError as err:
+                # A pty's master gets EIO once the slave side is closed
+                if err.errno == errno.EINTR:
+                    continue
+                break
+            if not data:
+                break
+            try:
+                self._send(kind, data)
+            except socket.error:
+                break
+        os.close(fd)
+
+    def _relay_input(self, fd):
+        """
+        Feed the client's stdin to the command, if I{fd} is C{None} only
+        watch for the client going away
+        """
+        import signal
+
+        while True:
+            try:
+                kind, data = recv_frame(self._conn)
+            except socket.error:
+                kind = None
+            if kind is None:
+                # Client went away, take the command down with it
+                if not self._done:
+                    os.killpg(0, signal.SIGTERM)
+                return
+            if fd is None:
+                continue
+            try:
+                if data:
+                    os.write(fd, data)
+                    continue
+            except OSError:
+                pass
+            os.close(fd)
+            fd = None
+
+    @staticmethod
+    def _output_fds(tty):
+        """A pty if the client's stream is a terminal, a pipe otherwise"""
+        if not tty:
+            read_fd, write_fd = os.pipe()
+        else:
+            import termios
+            import tty as ttymod
+
+            read_fd, write_fd = os.openpty()
+            # The client's terminal converts line endings already
+            ttymod.setraw(write_fd, termios.TCSANOW)
+        _set_cloexec(read_fd)
+        return read_fd, write_fd
+
+    def run(self):
+        import threading
+        import gbp.scripts.supercommand as supercommand
+
+        request = self._request
+        os.setpgid(0, 0)
+        # Don't leak the connection to the commands' subprocesses
+        _set_cloexec(self._conn.fileno())
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+
+        threads = []
+        for fd, kind in [(1, STDOUT), (2, STDERR)]:
+            read_fd, write_fd = self._output_fds(request['tty'][fd])
+            os.dup2(write_fd, fd)
+            os.close(write_fd)
+            threads.append(threading.Thread(target=self._relay_output,
+                                            args=(read_fd, kind)))
+        if request['tty'][0]:
+            read_fd, write_fd = os.pipe()
+            _set_cloexec(write_fd)
+        else:
+            read_fd, write_fd = os.open(os.devnull, os.O_RDONLY), None
+        os.dup2(read_fd, 0)
+        os.close(read_fd)
+        feeder = threading.Thread(target=self._relay_input, args=(write_fd,))
+        feeder.daemon = True
+        threads.append(feeder)
+        for thread in threads:
+            thread.start()
+
+        try:
+            ret = supercommand.supercommand(request['argv'], use_server=False)
+        except SystemExit as err:
+            ret = err.code
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            ret = 1
+        if ret is None:
+            ret = 0
+        elif not isinstance(ret, int):
+            print >>sys.stderr, ret
+            ret = 1
+
+        # Close our end of stdout and stderr so relaying them finishes
+        sys.stdout.flush()
+        sys.stderr.flush()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+        for thread in threads[:2]:
+            thread.join()
+        self._done = True
+        self._send(EXIT, str(ret))
+        return ret
+
+# vim:et:ts=4:sw=4:et:sts=4:ai:set list listchars=tab\:»·,trail\:·:
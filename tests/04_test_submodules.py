@@ -140,5 +140,24 @@ def test_get_more_submodules():
         eq_(len(module[1]) , 40)
         ok_(os.path.basename(module[0]) in SUBMODULE_NAMES)
 
+def test_is_clean():
+    """Changes in a submodule's working tree make the repository unclean"""
+    subdir = os.path.join(REPODIR, SUBMODULES[0].name)
+    ok_(REPO.is_clean()[0])
+    newfile = os.path.join(subdir, 'newfile')
+    open(newfile, 'w').close()
+    clean, out = REPO.is_clean()
+    ok_(not clean)
+    ok_(SUBMODULES[0].name in out)
+    ok_(REPO.is_clean(ignore_untracked=True)[0])
+    os.unlink(newfile)
+    ok_(REPO.is_clean()[0])
+    testfile = os.path.join(subdir, TESTFILE_NAME)
+    content = open(testfile).read()
+    open(testfile, 'a').write('more')
+    ok_(not REPO.is_clean(ignore_untracked=True)[0])
+    open(testfile, 'w').write(content)
+    ok_(REPO.is_clean()[0])
+
 
 # vim:et:ts=4:sw=4:et:sts=4:ai:set list listchars=tab\:»·,trail\:·:
@@ -14,10 +14,18 @@ from gbp.scripts import buildpackage
 from gbp.deb import (DebianPkgPolicy, orig_file)
 from gbp.errors import GbpError
 
+class MockPristineTar:
+    def __init__(self, archive=None):
+        self.archive = archive
+
+    def get_archive_name(self, regex):
+        return self.archive
+
 class MockGitRepository:
-    def __init__(self, with_branch=False, subject=None):
+    def __init__(self, with_branch=False, subject=None, archive=None):
         self.with_branch = with_branch
         self.subject = subject
+        self.pristine_tar = MockPristineTar(archive)
 
     def has_pristine_tar_branch(self):
         return self.with_branch
@@ -25,9 +33,6 @@ class MockGitRepository:
     def pristine_tar_branch(self):
         'pristine-tar'
 
-    def grep_log(self, regex, branch):
-        return None
-
     def get_commit_info(self, commit):
         return {'subject': self.subject}
 
@@ -71,6 +76,14 @@ class TestDetection(unittest.TestCase):
             repo, 'auto', self.cp, str(self.tmpdir))
         self.assertEqual("bzip2", guessed)
 
+    def test_guess_comp_type_auto_pristine_tar_archive(self):
+        subject = 'pristine-tar data for source_1.3.orig.tar.bz2'
+        repo = MockGitRepository(with_branch=True, subject=subject,
+                                 archive='source_1.2.orig.tar.xz')
+        guessed = buildpackage.guess_comp_type(
+            repo, 'auto', self.cp, str(self.tmpdir))
+        self.assertEqual("xz", guessed)
+
     def test_has_orig_false(self):
         self.assertFalse(DebianPkgPolicy.has_orig(orig_file(self.cp, 'gzip'), str(self.tmpdir)))
 
@@ -91,6 +91,29 @@ class TestTar(unittest.TestCase):
         self._check_tar(repacked, ["foobar/errors.py", "foobar/__init__.py"])
         repacked2 = source.pack(target, newprefix="")
         self._check_tar(repacked2, ["./errors.py", "./__init__.py"])
+        self.assertEqual(repacked2.prefix, '')
+
+    def test_prefix(self):
+        """Check determining the prefix of tarballs"""
+        target = self.tmpdir.join("gbp_0.1.tar.bz2")
+        self.source.pack(target)
+        self.assertEqual(UpstreamSource(target).prefix, 'gbp')
+
+        target = self.tmpdir.join("test_0.1.tar")
+        tarobj = tarfile.open(target, mode='w')
+        tarobj.add(os.path.join(context.projectdir, 'gbp', 'errors.py'),
+                   arcname='test/errors.py')
+        tarobj.add(os.path.join(context.projectdir, 'gbp', 'log.py'),
+                   arcname='log.py')
+        tarobj.close()
+        self.assertEqual(UpstreamSource(target).prefix, '')
+
+        # Changed archive isn't taken from the cache
+        tarobj = tarfile.open(target, mode='w')
+        tarobj.add(os.path.join(context.projectdir, 'gbp', 'errors.py'),
+                   arcname='test/errors.py')
+        tarobj.close()
+        self.assertEqual(UpstreamSource(target).prefix, 'test')
 
 
 class TestZip(unittest.TestCase):
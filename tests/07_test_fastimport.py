@@ -60,3 +60,26 @@ def test_result():
     assert os.path.lexists(testlink), "%s doesn't exist" % testlink
     assert os.readlink(testlink) == tf_name
 
+
+def test_marks():
+    """Reference blobs and commits by marks"""
+    fastimport = gbp.git.FastImport(repo)
+    author = repo.get_author_info()
+    blob = fastimport.add_blob('content')
+    base = fastimport.start_commit('base', author, "base", parents=[])
+    fastimport.add_file_ref('a file', blob)
+    side = fastimport.start_commit('side', author, "side", parents=[base])
+    fastimport.deleteall()
+    fastimport.add_file_ref('"quoted"', blob, fastimport.m_exec)
+    merge = fastimport.start_commit('base', author, "merge",
+                                    parents=[base, side])
+    fastimport.add_tag('merged', merge, author, "merged\n")
+    fastimport.reset('other', side)
+    assert fastimport.close() == 0
+
+    assert repo.get_commits(until='merged', options=['--merges']) == \
+        [repo.rev_parse('base')]
+    assert repo.rev_parse('other') == repo.rev_parse('side')
+    assert repo.list_tree('side') == [['100755', 'blob',
+                                       repo.rev_parse('base:a file'),
+                                       '"quoted"']]
@@ -11,7 +11,7 @@ try:
 except ImportError:
     import unittest
 
-from gbp.patch_series import Patch
+from gbp.patch_series import Patch, PatchSeries
 
 
 class TestPatch(unittest.TestCase):
@@ -42,3 +42,34 @@ class TestPatch(unittest.TestCase):
                          "It can span several lines.\n",
                          p.long_desc)
         self.assertEqual('Sat, 24 Dec 2011 12:05:53 +0100', p.date)
+
+    def test_mail_header(self):
+        """Get the patch information from a mail style patch"""
+        patchfile = os.path.join(self.data_dir, "patch2.diff")
+        p = Patch(patchfile)
+        self.assertEqual('Fix the frobnicator', p.subject)
+        self.assertEqual('J\xc3\xb6rg Doe', p.author)
+        self.assertEqual("joerg@example.com", p.email)
+        self.assertEqual("Frobnicating failed on empty input.\n\n",
+                         p.long_desc)
+
+    def test_mail_encoded(self):
+        """Get the patch information from a quoted-printable patch"""
+        patchfile = os.path.join(self.data_dir, "patch3.diff")
+        p = Patch(patchfile)
+        self.assertEqual('Handle umlauts', p.subject)
+        self.assertEqual('J\xc3\xb6rg Doe', p.author)
+        self.assertEqual("joerg@example.com", p.email)
+        self.assertEqual("Names like J\xc3\xb6rg were mangled when the "
+                         "description was longer than seventy-six "
+                         "characters.\n", p.long_desc)
+
+    def test_series_info(self):
+        """Read the header information of a whole series"""
+        series = PatchSeries([Patch(os.path.join(self.data_dir, name))
+                              for name in ['patch1.diff', 'patch2.diff',
+                                           'doesnotexist.diff']])
+        series.read_info()
+        self.assertEqual(['This is patch1', 'Fix the frobnicator',
+                          'doesnotexist'], [p.subject for p in series])
+        self.assertEqual({}, series[2].info)
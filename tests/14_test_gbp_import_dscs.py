@@ -17,11 +17,18 @@
 
 from . import context
 
+import os
+import shutil
+import subprocess
+import tarfile
+import time
 import testutils
 import gbp.log
 import gbp.scripts.import_dscs as import_dscs
 
+from gbp.deb.git import DebianGitRepository
 from gbp.errors import GbpError
+from gbp.git import GitRepositoryError
 
 class StubGitImportDsc(object):
     """
@@ -33,13 +40,19 @@ class StubGitImportDsc(object):
             if arg.startswith('--failfile'):
                 self.failfile = "%s.dsc" % arg.split('=')[1]
 
-    def importdsc(self, dsc):
+    def importdsc(self, dsc, unpacked=None):
         """
         Stub the dsc import and fail if we were told to do
         so by the --failfile option.
         """
         return 1 if dsc.filename == self.failfile else 0
 
+    def not_imported(self, repo, dscs):
+        return dscs
+
+    def unpacker(self, jobs, max_size):
+        return import_dscs.SourceUnpacker(jobs=0)
+
 class DscStub(object):
     def __init__(self, filename, version):
         self.filename = filename
@@ -54,6 +67,7 @@ class DscStub(object):
         return cls(filename, version)
 
 # hook up stubs
+GitImportDsc, DscFile = import_dscs.GitImportDsc, import_dscs.DscFile
 import_dscs.GitImportDsc = StubGitImportDsc
 import_dscs.DscFile = DscStub
 
@@ -94,3 +108,282 @@ class TestImportDscs(testutils.DebianGitTestRepo):
         testutils.DebianGitTestRepo.tearDown(self)
         context.teardown()
 
+
+
+class TestSourceUnpacker(testutils.DebianGitTestRepo):
+    """Test L{gbp.scripts.import_dscs.SourceUnpacker}"""
+
+    def setUp(self):
+        testutils.DebianGitTestRepo.setUp(self)
+        self.dir = context.new_tmpdir(__name__)
+        self.dscs = []
+        for version in range(1, 6):
+            tgz = os.path.join(str(self.dir), 'foo_%d.orig.tar.gz' % version)
+            tar = tarfile.open(tgz, 'w:gz')
+            tar.add(os.path.join(context.projectdir, 'README'),
+                    'foo-%d/README' % version)
+            tar.close()
+            dsc = DscStub('file%d.dsc' % version, version)
+            dsc.tgz = tgz
+            self.dscs.append(dsc)
+        broken = DscStub('file6.dsc', 6)
+        broken.tgz = os.path.join(str(self.dir), 'foo_6.orig.tar.gz')
+        self.dscs.append(broken)
+
+    def test_unpack(self):
+        """Unpacked trees are handed out in order and removed afterwards"""
+        unpacker = import_dscs.SourceUnpacker(tmpdir_base=str(self.dir),
+                                              jobs=2)
+        seen = []
+        for dsc, unpacked in unpacker.unpack(self.dscs):
+            if dsc.version == 6:
+                self.assertEqual(unpacked, None)
+            else:
+                self.assertEqual(os.path.basename(unpacked),
+                                 'foo-%d' % dsc.version)
+                self.assertTrue(os.path.exists(os.path.join(unpacked,
+                                                            'README')))
+            seen.append((dsc.version, unpacked))
+        self.assertEqual([version for version, dummy in seen], range(1, 7))
+        for dummy, unpacked in seen[:-1]:
+            self.assertFalse(os.path.exists(unpacked))
+
+    def test_look_ahead(self):
+        """A single job unpacks the next package while one is imported"""
+        unpacker = import_dscs.SourceUnpacker(tmpdir_base=str(self.dir),
+                                              jobs=1)
+        started = []
+        unpack = unpacker._unpack
+
+        def record(dsc):
+            started.append(dsc.version)
+            return unpack(dsc)
+
+        unpacker._unpack = record
+        unpacked_dscs = unpacker.unpack(self.dscs)
+        for version in range(1, 4):
+            dsc, unpacked = unpacked_dscs.next()
+            self.assertEqual(dsc.version, version)
+            for dummy in range(100):
+                if len(started) > version:
+                    break
+                time.sleep(0.05)
+            time.sleep(0.1)
+            self.assertEqual(started, range(1, version + 2))
+        unpacked_dscs.close()
+
+    def test_stop_early(self):
+        """Trees unpacked ahead are removed when not imported"""
+        unpacker = import_dscs.SourceUnpacker(tmpdir_base=str(self.dir),
+                                              jobs=4, max_size=1)
+        unpacked_dscs = unpacker.unpack(self.dscs)
+        dsc, unpacked = unpacked_dscs.next()
+        self.assertEqual(dsc.version, 1)
+        unpacked_dscs.close()
+        self.assertFalse(os.path.exists(unpacked))
+        self.assertEqual(sorted(os.listdir(str(self.dir))),
+                         [os.path.basename(dsc.tgz) for dsc in self.dscs[:5]])
+
+    def tearDown(self):
+        testutils.DebianGitTestRepo.tearDown(self)
+        context.teardown()
+
+
+class TestResume(testutils.DebianGitTestRepo):
+    """Test skipping imported versions and resuming imports"""
+
+    def setUp(self):
+        testutils.DebianGitTestRepo.setUp(self)
+        self.add_file('foo', 'bar', 'foo')
+        self.dscs = [DscStub('file%d.dsc' % version, '1.%d-1' % version)
+                     for version in range(1, 5)]
+
+    def test_not_imported(self):
+        """Versions are found by new and legacy tags"""
+        self.dscs += [DscStub('file5.dsc', '1:1.5-1'),
+                      DscStub('file6.dsc', '1.6~1-1')]
+        self.repo.create_tag('debian/1.1-1', msg='Debian release 1.1-1')
+        self.repo.create_tag('debian/1.2-1', msg='Debian release 1.2-1')
+        # Legacy tags need to mention the version
+        self.repo.create_tag('debian/1.5-1', msg='Debian release 1:1.5-1')
+        self.repo.create_tag('debian/1.6.1-1', msg='Debian release 1.6.1-1')
+        versions = [dsc.version for dsc in self.dscs]
+        found = self.repo.find_versions('debian/%(version)s', versions)
+        self.assertEqual(found, {'1.1-1': self.repo.head,
+                                 '1.2-1': self.repo.head,
+                                 '1:1.5-1': self.repo.head})
+        for version in versions:
+            self.assertEqual(found.get(version),
+                             self.repo.find_version('debian/%(version)s',
+                                                    version))
+
+        options = import_dscs.parse_import_dsc_args([])
+        pending = import_dscs.not_imported(self.repo, self.dscs, options)
+        self.assertEqual([dsc.version for dsc in pending],
+                         ['1.3-1', '1.4-1', '1.6~1-1'])
+
+    def test_checkpoint(self):
+        """Progress is stored and loaded"""
+        checkpoint = import_dscs.ImportCheckpoint(self.repo.git_dir)
+        self.assertFalse(checkpoint.load())
+        checkpoint.start(self.dscs)
+        checkpoint.done(self.dscs[0])
+        checkpoint.done(self.dscs[1])
+
+        loaded = import_dscs.ImportCheckpoint(self.repo.git_dir)
+        self.assertTrue(loaded.load())
+        self.assertEqual(loaded.dscfiles, [dsc.dscfile for dsc in self.dscs])
+        self.assertEqual(loaded.imported, set(['file1.dsc', 'file2.dsc']))
+        loaded.remove()
+        self.assertFalse(import_dscs.ImportCheckpoint(
+                            self.repo.git_dir).load())
+
+
+class TestFastImportFailure(testutils.DebianGitTestRepo):
+    """Test failing fast imports"""
+
+    def setUp(self):
+        testutils.DebianGitTestRepo.setUp(self)
+        self.add_file('foo', 'bar', 'foo')
+        context.chdir(self.repo.path)
+        self.orig_err = gbp.log.err
+        self.errors = []
+        gbp.log.err = self.errors.append
+
+    def test_finish_fails(self):
+        """Failing to finish a partial import doesn't hide the original error"""
+        importer = import_dscs.GitFastImportDscs([])
+
+        def fail_import(src, unpack_dir):
+            raise GbpError("Import failed")
+
+        def fail_finish(pristine_tars, was_empty):
+            importer._fastimport.close()
+            raise GitRepositoryError("revision 'HEAD' not found")
+
+        importer._import = fail_import
+        importer._finish = fail_finish
+        with self.assertRaisesRegexp(GbpError, "Import failed"):
+            importer.importdscs([(DscStub('file1.dsc', '1.1-1'), '.')])
+        self.assertEqual(self.errors,
+                         ["Failed to finish the partial import: "
+                          "revision 'HEAD' not found"])
+
+    def tearDown(self):
+        gbp.log.err = self.orig_err
+        testutils.DebianGitTestRepo.tearDown(self)
+        context.teardown()
+
+
+class TestFastImportBackend(testutils.DebianGitTestRepo):
+    """Test that both backends import packages the same way"""
+
+    changelog = """foo (%(version)s) unstable; urgency=low
+
+  * Release %(version)s
+
+ -- Foo Bar <foo@example.com>  Mon, 0%(num)d Jan 2018 00:00:00 +0000
+
+"""
+    control = """Source: foo
+Section: misc
+Priority: optional
+Maintainer: Foo Bar <foo@example.com>
+
+Package: foo
+Architecture: all
+Description: test package
+ test package
+"""
+
+    def setUp(self):
+        testutils.DebianGitTestRepo.setUp(self)
+        # Use the real import backend and package parser
+        import_dscs.GitImportDsc = GitImportDsc
+        import_dscs.DscFile = DscFile
+        self.orig_env = os.environ.copy()
+        os.environ.update({'GIT_AUTHOR_DATE': '1500000000 +0000',
+                           'GIT_COMMITTER_DATE': '1500000000 +0000'})
+        self.dscs = []
+        for num, (upstream, version) in enumerate([('1.0', '1.0-1'),
+                                                   ('1.0', '1.0-2'),
+                                                   ('1.1', '1.1-1')]):
+            self.dscs.append(self._build(num + 1, upstream, version))
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.orig_env)
+        import_dscs.GitImportDsc = StubGitImportDsc
+        import_dscs.DscFile = DscStub
+        testutils.DebianGitTestRepo.tearDown(self)
+
+    def _write(self, path, content, mode=None):
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fobj:
+            fobj.write(content)
+        if mode is not None:
+            os.chmod(path, mode)
+
+    def _build(self, num, upstream, version):
+        """Build a source package with dpkg-source"""
+        pkgdir = self.tmpdir.join('pkgs', version, 'foo-%s' % upstream)
+        self._write(os.path.join(pkgdir, 'README'), 'foo %s\n' % upstream)
+        self._write(os.path.join(pkgdir, 'bin', 'run'), '#!/bin/sh\n', 0o755)
+        self._write(os.path.join(pkgdir, 'sub', 'dir', 'file'), upstream)
+        os.symlink('sub/dir', os.path.join(pkgdir, 'link'))
+        if upstream == '1.1':
+            # Makes the fast-import backend fall back to git add
+            self._write(os.path.join(pkgdir, '.gitattributes'), '* -text\n')
+        orig = os.path.join(os.path.dirname(pkgdir),
+                            'foo_%s.orig.tar.gz' % upstream)
+        tar = tarfile.open(orig, 'w:gz')
+        tar.add(pkgdir, 'foo-%s' % upstream)
+        tar.close()
+
+        debian = os.path.join(pkgdir, 'debian')
+        changelog = ''.join([self.changelog % dict(version=v, num=n)
+                             for n, v in [(num, version)] +
+                             [(n, v.version) for n, v in
+                              reversed(list(enumerate(self.dscs, 1)))]])
+        self._write(os.path.join(debian, 'changelog'), changelog)
+        self._write(os.path.join(debian, 'control'), self.control)
+        self._write(os.path.join(debian, 'source', 'format'),
+                    '3.0 (quilt)\n')
+        self._write(os.path.join(debian, 'rules'), '#!/usr/bin/make -f\n',
+                    0o755)
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(['dpkg-source', '-b',
+                                   os.path.basename(pkgdir)],
+                                  cwd=os.path.dirname(pkgdir),
+                                  stdout=devnull, stderr=devnull)
+        dscfile = os.path.join(os.path.dirname(pkgdir),
+                               'foo_%s.dsc' % version)
+        return DscFile.parse(dscfile)
+
+    def _import(self, name, args):
+        topdir = self.tmpdir.join(name)
+        os.mkdir(topdir)
+        context.chdir(topdir)
+        self.assertEqual(import_dscs.main(['arg0'] + args +
+                                          [dsc.dscfile for dsc in self.dscs]),
+                         0)
+        return DebianGitRepository(os.path.join(topdir, 'foo'))
+
+    def test_same_history(self):
+        """Both backends create the same commits, trees and tags"""
+        repo = self._import('per-package', [])
+        fast = self._import('fast-import', ['--fast-import'])
+        tags = repo.get_tags()
+        self.assertEqual(sorted(tags),
+                         ['debian/1.0-1', 'debian/1.0-2', 'debian/1.1-1',
+                          'upstream/1.0', 'upstream/1.1'])
+        self.assertEqual(sorted(fast.get_tags()), sorted(tags))
+        for ref in tags + ['master', 'upstream']:
+            for rev in [ref, '%s^{commit}' % ref, '%s^{tree}' % ref]:
+                self.assertEqual(fast.rev_parse(rev), repo.rev_parse(rev),
+                                 rev)
+        self.assertEqual(fast.branch, repo.branch)
+        self.assertTrue(fast.is_clean()[0])
+
+# vim:et:ts=4:sw=4:et:sts=4:ai:set list listchars=tab\:»·,trail\:·:
@@ -15,6 +15,8 @@
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """Test L{gbp} command wrapper"""
 
+import ast
+import os
 import sys
 # Try unittest2 for CentOS
 try:
@@ -57,3 +59,15 @@ class TestSuperCommand(unittest.TestCase):
         self.assertEqual(gbp.scripts.supercommand.supercommand(
                          ['argv0']), 1)
 
+    def test_command_registry(self):
+        """The registered commands must match the command modules"""
+        path = os.path.dirname(gbp.scripts.supercommand.__file__)
+        available = gbp.scripts.supercommand.get_available_commands(path)
+        self.assertEqual(sorted(gbp.scripts.supercommand.commands),
+                         sorted(cmd for cmd, dummy in available))
+        for cmd, filename in available:
+            with open(filename) as module:
+                doc = ast.get_docstring(ast.parse(module.read()),
+                                        clean=False)
+            self.assertEqual(gbp.scripts.supercommand.commands[cmd], doc)
+
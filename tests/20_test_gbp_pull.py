@@ -0,0 +1,140 @@
+# vim: set fileencoding=utf-8 :
+"""Test pulling several repositories with L{gbp.scripts.pull}"""
+
+from . import context
+
+import os
+
+import gbp.log
+import gbp.scripts.pull as pull
+import tests.testutils as testutils
+from gbp.deb.git import DebianGitRepository
+
+
+class TestPullRepos(testutils.DebianGitTestRepo):
+    """Test updating several repositories at once"""
+
+    def setUp(self):
+        testutils.DebianGitTestRepo.setUp(self)
+        self._commit(self.repo, 'initial')
+        self.repo.create_branch('upstream')
+        url = 'file://%s' % self.repo.path
+        self.repos = {}
+        for name in ['ok', 'diverged']:
+            clone = DebianGitRepository.clone(self.tmpdir.join(name), url,
+                                              auto_name=False)
+            clone.create_branch('upstream', 'origin/upstream')
+            self.repos[name] = clone
+        self.broken = self.tmpdir.join('broken')
+        os.mkdir(self.broken)
+
+        self._commit(self.repo, 'new upstream', 'upstream')
+        self._commit(self.repos['diverged'], 'local change', 'upstream')
+
+        self.logged = []
+        self.orig_info, self.orig_warn = gbp.log.info, gbp.log.warn
+        gbp.log.info = gbp.log.warn = self.logged.append
+
+    def tearDown(self):
+        gbp.log.info, gbp.log.warn = self.orig_info, self.orig_warn
+        testutils.DebianGitTestRepo.tearDown(self)
+
+    @staticmethod
+    def _commit(repo, msg, branch=None):
+        if branch:
+            repo.set_branch(branch)
+        repo._git_command('commit', ['--allow-empty', '-q', '-m', msg])
+        if branch:
+            repo.set_branch('master')
+
+    def _path(self, name):
+        return self.tmpdir.join(name)
+
+    def test_find_repos(self):
+        """Globs are expanded and repositories are listed once"""
+        repos = pull.find_repos([self.tmpdir.join('*'),
+                                 self._path('ok') + '/',
+                                 self._path('missing')])
+        self.assertEqual(repos, [self._path(name) for name in
+                                 ['broken', 'diverged', 'ok', 'test_repo',
+                                  'missing']])
+
+    def test_pull_repo(self):
+        """A single repository is updated by running gbp pull in it"""
+        path, ret, output, dummy = pull.pull_repo(self._path('ok'), [])
+        self.assertEqual((path, ret), (self._path('ok'), 0), output)
+        self.assertEqual(self.repos['ok'].rev_parse('upstream'),
+                         self.repo.rev_parse('upstream'))
+
+        path, ret, output, dummy = pull.pull_repo(self._path('diverged'), [])
+        self.assertEqual(ret, 2, output)
+        self.assertIn("Skipping non-fast forward of 'upstream'", output)
+        self.assertNotEqual(self.repos['diverged'].rev_parse('upstream'),
+                            self.repo.rev_parse('upstream'))
+
+        path, ret, output, dummy = pull.pull_repo(self.broken, [])
+        self.assertEqual(ret, 1, output)
+        self.assertIn("is not a git repository", output)
+
+    def test_pull_repos(self):
+        """Failures are summarized and determine the exit code"""
+        repos = [self._path('ok'), self._path('diverged'), self.broken]
+        self.assertEqual(pull.pull_repos(repos, [], 2), 1)
+        summary = [msg for msg in self.logged if msg.startswith('Pulled ')]
+        self.assertEqual(len(summary), 1)
+        self.assertRegexpMatches(summary[0],
+                                 r"^Pulled 3 repositories in [0-9.]+s: "
+                                 r"1 ok, 1 failed, 1 not fast forwarded$")
+        self.assertIn("Failed: %s" % self.broken, self.logged)
+        self.assertIn("Not fast forwarded: %s" % self._path('diverged'),
+                      self.logged)
+        self.assertIn("%s:   gbp:error: %s is not a git repository" %
+                      (self.broken, self.broken), self.logged)
+
+    def test_pull_repos_exit_codes(self):
+        """Non fast forwards only matter without failures"""
+        ok, diverged = self._path('ok'), self._path('diverged')
+        self.assertEqual(pull.pull_repos([diverged, ok], [], 1), 2)
+        self.assertEqual(pull.pull_repos([ok], [], 4), 0)
+        # Output of successful pulls is only shown when verbose
+        self.assertFalse([msg for msg in self.logged
+                          if msg.startswith('%s:   ' % ok)])
+        pull.pull_repos([ok], [], 1, verbose=True)
+        self.assertTrue([msg for msg in self.logged
+                         if msg.startswith('%s:   ' % ok)])
+
+    def test_main(self):
+        """Several repositories on the command line are pulled separately"""
+        ret = pull.main(['gbp-pull', '--jobs=2', self._path('ok'),
+                         self.tmpdir.join('d*')])
+        self.assertEqual(ret, 2)
+        self.assertEqual(self.repos['ok'].rev_parse('upstream'),
+                         self.repo.rev_parse('upstream'))
+
+    def test_all(self):
+        """--all updates the branches tracking their namesakes"""
+        self.repo.create_branch('feature')
+        clone = self.repos['ok']
+        clone.fetch()
+        clone.create_branch('feature', 'origin/feature')
+        clone.create_branch('other', 'origin/feature')
+        self._commit(self.repo, 'new feature', 'feature')
+        context.chdir(clone.path)
+        self.assertEqual(pull.main(['gbp-pull', '--all']), 0)
+        self.assertEqual(clone.rev_parse('feature'),
+                         self.repo.rev_parse('feature'))
+        self.assertNotEqual(clone.rev_parse('other'),
+                            self.repo.rev_parse('feature'))
+
+    def test_commit_graph(self):
+        """A missing commit-graph is written whatever the number of commits"""
+        context.chdir(self._path('ok'))
+        self.assertFalse(self.repos['ok'].has_commit_graph())
+        self.assertEqual(pull.main(['gbp-pull', '--no-commit-graph']), 0)
+        self.assertFalse(self.repos['ok'].has_commit_graph())
+
+        self._commit(self.repo, 'newer upstream', 'upstream')
+        self.assertEqual(pull.main(['gbp-pull']), 0)
+        self.assertTrue(self.repos['ok'].has_commit_graph())
+
+# vim:et:ts=4:sw=4:et:sts=4:ai:set list listchars=tab\:»·,trail\:·:
@@ -0,0 +1,130 @@
+#!/usr/bin/python
+# vim: set fileencoding=utf-8 :
+"""
+Benchmark the history walks of gbp commands with and without a
+commit-graph with changed-path Bloom filters, like gbp import-dscs,
+import-srpm and pull write it.
+
+A repository with a linear history of COMMITS commits is created with git
+fast-import. Every commit changes one of 200 source files,
+debian/changelog is only touched by the first one and the latest upstream
+tag is half way through the history.
+
+Usage: python tests/benchmarks/commit_graph.py [COMMITS]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+topdir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      os.path.pardir, os.path.pardir)
+sys.path.insert(0, topdir)
+
+from gbp.deb.changelog import ChangeLog
+from gbp.deb.git import DebianGitRepository
+from gbp.git import FastImport
+from gbp.git.modifier import GitModifier
+from gbp.scripts.dch import guess_documented_commit
+try:
+    from gbp.scripts.pq_rpm import is_ancestor
+except ImportError:
+    # No rpm python module
+    is_ancestor = None
+
+RUNS = 5
+FILES = 200
+
+changelog = """foo (1.0-%d) unstable; urgency=low
+
+  * Benchmark
+
+ -- Foo Bar <foo@example.com>  Mon, 01 Jan 2018 00:00:00 +0000
+"""
+
+
+def create_repo(path, commits):
+    """Create the repository to run the queries on"""
+    repo = DebianGitRepository.create(path)
+    fastimport = FastImport(repo)
+    commit = None
+    for i in range(commits):
+        who = GitModifier('Foo Bar', 'foo@example.com',
+                          '%d +0000' % (1500000000 + i * 60))
+        files = [('src/file%d' % (i % FILES),
+                  fastimport.add_blob('Version %d\n' % i))]
+        if i == 0:
+            files.append(('debian/changelog',
+                          fastimport.add_blob(changelog % 1)))
+        commit = fastimport.start_commit('master', who, 'Commit %d\n' % i,
+                                         parents=[commit] if commit else [])
+        for path, blob in files:
+            fastimport.add_file_ref(path, blob)
+        if i in (0, commits / 2):
+            fastimport.add_tag('upstream/%d' % (i + 1), commit, who,
+                               'Upstream version %d\n' % (i + 1))
+        if i == 0:
+            fastimport.add_tag('debian/1.0-1', commit, who,
+                               'Debian release 1.0-1\n')
+    if fastimport.close():
+        raise Exception("git fast-import failed")
+    repo.force_head('master', hard=True)
+    return repo
+
+
+def best_time(func):
+    """Best time of several runs"""
+    times = []
+    for dummy in range(RUNS):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def queries(repo):
+    """The history walks of the gbp commands"""
+    cp = ChangeLog(changelog % 2)
+    first = repo.rev_parse('debian/1.0-1^0')
+    walks = [
+        ('dch get_commits', lambda: repo.get_commits(since='debian/1.0-1',
+                                                     until='HEAD',
+                                                     paths=['src/file0'])),
+        ('guess_documented_commit',
+         lambda: guess_documented_commit(cp, repo, 'debian/%(version)s')),
+        ('git describe',
+         lambda: repo.debian_version_from_upstream('upstream/%(version)s')),
+    ]
+    if is_ancestor:
+        walks.append(('is_ancestor', lambda: is_ancestor(repo, first, 'HEAD')))
+    return walks
+
+
+def main(argv):
+    commits = int(argv[1]) if len(argv) > 1 else 20000
+    tmpdir = tempfile.mkdtemp(prefix='gbp-commit-graph-')
+    try:
+        start = time.time()
+        repo = create_repo(os.path.join(tmpdir, 'repo'), commits)
+        print "Created %d commits in %.1fs" % (commits, time.time() - start)
+
+        repo._git_command('config', ['core.commitGraph', 'false'])
+        without = [(name, best_time(func)) for name, func in queries(repo)]
+        repo._git_command('config', ['core.commitGraph', 'true'])
+        start = time.time()
+        repo.write_commit_graph()
+        print "Wrote commit-graph in %.1fs" % (time.time() - start)
+        with_graph = [best_time(func) for dummy, func in queries(repo)]
+
+        print "%-24s %10s %10s" % ('query', 'without', 'with graph')
+        for (name, before), after in zip(without, with_graph):
+            print "%-24s %9.3fs %9.3fs  (%.1fx)" % (name, before, after,
+                                                   before / after)
+    finally:
+        shutil.rmtree(tmpdir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# vim: set fileencoding=utf-8 :
+"""
+Benchmark creating a tree object out of a synthetic source tree with lots of
+files, with the concurrent tree builder and with git add
+
+Usage: python tests/benchmarks/create_tree.py [NUM_FILES] [JOBS]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.path.pardir, os.path.pardir))
+
+from gbp.git import GitRepository
+from gbp.git.treebuilder import TreeBuilder
+
+
+def synthetic_tree(path, num_files):
+    """Create a source tree with the given number of files"""
+    for num in range(num_files):
+        subdir = os.path.join(path, 'dir%03d' % (num % 300),
+                              'sub%02d' % (num % 17))
+        if not os.path.isdir(subdir):
+            os.makedirs(subdir)
+        with open(os.path.join(subdir, 'file%d.c' % num), 'w') as source:
+            source.write(('/* file %d */\nint f%d(void) { return %d; }\n' %
+                          (num, num, num)) * (num % 50 + 1))
+
+
+def git_add_tree(repo, path):
+    """Create the tree the way it's done without the tree builder"""
+    index = os.path.join(repo.git_dir, 'gbp_index')
+    if os.path.exists(index):
+        os.unlink(index)
+    repo.add_files('.', force=True, index_file=index, work_tree=path)
+    return repo.write_tree(index)
+
+
+def main(argv):
+    num_files = int(argv[1]) if len(argv) > 1 else 100000
+    jobs = int(argv[2]) if len(argv) > 2 else 4
+    tmpdir = tempfile.mkdtemp(prefix='gbp-bench_')
+    try:
+        tree_dir = os.path.join(tmpdir, 'tree')
+        synthetic_tree(tree_dir, num_files)
+        results = []
+        for name, create in [('git add', git_add_tree),
+                             ('tree builder',
+                              lambda repo, path:
+                                TreeBuilder(repo, jobs).build(path))]:
+            # Use a fresh repository so no object is written already
+            repo = GitRepository.create(os.path.join(tmpdir,
+                                                     name.replace(' ', '_')))
+            start = time.time()
+            tree = create(repo, tree_dir)
+            print "%-14s %8.2fs  %s" % (name, time.time() - start, tree)
+            results.append(tree)
+        if len(set(results)) != 1:
+            print "Trees differ!"
+            return 1
+    finally:
+        shutil.rmtree(tmpdir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
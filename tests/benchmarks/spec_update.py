@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# vim: set fileencoding=utf-8 :
+"""
+Benchmark updating the patches of a synthetic spec file with lots of patches
+
+Usage: python tests/benchmarks/spec_update.py [NUM_PATCHES]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.path.pardir, os.path.pardir))
+
+from gbp.rpm import SpecFile
+
+
+def synthetic_spec(num_patches):
+    """Create spec file content with the given number of patches"""
+    lines = ['Name:       bench',
+             'Summary:    Synthetic package for benchmarking',
+             'Version:    1.0',
+             'Release:    0',
+             'License:    GPLv2',
+             'Source0:    %{name}-%{version}.tar.gz']
+    lines += ['Patch%d:    %04d-change-number-%d.patch' % (num, num, num)
+              for num in range(num_patches)]
+    lines += ['', '%description', 'Synthetic package.', '',
+              '%prep', '%setup -q']
+    for num in range(num_patches):
+        lines.append('# %04d-change-number-%d.patch' % (num, num))
+        if num % 10 == 0:
+            lines += ['%%ifarch %%ix86', '%%patch%d -p1' % num, '%endif']
+        else:
+            lines.append('%%patch%d -p1' % num)
+    lines += ['', '%build', 'make', '', '%install', 'make install', '',
+              '%files', '/usr/bin/bench', '', '%changelog',
+              '* Wed Feb 05 2014 Name <email> 1.0', '- Initial version']
+    return '\n'.join(lines) + '\n'
+
+
+def timed(name, func, *args):
+    """Run a function and print the time it took"""
+    start = time.time()
+    ret = func(*args)
+    print "%-24s %8.3fs" % (name, time.time() - start)
+    return ret
+
+
+def main(argv):
+    num_patches = int(argv[1]) if len(argv) > 1 else 5000
+    tmpdir = tempfile.mkdtemp(prefix='gbp_bench_')
+    try:
+        specpath = os.path.join(tmpdir, 'bench.spec')
+        with open(specpath, 'w') as spec_file:
+            spec_file.write(synthetic_spec(num_patches))
+        print "Spec file with %d patches" % num_patches
+
+        spec = timed('parse', SpecFile, specpath)
+        patches = ['%04d-rebased-%d.patch' % (num, num)
+                   for num in range(num_patches)]
+        commands = dict((patch, {'ifarch': '%arm'}) for patch in patches[::7])
+        timed('update_patches', spec.update_patches, patches, commands)
+        timed('update_patches (again)', spec.update_patches, patches[::-1], {})
+        timed('set_changelog', spec.set_changelog,
+              '* Thu Feb 06 2014 Name <email> 1.0\n- Rebase\n')
+        timed('write_spec_file', spec.write_spec_file)
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
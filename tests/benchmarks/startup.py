@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# vim: set fileencoding=utf-8 :
+"""
+Benchmark the startup time of gbp commands and check it against a time
+budget per command. The budget is the time on top of starting a bare
+interpreter. With --imports the modules a command imports are listed with
+the time importing them took, like python3's -X importtime does.
+
+Run it with byte compiled modules (i.e. without PYTHONDONTWRITEBYTECODE)
+or compiling the sources dominates the numbers.
+
+Usage: python tests/benchmarks/startup.py [--imports] [COMMAND...]
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+topdir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      os.path.pardir, os.path.pardir)
+
+RUNS = 10
+
+# Allowed startup overhead in seconds
+budgets = {
+    '--list-cmds':  0.05,
+    'config':       0.10,
+    'clone':        0.12,
+    'pull':         0.12,
+    'pq':           0.15,
+    'dch':          0.15,
+    'import-orig':  0.15,
+    'buildpackage': 0.15,
+}
+
+# Run in the child to time the imports of a command
+import_timer = """
+import sys, time, __builtin__
+sys.path.insert(0, %(topdir)r)
+real_import = __builtin__.__import__
+times = []
+level = [0]
+
+def timed_import(name, *args, **kwargs):
+    known = name in sys.modules
+    start = time.time()
+    level[0] += 1
+    try:
+        return real_import(name, *args, **kwargs)
+    finally:
+        level[0] -= 1
+        if not known and name in sys.modules:
+            times.append((time.time() - start, level[0], name))
+
+__builtin__.__import__ = timed_import
+import gbp.scripts.supercommand as supercommand
+supercommand.import_command(%(cmd)r)
+__builtin__.__import__ = real_import
+for cumulative, depth, name in times:
+    sys.stdout.write('%%10.2fms %%s%%s\\n' %% (cumulative * 1000,
+                                            '  ' * depth, name))
+"""
+
+
+def run(args):
+    """Run the interpreter and return the time it took"""
+    env = dict(os.environ, PYTHONPATH=topdir)
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        subprocess.call([sys.executable] + args, stdout=devnull,
+                        stderr=devnull, env=env)
+        return time.time() - start
+
+
+def startup_time(args):
+    """Best time of several runs"""
+    return min(run(args) for dummy in range(RUNS))
+
+
+def command_args(cmd):
+    """How to invoke a command without doing any real work"""
+    args = ['-m', 'gbp.scripts.supercommand', cmd]
+    return args if cmd.startswith('-') else args + ['--help']
+
+
+def main(argv):
+    imports = '--imports' in argv
+    cmds = [arg for arg in argv[1:] if arg != '--imports'] or sorted(budgets)
+    if imports:
+        for cmd in cmds:
+            print "Imports of %s:" % cmd
+            sys.stdout.flush()
+            subprocess.call([sys.executable, '-c',
+                             import_timer % dict(topdir=topdir, cmd=cmd)])
+        return 0
+
+    bare = startup_time(['-c', 'pass'])
+    print "%-14s %8.3fs" % ('interpreter', bare)
+    ret = 0
+    for cmd in cmds:
+        overhead = startup_time(command_args(cmd)) - bare
+        budget = budgets.get(cmd)
+        over = budget is not None and overhead > budget
+        print "%-14s %8.3fs  (budget %s)%s" % (cmd, overhead,
+                                              '%.3fs' % budget if budget
+                                              else 'none',
+                                              '  OVER BUDGET' if over else '')
+        if over:
+            ret = 1
+    return ret
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -16,11 +16,12 @@
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """Tests for the gbp pq-rpm tool"""
 
+import gzip
 import os
 import tempfile
 from nose.tools import assert_raises, eq_, ok_ # pylint: disable=E0611
 
-from gbp.scripts.pq_rpm import main as pq
+from gbp.scripts.pq_rpm import main as pq, PatchCompressor
 from gbp.git import GitRepository
 from gbp.command_wrappers import GitCommand
 
@@ -428,12 +429,46 @@ class TestPqRpm(RpmRepoTestBase):
         repo.rename_branch('pq/master', 'development/master')
         branches = repo.get_local_branches()
 
+        # Export uncompressed patches to compare with
+        eq_(mock_pq(['export']), 0)
+        patches = ['0001-my-gz.patch', '0002-my-bzip2.patch', '0003-my2.patch']
+        uncompressed = {}
+        for patch in patches:
+            with open(patch) as fobj:
+                uncompressed[patch] = fobj.read()
+
         # Export, all generated patches should be compressed
         eq_(mock_pq(['export', '--patch-export-compress=1']), 0)
         files = ['.gbp.conf', '.gitignore', 'bar.tar.gz', 'foo.txt',
                  'gbp-test.spec', '0001-my-gz.patch.gz',
                  '0002-my-bzip2.patch.gz', '0003-my2.patch.gz', 'my.patch']
         self._check_repo_state(repo, 'master', branches, files)
+        for patch in patches:
+            compressed = gzip.open(patch + '.gz')
+            eq_(compressed.read(), uncompressed[patch])
+            compressed.close()
+
+    def test_patch_compressor(self):
+        """Test compressing patches above the size limit"""
+        writer = PatchCompressor(compress_size=10, threads=2)
+        content = {'small.patch': 'x' * 10,
+                   'large.patch': 'y' * 11,
+                   'larger.patch': 'z' * 1000}
+        for filename in sorted(content):
+            writer(filename, content[filename])
+        eq_(writer.finish(['small.patch', 'large.patch', 'larger.patch']),
+            ['small.patch', 'large.patch.gz', 'larger.patch.gz'])
+        eq_(sorted(os.listdir('.')),
+            ['large.patch.gz', 'larger.patch.gz', 'small.patch'])
+        with open('small.patch') as fobj:
+            eq_(fobj.read(), content['small.patch'])
+        for filename in ['large.patch', 'larger.patch']:
+            # gzip -n stores no name or timestamp
+            with open(filename + '.gz') as fobj:
+                eq_(fobj.read(8)[3:], '\0' * 5)
+            compressed = gzip.open(filename + '.gz')
+            eq_(compressed.read(), content[filename])
+            compressed.close()
 
     def test_option_patch_export_squash(self):
         """Test the --patch-export-squash-until cmdline option"""
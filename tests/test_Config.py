@@ -83,3 +83,41 @@ def test_filter():
     >>> del os.environ['GBP_CONF_FILES']
     """
 
+
+def test_per_tree_config():
+    """
+    Per-tree config files are read from the working copy or a treeish and
+    unchanged config files aren't parsed again
+
+    Methods tested:
+         - L{gbp.config.GbpOptionParser.parse_config_files}
+
+    >>> import os, gbp.git
+    >>> from gbp.config import GbpOptionParser
+    >>> tmpdir = context.new_tmpdir('bar')
+    >>> repo = gbp.git.GitRepository.create(tmpdir.join('repo'))
+    >>> os.mkdir(os.path.join(repo.path, 'debian'))
+    >>> confname = os.path.join(repo.path, 'debian', 'gbp.conf')
+    >>> with open(confname, 'w') as f: f.write('[bar]\\nfilter = one\\n')
+    >>> repo.add_files('debian')
+    >>> repo.commit_all('conf')
+    >>> with open(confname, 'w') as f: f.write('[bar]\\nfilter = three\\n')
+    >>> os.environ['GBP_CONF_FILES'] = '%(top_dir)s/debian/gbp.conf'
+    >>> context.chdir(repo.path)
+    >>> GbpOptionParser('bar').config['filter']
+    ['three']
+    >>> GbpOptionParser('bar', git_treeish='HEAD', repo=repo).config['filter']
+    ['one']
+    >>> parsed = len(GbpOptionParser._parsed_configs)
+    >>> GbpOptionParser('bar', git_treeish='HEAD').config['filter']
+    ['one']
+    >>> len(GbpOptionParser._parsed_configs) == parsed
+    True
+    >>> repo.commit_all('conf')
+    >>> GbpOptionParser('bar', git_treeish='HEAD').config['filter']
+    ['three']
+    >>> GbpOptionParser('bar', git_treeish='HEAD~1').config['filter']
+    ['one']
+    >>> del os.environ['GBP_CONF_FILES']
+    >>> context.teardown()
+    """
@@ -0,0 +1,80 @@
+# vim: set fileencoding=utf-8 :
+
+"""
+Test L{gbp.git.commitdates.CommitDateIndex}
+"""
+
+from . import context
+
+import gbp.log
+
+gbp.log.setup(color=False, verbose=True)
+
+
+def test_commit_before():
+    """
+    Look up commits by date
+
+    Methods tested:
+         - L{gbp.git.commitdates.CommitDateIndex.commit_before}
+         - L{gbp.git.commitdates.CommitDateIndex.update}
+         - L{gbp.git.GitRepository.get_commits_dates}
+
+    >>> import os, gbp.git
+    >>> from gbp.git.commitdates import CommitDateIndex
+    >>> repo_dir = context.new_tmpdir(__name__)
+    >>> repo = gbp.git.GitRepository.create(str(repo_dir))
+    >>> def commit(date):
+    ...     os.environ['GIT_COMMITTER_DATE'] = '%d +0000' % date
+    ...     repo._git_command('commit', ['--allow-empty', '-q', '-m', 'foo'])
+    ...     del os.environ['GIT_COMMITTER_DATE']
+    ...     return repo.head
+    >>> first, second = commit(1400001000), commit(1400002000)
+    >>> dates = repo.get_commits_dates(None, 'HEAD')
+    >>> dates == [(second, 1400002000), (first, 1400001000)]
+    True
+    >>> index = CommitDateIndex(repo)
+    >>> index.commit_before(1400000500)
+    >>> index.commit_before(1400001500) == first
+    True
+    >>> index.commit_before(1400002000) == second
+    True
+
+    The index is stored and updated incrementally
+    >>> third = commit(1400003000)
+    >>> index = CommitDateIndex(repo)
+    >>> index.commit_before(1400003500) == third
+    True
+    >>> index._commits == repo.get_commits_dates(None, 'HEAD')
+    True
+
+    Rewritten history
+    >>> repo.force_head(first, hard=True)
+    >>> fourth = commit(1400004000)
+    >>> index.commit_before(1400004000) == fourth
+    True
+    >>> index._commits == repo.get_commits_dates(None, 'HEAD')
+    True
+
+    Merges interleave the merged commits with the indexed ones
+    >>> repo.create_branch('side', first)
+    >>> repo.set_branch('side')
+    >>> side = commit(1400005000)
+    >>> repo.set_branch('master')
+    >>> fifth = commit(1400006000)
+    >>> index.commit_before(1400006500) == fifth
+    True
+    >>> os.environ['GIT_COMMITTER_DATE'] = '1400007000 +0000'
+    >>> repo._git_command('merge', ['-q', '--no-edit', 'side'])
+    >>> del os.environ['GIT_COMMITTER_DATE']
+    >>> index = CommitDateIndex(repo)
+    >>> index.commit_before(1400006500) == fifth
+    True
+    >>> index._commits == repo.get_commits_dates(None, 'HEAD')
+    True
+
+    No commits yet
+    >>> empty = gbp.git.GitRepository.create(str(repo_dir.join('empty')))
+    >>> CommitDateIndex(empty).commit_before(1400000000)
+    >>> context.teardown()
+    """
@@ -0,0 +1,105 @@
+# vim: set fileencoding=utf-8 :
+
+"""
+Test L{gbp.git.mirrorcache.MirrorCache}
+"""
+
+from . import context
+
+import gbp.log
+
+gbp.log.setup(color=False, verbose=True)
+
+
+def test_mirror_cache():
+    """
+    Clone by borrowing objects from a mirror and prune mirrors
+
+    Methods tested:
+         - L{gbp.git.mirrorcache.MirrorCache.borrow}
+         - L{gbp.git.mirrorcache.MirrorCache.add_borrower}
+         - L{gbp.git.mirrorcache.MirrorCache.mirrors}
+         - L{gbp.git.mirrorcache.MirrorCache.prune}
+         - L{gbp.git.GitRepository.clone}
+
+    >>> import os, gbp.git
+    >>> from gbp.git.mirrorcache import MirrorCache
+    >>> tmpdir = context.new_tmpdir(__name__)
+    >>> remote = gbp.git.GitRepository.create(tmpdir.join('remote'))
+    >>> remote._git_command('commit', ['--allow-empty', '-q', '-m', 'foo'])
+    >>> url = 'file://%s' % remote.path
+    >>> cache = MirrorCache(tmpdir.join('cache'))
+    >>> with cache.borrow(url) as mirror:
+    ...     clone = gbp.git.GitRepository.clone(tmpdir.join('clone'), url,
+    ...                                         auto_name=False,
+    ...                                         reference=mirror)
+    ...     cache.add_borrower(mirror, clone.path)
+    >>> mirror == cache.mirror_path(url)
+    True
+    >>> open(os.path.join(clone.git_dir, 'objects/info/alternates')).read().strip() == os.path.join(mirror, 'objects')
+    True
+
+    New commits are fetched into the mirror
+    >>> remote._git_command('commit', ['--allow-empty', '-q', '-m', 'bar'])
+    >>> with cache.borrow(url) as updated:
+    ...     updated == mirror
+    True
+    >>> gbp.git.GitRepository(mirror).rev_parse('master') == remote.head
+    True
+
+    Objects of branches removed upstream stay available to the clones
+    >>> remote.create_branch('feature')
+    >>> remote.set_branch('feature')
+    >>> remote._git_command('commit', ['--allow-empty', '-q', '-m', 'baz'])
+    >>> remote.set_branch('master')
+    >>> with cache.borrow(url) as updated:
+    ...     clone.fetch()
+    >>> feature = clone.rev_parse('origin/feature')
+    >>> remote.delete_branch('feature')
+    >>> with cache.borrow(url) as updated:
+    ...     pass
+    >>> mirror_repo = gbp.git.GitRepository(mirror)
+    >>> mirror_repo.has_branch('feature')
+    False
+    >>> for root, dirs, files in os.walk(os.path.join(mirror, 'objects')):
+    ...     for name in files:
+    ...         os.utime(os.path.join(root, name), (1e8, 1e8))
+    >>> mirror_repo._git_command('gc', ['-q'])
+    >>> clone._git_command('fsck', ['--no-dangling'])
+    >>> clone.rev_parse('%s^{commit}' % feature) == feature
+    True
+
+    Mirrors still in use are kept, dissociated clones don't use them
+    >>> other = gbp.git.GitRepository.create(tmpdir.join('other'), bare=True)
+    >>> other_url = 'file://%s' % other.path
+    >>> with cache.borrow(other_url) as other_mirror:
+    ...     pass
+    >>> os.utime(os.path.join(mirror, cache.stamp), (0, 0))
+    >>> [path for used, path in cache.mirrors()] == [mirror, other_mirror]
+    True
+    >>> cache.prune(keep=1)
+    []
+    >>> clone = gbp.git.GitRepository.clone(tmpdir.join('clone2'), url,
+    ...                                     auto_name=False, reference=mirror,
+    ...                                     dissociate=True)
+    >>> os.path.exists(os.path.join(clone.git_dir, 'objects/info/alternates'))
+    False
+
+    Once the clones are gone the mirror is removed along with its lock file
+    >>> import shutil
+    >>> shutil.rmtree(tmpdir.join('clone'))
+    >>> cache.prune(keep=1) == [mirror]
+    True
+    >>> os.path.exists(mirror), os.path.exists(mirror + '.lock')
+    (False, False)
+    >>> [path for used, path in cache.mirrors()] == [other_mirror]
+    True
+
+    Mirrors that can't be updated aren't used
+    >>> with cache.borrow('file://%s' % tmpdir.join('missing')) as missing:
+    ...     missing is None
+    True
+    >>> context.teardown()
+    """
+
+# vim:et:ts=4:sw=4:et:sts=4:ai:set list listchars=tab\:»·,trail\:·:
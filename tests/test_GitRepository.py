@@ -129,6 +129,53 @@ def test_clean():
     True
     """
 
+def test_is_clean():
+    """
+    Check the different kinds of uncommitted changes
+
+    Methods tested:
+         - L{gbp.git.GitRepository.is_clean}
+
+    >>> import gbp.git, os
+    >>> repo = gbp.git.GitRepository(repo_dir)
+    >>> testfile = os.path.join(repo.path, 'testfile')
+    >>> os.utime(testfile, None)
+    >>> repo.is_clean()
+    (True, '')
+    >>> content = open(testfile).read()
+    >>> open(testfile, 'a').write('more')
+    >>> clean, out = repo.is_clean(ignore_untracked=True)
+    >>> clean, 'modified:   testfile' in out
+    (False, True)
+    >>> repo.add_files(testfile)
+    >>> repo.is_clean()[0]
+    False
+    >>> open(testfile, 'w').write(content)
+    >>> repo.is_clean()[0]
+    False
+    >>> repo.add_files(testfile)
+    >>> repo.is_clean()[0]
+    True
+    >>> open(os.path.join(repo.path, 'untracked'), 'w').write('')
+    >>> clean, out = repo.is_clean()
+    >>> clean, 'untracked' in out
+    (False, True)
+    >>> repo.is_clean(ignore_untracked=True)[0]
+    True
+    >>> repo._git_command('config', ['status.showUntrackedFiles', 'no'])
+    >>> repo.is_clean()[0]
+    True
+    >>> repo._git_command('config', ['--unset', 'status.showUntrackedFiles'])
+    >>> repo._git_command('config', ['core.untrackedCache', 'true'])
+    >>> repo.is_clean()[0]
+    False
+    >>> repo._git_command('config', ['--unset', 'core.untrackedCache'])
+    >>> open(os.path.join(repo.git_dir, 'info', 'exclude'), 'a').write('untracked\\n')
+    >>> repo.is_clean()
+    (True, '')
+    >>> os.unlink(os.path.join(repo.path, 'untracked'))
+    """
+
 def test_create_branch():
     """
     Create a branch name I{foo}
@@ -265,6 +312,48 @@ def test_tag():
     ['tag', 'tag2']
     """
 
+def test_tag_index():
+    """
+    Look up tags in memory
+
+    Methods tested:
+         - L{gbp.git.GitRepository.get_tag_index}
+         - L{gbp.git.GitRepository.get_tag_commit}
+
+    >>> import gbp.git
+    >>> repo = gbp.git.GitRepository(repo_dir)
+    >>> index = repo.get_tag_index()
+    >>> sorted(index.keys())
+    ['tag', 'tag2']
+    >>> index['tag'][0] == index['tag'][1] == repo.head
+    True
+    >>> index['tag2'][0] == repo.rev_parse('tag2'), index['tag2'][1:]  == (repo.head, 'foo\\n')
+    (True, True)
+    >>> repo.get_tag_index() is index
+    True
+    >>> repo.get_tag_commit('tag2') == repo.head
+    True
+    >>> repo.get_tag_commit('unknown')
+    >>> repo.create_tag('tree', commit='HEAD^{tree}')
+    >>> repo.get_tag_index()['tree'][1:]
+    (None, '')
+    >>> repo.get_tag_commit('tree') # doctest:+ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    GitRepositoryError: ...
+    >>> repo.delete_tag('tree')
+    >>> 'tree' in repo.get_tag_index()
+    False
+
+    Tags created behind our back are picked up as well
+    >>> repo._git_command('tag', ['-m', 'bar', 'dir/tag3'])
+    >>> repo.get_tag_commit('dir/tag3') == repo.head
+    True
+    >>> repo._git_command('tag', ['-d', 'dir/tag3'])
+    >>> sorted(repo.get_tag_index().keys())
+    ['tag', 'tag2']
+    """
+
 def test_describe():
     """
     Describe commit-ish
@@ -480,6 +569,55 @@ def test_get_commit_info():
     'foo'
     """
 
+def test_get_commits_info():
+    """
+    Test inspecting several commits at once
+
+    Methods tested:
+         - L{gbp.git.GitRepository.get_commits_parents}
+         - L{gbp.git.GitRepository.get_commits_info}
+         - L{gbp.git.GitRepository.batch_check_objects}
+
+    >>> import gbp.git
+    >>> repo = gbp.git.GitRepository(repo_dir)
+    >>> head, parent = [sha1 for sha1, dummy in
+    ...                 repo.batch_check_objects(['HEAD', 'HEAD~1'])]
+    >>> repo.batch_check_objects(['HEAD^{tree}', 'doesnotexist'])[1]
+    >>> repo.get_commits_parents('HEAD~1', 'HEAD') == [(head, [parent])]
+    True
+    >>> infos = repo.get_commits_info([parent, head])
+    >>> [info['id'] for info in infos] == [parent, head]
+    True
+    >>> info = repo.get_commit_info('HEAD')
+    >>> keys = ['subject', 'body', 'patchname', 'files']
+    >>> [infos[1][key] for key in keys] == [info[key] for key in keys]
+    True
+    >>> infos[1]['author'].date == info['author'].date
+    True
+    """
+
+def test_batch_read_objects():
+    """
+    Test reading several objects at once
+
+    Methods tested:
+         - L{gbp.git.GitRepository.batch_read_objects}
+         - L{gbp.git.GitRepository.batch_list_trees}
+
+    >>> import gbp.git
+    >>> repo = gbp.git.GitRepository(repo_dir)
+    >>> objs = repo.batch_read_objects(['HEAD:testfile', 'HEAD:doesnotexist'])
+    >>> objs[0][1:] == ('blob', repo.show('HEAD:testfile'))
+    True
+    >>> objs[1]
+    >>> trees = repo.batch_list_trees(['HEAD', 'HEAD~1', 'doesnotexist'])
+    >>> trees[0] == repo.list_tree('HEAD')
+    True
+    >>> trees[1] == repo.list_tree('HEAD~1')
+    True
+    >>> trees[2]
+    """
+
 def test_diff():
     """
     Test git-diff
@@ -499,6 +637,21 @@ def test_diff():
     True
     """
 
+def test_diff_commits():
+    """
+    Methods tested:
+        - L{gbp.git.GitRepository.diff_commits}
+
+    >>> import gbp.git
+    >>> repo = gbp.git.GitRepository(repo_dir)
+    >>> head = repo.rev_parse('HEAD')
+    >>> diffs = repo.diff_commits([head], stat=80, summary=True, text=True)
+    >>> diffs[head] == repo.diff('HEAD^!', stat=80, summary=True, text=True)
+    True
+    >>> repo.diff_commits([head], paths=['filenotexist']) == {head: ''}
+    True
+    """
+
 def test_diff_status():
     """
     Methods tested:
@@ -774,6 +927,24 @@ def test_gc():
     >>> repo.collect_garbage()
     """
 
+def test_commit_graph():
+    """
+    Test writing the commit-graph
+
+    Methods tested:
+         - L{gbp.git.GitRepository.write_commit_graph}
+         - L{gbp.git.GitRepository.has_commit_graph}
+
+    >>> import gbp.git
+    >>> repo = gbp.git.GitRepository(repo_dir)
+    >>> repo.write_commit_graph()
+    >>> repo.has_commit_graph()
+    True
+    >>> repo.write_commit_graph(changed_paths=False, split=False)
+    >>> repo.has_commit_graph()
+    True
+    """
+
 def test_grep_log():
     """
     Test grepping through commit messages
@@ -796,6 +967,43 @@ def test_grep_log():
     GitRepositoryError: Error grepping log for foo: fatal: bad revision 'doesnotexist'
     """
 
+def test_tracking_info():
+    """
+    Get tracking branches and update several refs at once
+
+    Methods tested:
+         - L{gbp.git.GitRepository.get_tracking_info}
+         - L{gbp.git.GitRepository.update_refs}
+
+    >>> import gbp.git, os
+    >>> clone = gbp.git.GitRepository(os.path.join(clone_dir, 'repo'))
+    >>> tracking = clone.get_tracking_info()
+    >>> sorted(tracking.keys())
+    ['foo', 'master']
+    >>> info = tracking['foo']
+    >>> info['upstream'], info['ahead'], info['behind']
+    ('origin/foo', 0, 0)
+    >>> info['commit'] == info['upstream_commit'] == clone.rev_parse('foo')
+    True
+    >>> old = clone.rev_parse('foo')
+    >>> new = clone.rev_parse('foo^')
+    >>> clone.update_refs([('refs/heads/foo', new, old),
+    ...                    ('refs/heads/bar', new, None)], msg='gbp: test')
+    >>> clone.rev_parse('bar') == clone.rev_parse('foo') == new
+    True
+    >>> info = clone.get_tracking_info()['foo']
+    >>> info['ahead'], info['behind'], info['upstream_commit'] == old
+    (0, 1, True)
+    >>> clone.update_refs([('refs/heads/foo', old, old),
+    ...                    ('refs/heads/bar', old, None)]) # doctest:+ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    GitRepositoryError: Failed to update refs: ...
+    >>> clone.rev_parse('bar') == new
+    True
+    >>> clone.update_refs([('refs/heads/foo', old, new)])
+    """
+
 def test_is_ff():
     """
     Test if branch is fast forwardable
@@ -939,6 +1147,24 @@ def test_cmd_has_feature():
     True
     """
 
+def test_get_identity():
+    """
+    Methods tested:
+        - L{gbp.git.GitRepository.get_identity}
+
+    >>> import gbp.git, os
+    >>> repo = gbp.git.GitRepository(repo_dir)
+    >>> os.environ['GIT_COMMITTER_DATE'] = '1400000000 +0200'
+    >>> committer = repo.get_identity('committer')
+    >>> del os.environ['GIT_COMMITTER_DATE']
+    >>> committer.date
+    '1400000000 +0200'
+    >>> committer.email == os.getenv('GIT_COMMITTER_EMAIL', committer.email)
+    True
+    >>> repo.get_identity('author').name == repo.get_author_info().name
+    True
+    """
+
 def test_teardown():
     """
     Perform the teardown
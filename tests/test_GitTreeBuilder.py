@@ -0,0 +1,133 @@
+# vim: set fileencoding=utf-8 :
+"""Test L{gbp.git.treebuilder.TreeBuilder}"""
+
+from . import context
+
+import os
+import shutil
+# Try unittest2 for CentOS
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import gbp.git
+from gbp.git.treebuilder import TreeBuilder
+
+
+class TestTreeBuilder(unittest.TestCase):
+    """Compare the trees built with the ones git builds"""
+
+    def setUp(self):
+        self.tmpdir = context.new_tmpdir(__name__)
+        self.repo = gbp.git.GitRepository.create(self.tmpdir.join('repo'))
+
+    def tearDown(self):
+        context.teardown()
+
+    def _write(self, name, content='', mode=None):
+        path = os.path.join(self.repo.path, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fobj:
+            fobj.write(content)
+        if mode is not None:
+            os.chmod(path, mode)
+
+    def _git_tree(self):
+        """The tree git writes after adding everything to an empty index"""
+        index = os.path.join(self.repo.git_dir, 'gbp_index')
+        self.repo._git_command('add', ['-f', '.'],
+                               extra_env={'GIT_INDEX_FILE': index})
+        tree = self.repo.write_tree(index)
+        os.unlink(index)
+        return tree
+
+    def _check_tree(self, jobs=4):
+        tree = TreeBuilder(self.repo, jobs).build(self.repo.path)
+        self.assertEqual(tree, self._git_tree())
+        self.assertEqual(self.repo.rev_parse('%s^{tree}' % tree), tree)
+
+    def test_empty(self):
+        """An empty directory is an empty tree"""
+        self._check_tree()
+
+    def test_files(self):
+        """Regular and executable files in nested directories"""
+        self._write('README', 'foo\n')
+        self._write('bin/run', '#!/bin/sh\n', 0o755)
+        self._write('bin/run-not', '#!/bin/sh\n', 0o644)
+        self._write('src/a/b/c.c', 'int c;\n')
+        self._write('src/a.c', 'int a;\n')
+        # Trees sort as if their name had a trailing slash
+        self._write('src/a-b', 'sorts before a/\n')
+        self._write('src/a0', 'sorts after a/\n')
+        self._check_tree()
+
+    def test_symlinks(self):
+        """Symlinks to files, directories and nowhere"""
+        self._write('dir/file', 'foo\n')
+        os.symlink('dir/file', os.path.join(self.repo.path, 'file-link'))
+        os.symlink('dir', os.path.join(self.repo.path, 'dir-link'))
+        os.symlink('../missing', os.path.join(self.repo.path, 'dir',
+                                              'dangling'))
+        self._check_tree()
+
+    def test_empty_dirs(self):
+        """Empty directories are left out like git does"""
+        self._write('file', 'foo\n')
+        os.makedirs(os.path.join(self.repo.path, 'empty', 'nested'))
+        os.makedirs(os.path.join(self.repo.path, 'dir', 'empty'))
+        self._write('dir/file', 'bar\n')
+        self._check_tree()
+
+    def test_special_names(self):
+        """Names with tabs and spaces"""
+        self._write('with\ttab', 'foo\n')
+        self._write('dir with space/file\twith tab', 'bar\n')
+        self._check_tree()
+
+    def test_many_files(self):
+        """Files hashed by several git processes"""
+        for num in range(25):
+            self._write('dir%d/file%d' % (num % 3, num), '%d\n' % num)
+        orig_chunk = TreeBuilder.min_chunk
+        TreeBuilder.min_chunk = 4
+        try:
+            self._check_tree(jobs=2)
+        finally:
+            TreeBuilder.min_chunk = orig_chunk
+
+    def test_fallbacks(self):
+        """Git needs to add files if it would treat them specially"""
+        builder = TreeBuilder(self.repo)
+        self._write('file', 'foo\n')
+        self.assertTrue(builder.build(self.repo.path))
+        self.assertTrue(TreeBuilder.has_plain_config(self.repo))
+
+        for name in ['.gitattributes', 'dir/.gitattributes',
+                     'nested/.git/HEAD', 'nested/.GIT', 'new\nline']:
+            self._write(name)
+            self.assertIsNone(builder.build(self.repo.path), name)
+            path = os.path.join(self.repo.path, name.split('/')[0])
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.unlink(path)
+            self.assertTrue(builder.build(self.repo.path), name)
+
+        for name, value in [('core.autocrlf', 'true'),
+                            ('core.autocrlf', 'input'),
+                            ('core.filemode', 'false'),
+                            ('core.symlinks', 'false')]:
+            self.repo._git_command('config', [name, value])
+            self.assertFalse(TreeBuilder.has_plain_config(self.repo), name)
+            self.repo._git_command('config', ['--unset', name])
+            self.assertTrue(TreeBuilder.has_plain_config(self.repo), name)
+
+        attributes = os.path.join(self.repo.git_dir, 'info', 'attributes')
+        with open(attributes, 'w') as fobj:
+            fobj.write('* text\n')
+        self.assertFalse(TreeBuilder.has_plain_config(self.repo))
+
+# vim:et:ts=4:sw=4:et:sts=4:ai:set list listchars=tab\:»·,trail\:·:
@@ -95,6 +95,7 @@ def test_pristine_has_commit():
     Methods tested:
          - L{gbp.deb.pristinetar.DebianPristineTar.has_commit}
          - L{gbp.pkg.pristinetar.PristineTar.get_commit}
+         - L{gbp.pkg.pristinetar.PristineTar.get_archive_name}
 
     >>> import gbp.deb.git
     >>> repo = gbp.deb.git.DebianGitRepository(repo_dir)
@@ -108,6 +109,9 @@ def test_pristine_has_commit():
     >>> commit = repo.pristine_tar.get_commit('upstream_1.0.orig.tar.gz')
     >>> branch == commit
     True
+    >>> repo.pristine_tar.get_archive_name('upstream_1\.0\.orig\.tar\.\w\+')
+    'upstream_1.0.orig.tar.gz'
+    >>> repo.pristine_tar.get_archive_name('upstream_2\.0')
     """
 
 def test_pristine_tar_checkout():
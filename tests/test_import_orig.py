@@ -26,10 +26,13 @@ try:
     import unittest2 as unittest
 except ImportError:
     import unittest
+import zipfile
 
 from gbp.errors import GbpError
+from gbp.git import GitRepository
 from gbp.pkg import UpstreamSource
-from gbp.scripts.common.import_orig import prepare_sources
+from gbp.scripts.common.import_orig import (prepare_sources, import_archive,
+                                            import_sources, ImportStages)
 from gbp.scripts.import_orig import find_source
 from tests.testutils import ls_dir, ls_tar
 
@@ -192,3 +195,105 @@ class TestPrepareSources(TestImportOrigBase):
         self.assertEqual(orig_ref, ls_dir(orig))
         self.assertEqual(prist_ref, ls_tar(prist))
 
+
+
+class TestImportArchive(TestImportOrigBase):
+    """Test the import_archive() function"""
+
+    @classmethod
+    def setup_class(cls):
+        """Class set-up, run only once"""
+        super(TestImportArchive, cls).setup_class()
+        cls._origs = TestPrepareSources._create_test_sources(cls._tmpdir)
+        src_dir = os.path.join(context.projectdir, 'gbp')
+        cls._origs['zip'] = os.path.join(cls._tmpdir, 'test-1.0.zip')
+        zipobj = zipfile.ZipFile(cls._origs['zip'], 'w')
+        for fname in glob.glob('%s/*.py' % src_dir):
+            zipobj.write(fname, 'test-1.0/' + os.path.relpath(fname, src_dir))
+        zipobj.close()
+        cls.repo = GitRepository.create(os.path.join(cls._tmpdir, 'repo'))
+
+    def _import(self, orig, filters):
+        """Import with and without unpacking, return the trees"""
+        source = UpstreamSource(orig)
+        commit = import_archive(self.repo, source, filters, 'stream',
+                                'stream', create_missing_branch=True)
+        tmpdir = tempfile.mkdtemp(dir=self._tmpdir)
+        unpacked = prepare_sources(source, 'test', '1.0', None, filters,
+                                   False, None, tmpdir)[0]
+        self.assertEqual(self.repo.get_commit_info(commit)['subject'],
+                         'stream')
+        return (self.repo.rev_parse('%s^{tree}' % commit),
+                self.repo.create_tree(unpacked))
+
+    def test_tar(self):
+        """Import a tarball without unpacking it"""
+        streamed, unpacked = self._import(self._origs['tar'], ['pkg', '*.pyc'])
+        self.assertEqual(streamed, unpacked)
+        self.assertEqual(self.repo.list_tree(streamed, paths=['pkg']), [])
+
+    def test_zip(self):
+        """Import a zip archive without unpacking it"""
+        streamed, unpacked = self._import(self._origs['zip'], None)
+        self.assertEqual(streamed, unpacked)
+
+    def test_fallback(self):
+        """Archives git would add specially need to be unpacked"""
+        archive_fn = os.path.join(self._tmpdir, 'attrs-1.0.tar')
+        tarobj = tarfile.open(archive_fn, mode='w')
+        info = tarfile.TarInfo('attrs-1.0/.gitattributes')
+        tarobj.addfile(info)
+        tarobj.close()
+        self.assertEqual(import_archive(self.repo, UpstreamSource(archive_fn),
+                                        None, 'stream', 'attrs',
+                                        create_missing_branch=True), None)
+        self.assertFalse(self.repo.has_branch('attrs'))
+
+
+class TestImportSources(TestImportOrigBase):
+    """Test the import_sources() function"""
+
+    @classmethod
+    def setup_class(cls):
+        """Class set-up, run only once"""
+        super(TestImportSources, cls).setup_class()
+        cls._origs = TestPrepareSources._create_test_sources(cls._tmpdir)
+        cls.repo = GitRepository.create(os.path.join(cls._tmpdir, 'repo'))
+
+    def _import(self, source, branch):
+        """Import with filters, repack for pristine-tar in the background"""
+        tmpdir = tempfile.mkdtemp(dir=self._tmpdir)
+        stages = ImportStages()
+        try:
+            commit, prist = import_sources(self.repo, source, stages, 'test',
+                                           '1.0', 'test.tgz', ['pkg'], False,
+                                           'newp', tmpdir, 'import', branch,
+                                           create_missing_branch=True)
+        finally:
+            stages.finish()
+        return commit, prist, [name for name, _time in stages.timings]
+
+    def test_tar(self):
+        """Repack for pristine-tar while importing a tarball"""
+        source = UpstreamSource(self._origs['tar'])
+        commit, prist, stages = self._import(source, 'tar')
+        self.assertEqual(sorted(stages), ['import', 'repack'])
+        self.assertEqual(source.unpacked, None)
+        src_ls = ls_tar(self._origs['tar'])
+        prist_ref = set([fname.replace('test-1.0', 'newp') for fname in src_ls])
+        self.assertEqual(prist_ref, ls_tar(prist))
+        self.assertEqual(self.repo.list_tree(commit, paths=['pkg']), [])
+
+    def test_fallback(self):
+        """Repack for pristine-tar while unpacking and committing"""
+        archive_fn = os.path.join(self._tmpdir, 'attrs-1.0.tar')
+        tarobj = tarfile.open(archive_fn, mode='w')
+        info = tarfile.TarInfo('attrs-1.0/.gitattributes')
+        tarobj.addfile(info)
+        tarobj.close()
+        commit, prist, stages = self._import(UpstreamSource(archive_fn),
+                                             'attrs')
+        self.assertEqual(sorted(stages), ['commit', 'import', 'repack',
+                                          'unpack'])
+        self.assertEqual(ls_tar(prist), set(['newp', 'newp/.gitattributes']))
+        self.assertEqual(self.repo.rev_parse('attrs'), commit)
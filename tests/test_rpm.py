@@ -24,7 +24,8 @@ from nose.tools import assert_raises, eq_
 
 from gbp.errors import GbpError
 from gbp.rpm import (SrcRpmFile, SpecFile, parse_srpm, NoSpecError, guess_spec,
-                     guess_spec_repo, spec_from_repo)
+                     guess_spec_repo, locate_spec_repo, spec_from_repo)
+from gbp.rpm.speccache import SpecCache
 from gbp.git.repository import GitRepository
 
 DATA_DIR = os.path.abspath(os.path.splitext(__file__)[0] + '_data')
@@ -305,6 +306,53 @@ class TestSpecFile(object):
         spec.set_changelog(new_text)
         eq_(spec.get_changelog(), new_text)
 
+    def test_spec_cache(self):
+        """Test parsing a spec file through the parse cache"""
+        spec_filepath = os.path.join(SPEC_DIR, 'gbp-test2.spec')
+        reference = SpecFileTester(spec_filepath)
+        SpecFile.cache = SpecCache(os.path.join(self.tmpdir, 'cache'))
+        try:
+            # The first parse populates the cache, the second one uses it
+            for dummy in range(2):
+                spec = SpecFileTester(spec_filepath)
+                eq_(spec.version, reference.version)
+                eq_(spec.packager, reference.packager)
+                eq_(spec.orig_src, reference.orig_src)
+                eq_(spec.sources(), reference.sources())
+                eq_(sorted(spec.protected('_tags').keys()),
+                    sorted(reference.protected('_tags').keys()))
+                eq_([str(patch) for patch in spec.patchseries()],
+                    [str(patch) for patch in reference.patchseries()])
+            eq_(len(os.listdir(os.path.join(self.tmpdir, 'cache'))), 1)
+
+            # Line references must point to the new spec's content
+            spec.update_patches(['new.patch'], {})
+            spec.specdir = self.tmpdir
+            spec.write_spec_file()
+            reference.update_patches(['new.patch'], {})
+            reference.specdir = os.path.join(self.tmpdir, 'ref')
+            os.mkdir(reference.specdir)
+            reference.write_spec_file()
+            assert filecmp.cmp(spec.specpath, reference.specpath)
+        finally:
+            SpecFile.cache = None
+
+    def test_spec_cache_prune(self):
+        """Test that the least recently used cache entries are removed"""
+        cache = SpecCache(os.path.join(self.tmpdir, 'cache'), max_entries=3)
+        keys = [cache.key('spec %d' % num) for num in range(5)]
+        for num, key in enumerate(keys[:3]):
+            cache.put(key, num)
+            os.utime(cache._entry_path(key), (num, num))
+        # Reading an entry makes it the most recently used one
+        eq_(cache.get(keys[0]), 0)
+        cache.put(keys[3], 3)
+        eq_([cache.get(key) for key in keys[:4]], [0, None, 2, 3])
+        os.utime(cache._entry_path(keys[3]), (0, 0))
+        cache.put(keys[4], 4)
+        eq_([cache.get(key) for key in keys], [0, None, 2, None, 4])
+        eq_(len(cache._entries()), 3)
+
     def test_quirks(self):
         """Test spec that is broken/has anomalities"""
         spec_filepath = os.path.join(SPEC_DIR, 'gbp-test-quirks.spec')
@@ -476,4 +524,45 @@ class TestUtilityFunctions(object):
         spec = spec_from_repo(repo, 'HEAD', 'packaging/gbp-test.spec')
         assert spec.specfile == 'gbp-test.spec'
 
+    def test_locate_spec_repo(self):
+        """Test the locate_spec_repo() function"""
+        repo = GitRepository.create(self.tmpdir)
+        os.makedirs(os.path.join(repo.path, 'packaging', 'tests'))
+        for path in ('packaging/gbp-test.spec',
+                     'packaging/tests/gbp-test2.spec',
+                     'packaging/tests/gbp-test-tags.spec'):
+            shutil.copy(os.path.join(SPEC_DIR, os.path.basename(path)),
+                        os.path.join(repo.path, path))
+        repo.add_files('packaging')
+        repo.commit_all('Add spec files')
+
+        # The shallowest level with spec files wins
+        path, blob = locate_spec_repo(repo, 'HEAD')
+        eq_(path, 'packaging/gbp-test.spec')
+        eq_(blob, repo.rev_parse('HEAD:packaging/gbp-test.spec'))
+        path, blob = locate_spec_repo(repo, 'HEAD', recursive=False,
+                                      topdir='packaging')
+        eq_(path, 'packaging/gbp-test.spec')
+        path, blob = locate_spec_repo(repo, 'HEAD',
+                                      preferred_name='gbp-test2.spec')
+        eq_(path, 'packaging/gbp-test.spec')
+        # Multiple spec files on the same level
+        assert_raises(NoSpecError, locate_spec_repo, repo, 'HEAD',
+                      'packaging/tests')
+        path, blob = locate_spec_repo(repo, 'HEAD', 'packaging/tests',
+                                      preferred_name='gbp-test2.spec')
+        eq_(path, 'packaging/tests/gbp-test2.spec')
+        # Deeper levels are searched if the shallowest one is ambiguous
+        shutil.copy(os.path.join(SPEC_DIR, 'gbp-test2.spec'),
+                    os.path.join(repo.path, 'packaging'))
+        repo.add_files('packaging')
+        repo.commit_all('Add another spec file')
+        assert_raises(NoSpecError, locate_spec_repo, repo, 'HEAD')
+        path, blob = locate_spec_repo(repo, 'HEAD',
+                                      preferred_name='gbp-test-tags.spec')
+        eq_(path, 'packaging/tests/gbp-test-tags.spec')
+        eq_(blob, repo.rev_parse('HEAD:packaging/tests/gbp-test-tags.spec'))
+        # Non-existent directory
+        assert_raises(NoSpecError, locate_spec_repo, repo, 'HEAD', 'foo')
+
 # vim:et:ts=4:sw=4:et:sts=4:ai:set list listchars=tab\:»·,trail\:·:
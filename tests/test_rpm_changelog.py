@@ -173,6 +173,31 @@ class TestChangelogParser(object):
         # Check that re-creating section doesn't mangle it
         eq_(str(section), changelog.sections[0])
 
+    def test_parse_changelog_lazy(self):
+        """Test that sections are split out only when accessed"""
+        changelog = self.parser.raw_parse_string(self.cl_default_style)
+        assert changelog.sections
+        eq_(changelog.sections._sections, [])
+        section = self.parser.parse_section(changelog.sections[0])
+        eq_(len(changelog.sections._sections), 1)
+        section.set_header(time=datetime(2014, 1, 30), name="Jane",
+                           email="u@h", revision="0.4")
+        changelog.sections[0] = section
+        changelog.add_section(time=datetime(2014, 1, 31), name="Jane",
+                              email="u@h", revision="0.5")
+        eq_(len(changelog.sections._sections), 2)
+        eq_(str(changelog).splitlines()[:5],
+            ["* Fri Jan 31 2014 Jane <u@h> 0.5", "",
+             "* Thu Jan 30 2014 Jane <u@h> 0.4", "- Version bump",
+             "- Drop foo.patch"])
+        # The rest of the changelog is kept intact
+        tail = self.cl_default_style.split('\n\n', 1)[1]
+        assert str(changelog).endswith(tail)
+        eq_(len(changelog.sections), 4)
+        # Missing newline at the end of changelog is added
+        eq_(str(self.parser.raw_parse_string(self.cl_default_style[:-1])),
+            self.cl_default_style)
+
     def test_parse_authors(self):
         """Test parsing of authors from changelog entries"""
         section = self.parser.parse_section(self.cl_with_authors)
@@ -0,0 +1,104 @@
+# vim: set fileencoding=utf-8 :
+
+"""
+Test L{gbp.server}
+"""
+
+from . import context
+
+import gbp.log
+
+gbp.log.setup(color=False, verbose=False)
+
+
+def test_warm_up():
+    """
+    Repositories are only looked up again once they changed
+
+    Methods tested:
+         - L{gbp.server.Server.warm_up}
+         - L{gbp.git.GitRepository.remember_detected}
+         - L{gbp.git.GitRepository.forget_detected}
+
+    >>> import os, gbp.git, gbp.server
+    >>> tmpdir = context.new_tmpdir(__name__)
+    >>> repo = gbp.git.GitRepository.create(tmpdir.join('repo'))
+    >>> repo._git_command('commit', ['--allow-empty', '-q', '-m', 'foo'])
+    >>> server = gbp.server.Server(tmpdir.join('socket'))
+    >>> server.warm_up(repo.path)
+    >>> gbp.git.GitRepository(repo.path).git_dir == repo.git_dir
+    True
+    >>> server.warm_up(tmpdir.join('nonexistent'))
+    >>> tmpdir.join('nonexistent') in gbp.git.GitRepository._detected
+    False
+
+    The repository isn't looked up again while it's unchanged
+    >>> gbp.git.GitRepository._detected[repo.path] = (False, '/nonexistent', repo.path)
+    >>> server.warm_up(repo.path)
+    >>> gbp.git.GitRepository(repo.path).git_dir
+    '/nonexistent'
+    >>> os.utime(os.path.join(repo.git_dir, 'HEAD'), (0, 0))
+    >>> server.warm_up(repo.path)
+    >>> gbp.git.GitRepository(repo.path).git_dir == repo.git_dir
+    True
+    >>> gbp.git.GitRepository.forget_detected()
+    >>> gbp.git.GitRepository._detected
+    {}
+    >>> context.teardown()
+    """
+
+
+def test_run_client():
+    """
+    Run commands in the server
+
+    Methods tested:
+         - L{gbp.server.Server.serve}
+         - L{gbp.server.run_client}
+         - L{gbp.server.stop_server}
+
+    >>> import os, subprocess, sys, time, StringIO, gbp.git, gbp.server
+    >>> tmpdir = context.new_tmpdir(__name__)
+    >>> path = tmpdir.join('socket')
+    >>> gbp.server.run_client(['gbp', 'config'], path) is None
+    True
+    >>> env = dict(os.environ, PYTHONPATH=context.projectdir)
+    >>> server = subprocess.Popen([sys.executable, '-m',
+    ...                            'gbp.scripts.supercommand', 'serve',
+    ...                            '--socket=%s' % path], env=env,
+    ...                           stdout=open(os.devnull, 'w'),
+    ...                           stderr=subprocess.STDOUT)
+    >>> while not os.path.exists(path) and server.poll() is None:
+    ...     time.sleep(0.1)
+    >>> repo = gbp.git.GitRepository.create(tmpdir.join('repo'))
+    >>> context.chdir(repo.path)
+    >>> stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+    >>> ret = gbp.server.run_client(['gbp', 'config', 'buildpackage.debian-branch'], path)
+    >>> output, sys.stdout = sys.stdout.getvalue(), stdout
+    >>> ret, output
+    (0, 'buildpackage.debian-branch=master\\n')
+    >>> stderr, sys.stderr = sys.stderr, StringIO.StringIO()
+    >>> ret = gbp.server.run_client(['gbp', 'config'], path)
+    >>> output, sys.stderr = sys.stderr.getvalue(), stderr
+    >>> ret, output
+    (2, 'gbp:error: Can only take a command or command.optionname, check --help\\n')
+
+
+    Input that isn't from a terminal is left to the caller
+    >>> script = ('import sys, gbp.server; '
+    ...           'gbp.server.run_client(["gbp", "config", "buildpackage.debian-branch"], %r); '
+    ...           'sys.stdout.write(sys.stdin.read())' % path)
+    >>> client = subprocess.Popen([sys.executable, '-c', script], env=env,
+    ...                           stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    >>> client.communicate('l1\\nl2\\n')[0]
+    'buildpackage.debian-branch=master\\nl1\\nl2\\n'
+    >>> gbp.server.stop_server(path)
+    True
+    >>> server.wait()
+    0
+    >>> os.path.exists(path)
+    False
+    >>> context.teardown()
+    """
+
+# vim:et:ts=4:sw=4:et:sts=4:ai:set list listchars=tab\:»·,trail\:·: